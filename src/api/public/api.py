@@ -1,21 +1,240 @@
-from fastapi import FastAPI, Depends, HTTPException
+import math
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.security import APIKeyHeader
-
-app = FastAPI(
-    title="Client API",
-    docs_url="/docs",  # Always show Swagger UI
-    redoc_url="/redoc",
+from sqlalchemy import select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from api.public.http_cache import conditional_get, request_time
+from api.public.response_cache import cached_json
+from jobs.xmltv import iter_xmltv
+from models.epg import EPGChannelModel, EPGProgramModel
+from schemas.epg import (
+    EpgChannelSchema,
+    EpgNowNextSchema,
+    EpgProgramSchema,
+    channel_schema,
+    program_schema,
 )
+from utils.api_keys import ApiKey, api_keys, api_rate_limited
+from utils.constants import MAX_QUERY_WINDOW_DAYS
+from utils.db import get_async_db
+from utils.guide_index import get_guide_index
+from utils.timestamps import to_utc
 
 API_KEY_HEADER = APIKeyHeader(name="X-API-Key")
 
 
-def get_api_key(key: str = Depends(API_KEY_HEADER)):
-    if key != "your_secret_api_key":  # Replace with actual validation logic
+async def get_api_key(key: str = Depends(API_KEY_HEADER)) -> ApiKey:
+    """Check the key (from memory on all but the first request) and take one request from its quota."""
+    api_key = await api_keys.verify(key)
+    if api_key is None:
         raise HTTPException(status_code=403, detail="Invalid API key")
-    return key
+    retry_after = api_key.bucket.try_acquire()
+    if retry_after:
+        api_rate_limited.inc()
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    api_keys.record_use(api_key)
+    return api_key
+
+
+router = APIRouter(dependencies=[Depends(get_api_key)], tags=["EPG"])
+
+
+def resolve_time(request: Request, value: Optional[datetime]) -> datetime:
+    """Convert a query datetime to UTC; "now" is the request's minute, the one it is cached under.
+
+    Naive query datetimes are read as guide-local (Europe/Lisbon) time.
+    """
+    if value is None:
+        return request_time(request)
+    return to_utc(value)
+
+
+async def query_channels(db: AsyncSession) -> List[EpgChannelSchema]:
+    index = get_guide_index()
+    if index is not None:
+        return index.channels()
+
+    channels = await db.scalars(
+        select(EPGChannelModel).order_by(EPGChannelModel.position, EPGChannelModel.id)
+    )
+    return [channel_schema(channel) for channel in channels]
+
+
+async def query_channel_programs(
+    db: AsyncSession, meo_id: str, start: datetime, end: datetime
+) -> List[EpgProgramSchema]:
+    index = get_guide_index()
+    programs = index.window(meo_id, start, end) if index is not None else None
+    if programs is not None:
+        return programs
+
+    channel_id = await db.scalar(
+        select(EPGChannelModel.id).where(EPGChannelModel.meo_id == meo_id)
+    )
+    if channel_id is None:
+        raise HTTPException(status_code=404, detail="Channel not found")
+
+    # Served by ix_programs_channel_end: range scan on end, filter on start
+    programs = await db.scalars(
+        select(EPGProgramModel)
+        .where(
+            EPGProgramModel.channel_id == channel_id,
+            EPGProgramModel.end_date_time > start,
+            EPGProgramModel.start_date_time < end,
+            EPGProgramModel.removed_at.is_(None),
+        )
+        .order_by(EPGProgramModel.start_date_time)
+    )
+    return [program_schema(program) for program in programs]
+
+
+async def query_now_next(db: AsyncSession, at: datetime) -> List[dict]:
+    index = get_guide_index()
+    results = index.now_next(at) if index is not None else None
+    if results is not None:
+        return results
+
+    # One index probe per channel on ix_programs_channel_end (LATERAL ... LIMIT 2)
+    upcoming = (
+        select(EPGProgramModel)
+        .where(
+            EPGProgramModel.channel_id == EPGChannelModel.id,
+            EPGProgramModel.end_date_time > at,
+            EPGProgramModel.removed_at.is_(None),
+        )
+        .order_by(EPGProgramModel.end_date_time)
+        .limit(2)
+        .lateral()
+    )
+    program = aliased(EPGProgramModel, upcoming)
+    rows = await db.execute(
+        select(EPGChannelModel, program)
+        .outerjoin(program, true())
+        .order_by(EPGChannelModel.position, EPGChannelModel.id, program.end_date_time)
+    )
+
+    results = {}
+    for channel, upcoming_program in rows:
+        entry = results.setdefault(
+            channel.id, {"channel": channel_schema(channel), "now": None, "next": None}
+        )
+        if upcoming_program is None:
+            continue
+        if entry["now"] is None and upcoming_program.start_date_time <= at:
+            entry["now"] = program_schema(upcoming_program)
+        elif entry["next"] is None:
+            entry["next"] = program_schema(upcoming_program)
+    return list(results.values())
+
+
+async def query_program(db: AsyncSession, program_id: str) -> EpgProgramSchema:
+    index = get_guide_index()
+    indexed = index.program(program_id) if index is not None else None
+    if indexed is not None:
+        return indexed
+
+    program = await db.scalar(
+        select(EPGProgramModel).where(EPGProgramModel.meo_program_id == program_id)
+    )
+    if program is None:
+        raise HTTPException(status_code=404, detail="Program not found")
+    return program_schema(program)
+
+
+@router.get("/channels", response_model=List[EpgChannelSchema])
+async def list_channels(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    cache_headers: Dict[str, str] = Depends(conditional_get),
+):
+    """List all channels ordered by their MEO position."""
+    return await cached_json(
+        request, cache_headers, lambda: query_channels(db)
+    )
+
+
+@router.get("/channels/{meo_id}/programs", response_model=List[EpgProgramSchema])
+async def list_channel_programs(
+    request: Request,
+    meo_id: str,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_async_db),
+    cache_headers: Dict[str, str] = Depends(conditional_get),
+):
+    """List a channel's programs airing in the [from, to) window (defaults to the next 24 hours)."""
+    start = resolve_time(request, start)
+    end = to_utc(end) if end is not None else start + timedelta(days=1)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    if end - start > timedelta(days=MAX_QUERY_WINDOW_DAYS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"The window cannot exceed {MAX_QUERY_WINDOW_DAYS} days",
+        )
+    return await cached_json(
+        request,
+        cache_headers,
+        lambda: query_channel_programs(db, meo_id, start, end),
+    )
+
+
+@router.get("/now", response_model=List[EpgNowNextSchema])
+async def now_and_next(
+    request: Request,
+    at: Optional[datetime] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    cache_headers: Dict[str, str] = Depends(conditional_get),
+):
+    """Return the program airing now (or at `at`) and the following one on every channel."""
+    at = resolve_time(request, at)
+    return await cached_json(
+        request, cache_headers, lambda: query_now_next(db, at)
+    )
+
+
+@router.get("/programs/{program_id}", response_model=EpgProgramSchema)
+async def get_program(
+    request: Request,
+    program_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    cache_headers: Dict[str, str] = Depends(conditional_get),
+):
+    """Return a single program by its MEO program id."""
+    return await cached_json(
+        request, cache_headers, lambda: query_program(db, program_id)
+    )
 
 
-@app.get("/api/data")
-async def get_data(key: str = Depends(get_api_key)):
-    return {"data": "protected data"}
+@router.get("/xmltv", response_class=StreamingResponse)
+async def export_xmltv(
+    request: Request,
+    channels: Optional[str] = Query(None, description="Comma-separated MEO channel ids"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    gzip: bool = False,
+    cache_headers: Dict[str, str] = Depends(conditional_get),
+):
+    """Stream the guide as XMLTV, optionally gzipped, filtered by channels and [from, to)."""
+    channel_ids = [c for c in channels.split(",") if c] if channels else None
+    content = iter_xmltv(channel_ids, resolve_time(request, start), end, compress=gzip)
+    if gzip:
+        return StreamingResponse(
+            content,
+            media_type="application/gzip",
+            headers={
+                **cache_headers,
+                "Content-Disposition": 'attachment; filename="guide.xml.gz"',
+            },
+        )
+    return StreamingResponse(
+        content, media_type="application/xml", headers=cache_headers
+    )
@@ -0,0 +1,97 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Set
+from fastapi import HTTPException, Request, Response
+from utils.constants import API_CACHE_MAX_AGE, API_CACHE_STALE_WHILE_REVALIDATE
+from utils.generation import current_generation
+
+# Query parameters that default to the current time when omitted
+TIME_PARAMS = {"at", "from"}
+
+
+def cache_key(request: Request) -> str:
+    """Path plus query string with parameters in a canonical order.
+
+    Set by the conditional GET dependency, which may add a time bucket for
+    requests whose result depends on the current time.
+    """
+    key = getattr(request.state, "cache_key", None)
+    if key is None:
+        query = "&".join(sorted(request.url.query.split("&"))) if request.url.query else ""
+        key = f"{request.url.path}?{query}"
+    return key
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def request_time(request: Request) -> datetime:
+    """The current minute (UTC) as seen by this request.
+
+    Taken once and kept on the request, so the cache key, ETag and body of a
+    request that crosses a minute boundary all answer for the same minute.
+    """
+    now = getattr(request.state, "now", None)
+    if now is None:
+        now = request.state.now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    return now
+
+
+def _time_params(request: Request) -> Set[str]:
+    """The endpoint's query parameters (by alias) that default to the current time."""
+    dependant = getattr(request.scope.get("route"), "dependant", None)
+    if dependant is None:
+        return set()
+    return {param.alias for param in dependant.query_params} & TIME_PARAMS
+
+
+def conditional_get(request: Request, response: Response) -> Dict[str, str]:
+    """
+    Answer 304 Not Modified for unchanged guide data without touching the database.
+
+    The strong ETag is derived from the guide generation and the request's path
+    and query. Endpoints taking `at` or `from` answer for the current time when
+    neither is given, so such requests also carry the current minute in their
+    key and Last-Modified. ETag, Last-Modified and Cache-Control are set on the
+    response and returned, so endpoints returning a Response object directly can
+    pass them on.
+    """
+    generation = current_generation()
+    last_modified = generation.timestamp
+    key = cache_key(request)
+    # Without an explicit time the answer changes every minute ("now" moves on)
+    time_params = _time_params(request)
+    if time_params and not any(param in request.query_params for param in time_params):
+        minute = request_time(request)
+        key = f"{key}@{minute:%Y%m%d%H%M}"
+        last_modified = max(last_modified, minute)
+    request.state.cache_key = key
+
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    etag = f'"{generation.number}-{digest[:16]}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": (
+            f"public, max-age={API_CACHE_MAX_AGE}, "
+            f"stale-while-revalidate={API_CACHE_STALE_WHILE_REVALIDATE}"
+        ),
+    }
+    if _not_modified(request, etag, last_modified):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return headers
@@ -0,0 +1,51 @@
+import time
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from utils.metrics import api_request_seconds, registry
+
+router = APIRouter(tags=["Monitoring"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Expose the metrics registry in the Prometheus text format."""
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+class LatencyMiddleware:
+    """Observe each request's latency by route template (e.g. /channels/{meo_id}/programs).
+
+    A plain ASGI middleware: it times until the last body chunk is sent, so
+    streamed responses (XMLTV) are measured in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            # The router stores the matched route in the scope; unmatched paths are
+            # grouped so arbitrary URLs can't create new series
+            route = scope.get("route")
+            api_request_seconds.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status),
+            ).observe(time.perf_counter() - started)
@@ -0,0 +1,115 @@
+import asyncio
+import json
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from api.public.http_cache import cache_key
+from utils.constants import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_ENTRIES
+from utils.generation import current_generation
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int, max_bytes: int):
+        """Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of cached responses.
+            max_bytes: Maximum total size of cached response bodies.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.generation = current_generation().number
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_generation(self):
+        """Drop every entry once a sync has produced a new generation."""
+        generation = current_generation().number
+        if generation != self.generation:
+            self._entries.clear()
+            self.size = 0
+            self.generation = generation
+            self.invalidations += 1
+
+    def _store(self, key: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        self._entries[key] = body
+        self.size += len(body)
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    async def get_or_build(self, key: str, build: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Return the cached body for `key`, building it at most once concurrently."""
+        self._check_generation()
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        generation = self.generation
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            body = await build()
+            future.set_result(body)
+        except BaseException as error:
+            future.set_exception(error)
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+        # Don't store a body built from data older than the current generation
+        self._check_generation()
+        if generation == self.generation:
+            self._store(key, body)
+        return body
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES)
+
+
+def serialize(data: Any) -> bytes:
+    return json.dumps(jsonable_encoder(data), separators=(",", ":")).encode("utf-8")
+
+
+async def cached_json(
+    request: Request, headers: Dict[str, str], build: Callable[[], Awaitable[Any]]
+) -> Response:
+    """Serve a JSON response from the response cache, building and serializing it on a miss."""
+
+    async def build_body() -> bytes:
+        return serialize(await build())
+
+    body = await response_cache.get_or_build(cache_key(request), build_body)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,294 @@
+"""
+Local stand-in for the four MEO endpoints, serving a synthetic catalog.
+
+    python -m bench.fake_meo [--port 8089] [--channels 200] [--per-day 40]
+        [--latency-ms 40] [--error-rate 0.01] [--rate 50]
+
+Endpoints (pass `MeoClient(urls=meo_urls(base))` to use them):
+    POST /grid, GET /channel_info?callLetter=, POST /guide, POST /detail
+GET /_stats returns request, error and 429 counters per endpoint.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+from aiohttp import web
+
+GUIDE_TIMEZONE = ZoneInfo("Europe/Lisbon")
+IMAGE_BASE = "https://proxycache.online.meo.pt/eemstb/ImageHandler.ashx"
+EPOCH = date(2020, 1, 1)
+ENDPOINTS = ("grid", "channel_info", "guide", "detail")
+
+
+def meo_urls(base: str) -> Dict[str, str]:
+    """MeoClient endpoint URLs for a fake server listening at `base` (e.g. http://127.0.0.1:8089)."""
+    return {
+        "grid": f"{base}/grid",
+        "channel_info": f"{base}/channel_info?callLetter=",
+        "guide": f"{base}/guide",
+        "detail": f"{base}/detail",
+    }
+
+
+class Catalog:
+    """Deterministic guide: every channel airs `per_day` equal slots per local day.
+
+    Program ids encode (channel, day, slot), so details are computed on demand
+    and the catalog costs no memory whatever its size.
+    """
+
+    def __init__(self, channels: int, per_day: int, series: int = 400):
+        self.channels = channels
+        self.per_day = per_day
+        self.series = series
+        self.slot_minutes = 24 * 60 // per_day
+
+    def sigla(self, channel: int) -> str:
+        return f"CH{channel:04d}"
+
+    def channel_index(self, sigla: str) -> Optional[int]:
+        if not sigla.startswith("CH") or not sigla[2:].isdigit():
+            return None
+        index = int(sigla[2:])
+        return index if index < self.channels else None
+
+    def program_id(self, channel: int, day: date, slot: int) -> str:
+        return f"{channel:04d}{(day - EPOCH).days:05d}{slot:03d}"
+
+    def parse_program_id(self, program_id: str):
+        if len(program_id) != 12 or not program_id.isdigit():
+            return None
+        channel, day, slot = int(program_id[:4]), int(program_id[4:9]), int(program_id[9:])
+        if channel >= self.channels or slot >= self.per_day:
+            return None
+        return channel, EPOCH + timedelta(days=day), slot
+
+    def _wall_times(self, slot: int):
+        start = slot * self.slot_minutes
+        end = (start + self.slot_minutes) % (24 * 60)
+        return f"{start // 60:02d}:{start % 60:02d}", f"{end // 60:02d}:{end % 60:02d}"
+
+    def _utc_start(self, day: date, slot: int) -> datetime:
+        local = datetime.combine(day, datetime.min.time()) + timedelta(
+            minutes=slot * self.slot_minutes
+        )
+        return local.replace(tzinfo=GUIDE_TIMEZONE).astimezone(timezone.utc)
+
+    def title(self, channel: int, slot: int) -> str:
+        return f"Programa {(channel * 7 + slot % 12) % self.series}"
+
+    def grid(self) -> dict:
+        return {
+            "d": {
+                "channels": [
+                    {
+                        "id": channel + 1,
+                        "sigla": self.sigla(channel),
+                        "name": f"Canal {channel}",
+                        "logo": f"{IMAGE_BASE}?channel={self.sigla(channel)}",
+                        "isAdult": False,
+                    }
+                    for channel in range(self.channels)
+                ]
+            }
+        }
+
+    def channel_info(self, channel: int) -> dict:
+        return {
+            "Result": {
+                "Description": f"Canal sintético {channel}",
+                "Thematic": ("Generalistas", "Desporto", "Filmes", "Notícias")[channel % 4],
+                "Language": "PT",
+                "Region": "",
+                "ChannelPosition": channel + 1,
+            }
+        }
+
+    def listings(self, channel: int, start: datetime, end: datetime) -> List[dict]:
+        """Guide entries of a channel airing in [start, end)."""
+        slot_length = timedelta(minutes=self.slot_minutes)
+        day = start.astimezone(GUIDE_TIMEZONE).date() - timedelta(days=1)
+        last = end.astimezone(GUIDE_TIMEZONE).date()
+        entries = []
+        while day <= last:
+            for slot in range(self.per_day):
+                begins = self._utc_start(day, slot)
+                if begins >= end or begins + slot_length <= start:
+                    continue
+                time_ini, time_end = self._wall_times(slot)
+                entries.append(
+                    {
+                        "uniqueId": self.program_id(channel, day, slot),
+                        "date": f"{day.day}-{day.month}-{day.year}",
+                        "timeIni": time_ini,
+                        "timeEnd": time_end,
+                        "title": self.title(channel, slot),
+                    }
+                )
+            day += timedelta(days=1)
+        return entries
+
+    def details(self, program_id: str) -> Optional[dict]:
+        parsed = self.parse_program_id(program_id)
+        if parsed is None:
+            return None
+        channel, day, slot = parsed
+        series = (channel * 7 + slot % 12) % self.series
+        start_time, end_time = self._wall_times(slot)
+        return {
+            "d": {
+                "uniqueId": program_id,
+                "date": f"{day.day}-{day.month}-{day.year}",
+                "startTime": start_time,
+                "endTime": end_time,
+                "progName": self.title(channel, slot),
+                "description": f"Episódio {slot} da série {series}",
+                "progImageM": f"{IMAGE_BASE}?evTitle=Programa%20{series}&profile=16_9&width=215",
+                "progImageL": f"{IMAGE_BASE}?evTitle=Programa%20{series}&profile=16_9&width=443",
+                "progImageXL": f"{IMAGE_BASE}?evTitle=Programa%20{series}&profile=16_9&width=1920",
+                "seriesID": f"SER{series}",
+            }
+        }
+
+
+class ServerBucket:
+    """Upstream-side rate limit: requests beyond `rate` per second get a 429."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = max(rate, 1)
+        self.last = time.monotonic()
+
+    def take(self) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(max(self.rate, 1), self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def _parse_window(value: str) -> datetime:
+    # MeoClient sends isoformat() + "Z"
+    parsed = datetime.fromisoformat(value.rstrip("Z"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def create_app(
+    catalog: Catalog,
+    latency_ms: float = 40,
+    error_rate: float = 0.0,
+    rate: float = 0.0,
+    seed: int = 0,
+) -> web.Application:
+    """
+    Build the fake MEO application.
+
+    Args:
+        catalog: Synthetic guide to serve.
+        latency_ms: Mean added response latency (exponentially distributed).
+        error_rate: Fraction of requests answered with HTTP 503.
+        rate: Requests per second allowed per endpoint before answering 429, 0 for no limit.
+        seed: Seed of the latency and error draws.
+    """
+    rng = random.Random(seed)
+    buckets = {endpoint: ServerBucket(rate) for endpoint in ENDPOINTS}
+    stats = {key: Counter() for key in ("requests", "errors", "throttled")}
+    started = time.monotonic()
+
+    def endpoint(name: str):
+        def decorator(handler):
+            async def wrapped(request: web.Request) -> web.Response:
+                stats["requests"][name] += 1
+                if latency_ms:
+                    await asyncio.sleep(rng.expovariate(1000 / latency_ms))
+                if not buckets[name].take():
+                    stats["throttled"][name] += 1
+                    return web.Response(status=429, headers={"Retry-After": "1"})
+                if error_rate and rng.random() < error_rate:
+                    stats["errors"][name] += 1
+                    return web.Response(status=503)
+                return await handler(request)
+
+            return wrapped
+
+        return decorator
+
+    @endpoint("grid")
+    async def grid(request):
+        return web.json_response(catalog.grid())
+
+    @endpoint("channel_info")
+    async def channel_info(request):
+        channel = catalog.channel_index(request.query.get("callLetter", ""))
+        if channel is None:
+            return web.json_response({"Result": None})
+        return web.json_response(catalog.channel_info(channel))
+
+    @endpoint("guide")
+    async def guide(request):
+        body = await request.json()
+        start, end = _parse_window(body["dateStart"]), _parse_window(body["dateEnd"])
+        channels = []
+        for sigla in body.get("channels") or []:
+            channel = catalog.channel_index(sigla)
+            if channel is not None:
+                channels.append(
+                    {"sigla": sigla, "programs": catalog.listings(channel, start, end)}
+                )
+        return web.json_response({"d": {"channels": channels}})
+
+    @endpoint("detail")
+    async def detail(request):
+        body = await request.json()
+        details = catalog.details(str(body.get("programID", "")))
+        return web.json_response(details or {"d": None})
+
+    async def server_stats(request):
+        return web.json_response(
+            {
+                "uptime": time.monotonic() - started,
+                **{key: dict(counter) for key, counter in stats.items()},
+            }
+        )
+
+    app = web.Application()
+    app.router.add_post("/grid", grid)
+    app.router.add_get("/channel_info", channel_info)
+    app.router.add_post("/guide", guide)
+    app.router.add_post("/detail", detail)
+    app.router.add_get("/_stats", server_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic MEO catalog.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--per-day", type=int, default=40, help="Programs per channel per day")
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=0.0, help="Per-endpoint limit, 0 for none")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app(
+        Catalog(args.channels, args.per_day),
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        rate=args.rate,
+        seed=args.seed,
+    )
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Compare peak memory and allocations of in-flight programs as dicts vs ProgramRecord.
+
+Each variant runs in a fresh interpreter so peak RSS is not shared:
+
+    python -m bench.records [--channels 200] [--days 7] [--per-day 40]
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from schemas.records import ProgramRecord, intern
+
+IMAGE_BASE = "https://proxycache.online.meo.pt/eemstb/ImageHandler.ashx"
+
+
+def _upstream_details(channels: int, days: int, per_day: int):
+    """Yield detail payloads shaped like MEO's, with freshly allocated strings as JSON decoding would."""
+    start = datetime(2025, 3, 4, tzinfo=timezone.utc)
+    step = timedelta(minutes=24 * 60 // per_day)
+    for channel in range(channels):
+        for slot in range(days * per_day):
+            series = (channel * 7 + slot % 12) % 400
+            begin = start + slot * step
+            yield {
+                "id": f"{channel}{slot:06d}",
+                "start": begin,
+                "end": begin + step,
+                "name": "".join(["Programa ", str(series)]),
+                "description": "".join(["Episódio ", str(slot), " da série ", str(series)]),
+                "imgM": f"{IMAGE_BASE}?evTitle=Programa%20{series}&profile=16_9&width=215",
+                "imgL": f"{IMAGE_BASE}?evTitle=Programa%20{series}&profile=16_9&width=443",
+                "imgXL": f"{IMAGE_BASE}?evTitle=Programa%20{series}&profile=16_9&width=1920",
+                "series_id": "".join(["SER", str(series)]),
+            }
+
+
+def build_dicts(details):
+    return [
+        {
+            "id": d["id"],
+            "start_date_time": d["start"],
+            "end_date_time": d["end"],
+            "name": d["name"],
+            "description": d["description"],
+            "imgM": d["imgM"],
+            "imgL": d["imgL"],
+            "imgXL": d["imgXL"],
+            "series_id": d["series_id"],
+        }
+        for d in details
+    ]
+
+
+def build_records(details):
+    return [
+        ProgramRecord(
+            d["id"],
+            d["start"],
+            d["end"],
+            intern(d["name"]),
+            d["description"],
+            intern(d["imgM"]),
+            intern(d["imgL"]),
+            intern(d["imgXL"]),
+            intern(d["series_id"]),
+        )
+        for d in details
+    ]
+
+
+VARIANTS = {"dict": build_dicts, "record": build_records}
+
+
+def run_variant(variant: str, channels: int, days: int, per_day: int) -> dict:
+    tracemalloc.start()
+    started = time.perf_counter()
+    programs = VARIANTS[variant](_upstream_details(channels, days, per_day))
+    elapsed = time.perf_counter() - started
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "variant": variant,
+        "programs": len(programs),
+        "build_seconds": round(elapsed, 3),
+        "live_bytes": current,
+        "peak_traced_bytes": peak,
+        "live_blocks": sum(stat.count for stat in snapshot.statistics("filename")),
+        # Linux reports KiB
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--per-day", type=int, default=40)
+    parser.add_argument("--variant", choices=sorted(VARIANTS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.channels, args.days, args.per_day)))
+        return
+
+    results = []
+    for variant in VARIANTS:
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "bench.records",
+                "--variant",
+                variant,
+                "--channels",
+                str(args.channels),
+                "--days",
+                str(args.days),
+                "--per-day",
+                str(args.per_day),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+
+    columns = list(results[0])
+    print("  ".join(f"{column:>18}" for column in columns))
+    for result in results:
+        print("  ".join(f"{result[column]!s:>18}" for column in columns))
+    baseline, compact = results
+    for column in ("live_bytes", "live_blocks", "peak_rss_bytes"):
+        print(f"{column}: {compact[column] / baseline[column]:.2f}x of dicts")
+
+
+if __name__ == "__main__":
+    main()
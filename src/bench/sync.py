@@ -0,0 +1,293 @@
+"""
+End-to-end sync and API benchmark against the local stand-in MEO server.
+
+Syncs a synthetic catalog from `bench.fake_meo` into the configured Postgres
+(use a scratch database, e.g. DB_NAME=ptepg_bench), then measures the public
+API on the stored guide. One JSON line per run is appended to --output:
+
+    python -m bench.sync --reset [--channels 200] [--days 7] [--per-day 40]
+        [--latency-ms 40] [--error-rate 0.01] [--server-rate 0] [--client-rate 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from bench.fake_meo import GUIDE_TIMEZONE, Catalog, meo_urls
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _start_server(args, port: int) -> subprocess.Popen:
+    """Run the fake MEO server in its own process so it doesn't skew our RSS and CPU."""
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "bench.fake_meo",
+            "--port", str(port),
+            "--channels", str(args.channels),
+            "--per-day", str(args.per_day),
+            "--latency-ms", str(args.latency_ms),
+            "--error-rate", str(args.error_rate),
+            "--rate", str(args.server_rate),
+            "--seed", str(args.seed),
+        ]
+    )
+
+
+async def _server_stats(session, base: str, timeout: float = 10.0) -> dict:
+    """Fetch the server counters, waiting for it to come up."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(f"{base}/_stats") as response:
+                return await response.json()
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if len(samples) < 2:
+        return {"p50_ms": 0.0, "p99_ms": 0.0, "max_ms": max(samples, default=0.0)}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50_ms": round(cuts[49], 3),
+        "p99_ms": round(cuts[98], 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def _set_client_rate(rate: float):
+    """Raise the client's own token buckets, which otherwise cap any run at production rates."""
+    from utils.rate_limit import endpoint_buckets, token_bucket
+
+    for bucket in [token_bucket, *endpoint_buckets.values()]:
+        bucket.rate = bucket.max_rate = rate
+        bucket.capacity = bucket.tokens = max(rate, 1)
+
+
+async def _sync(args, base: str, start: datetime, end: datetime) -> dict:
+    # Project modules read their configuration at import time, after main() set it up
+    import jobs.pipeline
+    from jobs.channels import fetch_channels_async
+    from jobs.ingest import bulk_ingest
+    from jobs.retention import ensure_partitions
+    from utils.meo_client import MeoClient
+    from utils.rate_limit import rate_limit_stats
+
+    write_seconds = 0.0
+
+    async def timed_ingest(channels):
+        nonlocal write_seconds
+        started = time.perf_counter()
+        try:
+            return await bulk_ingest(channels)
+        finally:
+            write_seconds += time.perf_counter() - started
+
+    jobs.pipeline.bulk_ingest = timed_ingest
+
+    await ensure_partitions(start)
+    started = time.perf_counter()
+    async with MeoClient(urls=meo_urls(base)) as client:
+        channels = await fetch_channels_async(client)
+        channels_seconds = time.perf_counter() - started
+        stats = await jobs.pipeline.run_sync_pipeline(
+            client, channels, start, end, args.incremental
+        )
+    sync_seconds = time.perf_counter() - started
+    waits = rate_limit_stats()
+    return {
+        "sync_seconds": round(sync_seconds, 3),
+        "channel_list_seconds": round(channels_seconds, 3),
+        "db_write_seconds": round(write_seconds, 3),
+        "channels": len(channels),
+        "rows": stats,
+        "rate_limit_avg_wait": {
+            name: round(bucket["avg_wait"], 4) for name, bucket in waits.items()
+        },
+    }
+
+
+async def _api(args, catalog: Catalog, start: datetime, end: datetime) -> dict:
+    import httpx
+    from fastapi import FastAPI
+    from api.public.api import router
+    from utils.api_keys import create_api_key, revoke_api_key
+    from utils.db import SessionLocal
+    from utils.guide_index import rebuild_guide_index
+
+    started = time.perf_counter()
+    await asyncio.to_thread(rebuild_guide_index)
+    index_seconds = time.perf_counter() - started
+
+    app = FastAPI()
+    app.include_router(router)
+    rng = random.Random(args.seed)
+    span = int((end - start).total_seconds() // 60)
+
+    def at() -> str:
+        moment = start + timedelta(minutes=rng.randrange(span))
+        return moment.isoformat().replace("+00:00", "Z")
+
+    def program_id() -> str:
+        moment = start + timedelta(minutes=rng.randrange(span))
+        day = moment.astimezone(GUIDE_TIMEZONE).date()
+        return catalog.program_id(
+            rng.randrange(catalog.channels), day, rng.randrange(catalog.per_day)
+        )
+
+    routes = {
+        "channels": lambda: "/channels",
+        "now": lambda: f"/now?at={at()}",
+        "channel_programs": lambda: (
+            f"/channels/{catalog.sigla(rng.randrange(catalog.channels))}/programs?from={at()}"
+        ),
+        "program": lambda: f"/programs/{program_id()}",
+        "xmltv": lambda: (
+            f"/xmltv?channels={catalog.sigla(rng.randrange(catalog.channels))}&from={at()}"
+        ),
+    }
+    results = {"index_build_seconds": round(index_seconds, 3)}
+    key, key_id = os.getenv("BENCH_API_KEY"), None
+    if not key:
+        # A key whose quota never limits the benchmark
+        with SessionLocal() as db:
+            key, row = create_api_key(db, "bench", rate_per_second=1e6, burst=1_000_000)
+            key_id = row.id
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport,
+        base_url="http://bench",
+        headers={"X-API-Key": key},
+    ) as client:
+        for name, path in routes.items():
+            samples, failures = [], 0
+            for _ in range(args.api_requests):
+                url = path()
+                begun = time.perf_counter()
+                response = await client.get(url)
+                samples.append((time.perf_counter() - begun) * 1000)
+                failures += response.status_code >= 400
+            results[name] = {**_percentiles(samples), "errors": failures}
+    if key_id is not None:
+        with SessionLocal() as db:
+            revoke_api_key(db, key_id)
+    return results
+
+
+async def _run(args) -> dict:
+    import aiohttp
+    from sqlalchemy import text
+    from utils.db import async_engine, initialize_database
+
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    catalog = Catalog(args.channels, args.per_day)
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    end = start + timedelta(days=args.days)
+
+    server = _start_server(args, port)
+    try:
+        await asyncio.to_thread(initialize_database)
+        if args.reset:
+            async with async_engine.begin() as connection:
+                await connection.execute(text("TRUNCATE programs, channels CASCADE"))
+
+        async with aiohttp.ClientSession() as session:
+            await _server_stats(session, base)
+            sync = await _sync(args, base, start, end)
+            upstream = await _server_stats(session, base)
+        requests = sum(upstream["requests"].values())
+        sync["upstream"] = {
+            **{key: upstream[key] for key in ("requests", "errors", "throttled")},
+            "requests_per_second": round(requests / sync["sync_seconds"], 2),
+        }
+        api = await _api(args, catalog, start, end)
+    finally:
+        server.terminate()
+        server.wait()
+        await async_engine.dispose()
+
+    return {
+        "benchmark": "sync",
+        "label": args.label,
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "revision": _git_revision(),
+        "params": {
+            key: getattr(args, key)
+            for key in (
+                "channels", "days", "per_day", "latency_ms", "error_rate",
+                "server_rate", "client_rate", "incremental", "api_requests", "seed",
+            )
+        },
+        "sync": sync,
+        "api": api,
+        # Linux reports KiB
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--per-day", type=int, default=40, help="Programs per channel per day")
+    parser.add_argument("--latency-ms", type=float, default=40, help="Mean upstream latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 503s")
+    parser.add_argument(
+        "--server-rate", type=float, default=0.0,
+        help="Upstream per-endpoint requests/s before 429s, 0 for no limit",
+    )
+    parser.add_argument(
+        "--client-rate", type=float, default=None,
+        help="Override the client's token bucket rates (defaults to the production limits)",
+    )
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--api-requests", type=int, default=200, help="Requests per API route")
+    parser.add_argument("--reset", action="store_true", help="Truncate channels and programs first")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="", help="Free-form tag stored with the results")
+    parser.add_argument("--output", default="bench/results.jsonl")
+    args = parser.parse_args()
+
+    # A cold, private detail cache, so runs don't warm each other up
+    os.environ["PROGRAM_CACHE_PATH"] = os.path.join(
+        tempfile.mkdtemp(prefix="ptepg-bench-"), "program_details.sqlite"
+    )
+    if args.client_rate:
+        _set_client_rate(args.client_rate)
+
+    result = asyncio.run(_run(args))
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "a") as output:
+        output.write(json.dumps(result) + "\n")
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
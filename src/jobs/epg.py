@@ -1,45 +1,188 @@
+import argparse
+import asyncio
+import time
 from datetime import datetime, timedelta
-import aiohttp
 import pytz
-from typing import List
-from models.epg import EPGChannelModel, EPGProgramModel
+from typing import Iterable, List, Optional, Set
 from jobs.channels import fetch_channels_async
-from jobs.programs import fetch_programs_async
-from utils.constants import DAYS_TO_FETCH
-from utils.logger import logger
-from utils.db import get_db
+from jobs.pipeline import GuideBatchesFailed, run_sync_pipeline
+from jobs.retention import ensure_partitions
+from jobs.sync_runs import checkpoint_batch, finish_sync_run, start_sync_run
+from jobs.work_queue import enqueue_sync
+from utils.cache import program_cache
+from utils.constants import (
+    DAYS_TO_FETCH,
+    GUIDE_PUBLISH_MIN_SECONDS,
+    INCREMENTAL_SYNC,
+    SYNC_DISTRIBUTED,
+)
+from utils.generation import bump_generation
+from utils.guide_index import rebuild_guide_index, refresh_guide_channels
+from utils.logger import get_logger
+from utils.meo_client import MeoClient
+from utils.rate_limit import rate_limit_stats, token_bucket
+from utils.tracing import trace_run
+
+logger = get_logger(__name__)
+
+# Channels changed by channel-group syncs and not published yet
+_unpublished: Set[str] = set()
+_publish_task: Optional[asyncio.Task] = None
+_last_published = float("-inf")
+
+
+async def _publish_channels(delay: float):
+    """Refresh the index for the unpublished channels and bump the generation after `delay`."""
+    global _publish_task, _last_published
+    try:
+        await asyncio.sleep(delay)
+        meo_ids = list(_unpublished)
+        _unpublished.clear()
+        if not meo_ids:
+            # A full publish came first
+            return
+        try:
+            await asyncio.to_thread(refresh_guide_channels, meo_ids)
+            await asyncio.to_thread(bump_generation)
+        except Exception as e:
+            logger.error(f"Publishing changes of {len(meo_ids)} channels failed: {e}")
+            _unpublished.update(meo_ids)
+            return
+        _last_published = time.monotonic()
+    finally:
+        _publish_task = None
 
 
-async def get_meo_epg():
-    """Get the EPG from MEO and store it in the database.(updating it)"""
-    start_time = datetime.now(pytz.utc)
+async def publish_guide(meo_ids: Optional[Iterable[str]] = None):
+    """
+    Make committed guide changes visible: refresh the guide index and bump the generation.
 
-    async with aiohttp.ClientSession() as session:
-        # Step 1: Fetch channels asynchronously
-        channels = await fetch_channels_async(session)
-        if not channels:
-            logger.error("No channels fetched. Exiting.")
-            return
+    A full sync is published at once. Changes of channel groups only refresh
+    those channels' schedules and are published at most once per
+    GUIDE_PUBLISH_MIN_SECONDS; changes made in between are published together
+    once the interval has passed.
 
-        start_date = datetime.now(pytz.utc).replace(
-            hour=0, minute=0, second=0, microsecond=0
-        )
-        end_date = start_date + timedelta(days=DAYS_TO_FETCH)
+    Args:
+        meo_ids: Channels whose programs changed, or None after a sync of all channels.
+    """
+    global _publish_task, _last_published
+    if meo_ids is None:
+        _unpublished.clear()
+        await asyncio.to_thread(rebuild_guide_index)
+        await asyncio.to_thread(bump_generation)
+        _last_published = time.monotonic()
+        return
+
+    _unpublished.update(meo_ids)
+    if _publish_task is not None:
+        return
+    delay = max(_last_published + GUIDE_PUBLISH_MIN_SECONDS - time.monotonic(), 0)
+    _publish_task = asyncio.ensure_future(_publish_channels(delay))
+    if not delay:
+        await asyncio.shield(_publish_task)
+    else:
+        logger.info(f"Publishing changes of {len(_unpublished)} channels in {delay:.0f}s.")
+
+
+async def get_meo_epg(
+    incremental: bool = INCREMENTAL_SYNC,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    channels: Optional[List[dict]] = None,
+    scope: str = "full",
+    profile: bool = False,
+) -> Optional[dict]:
+    """Get the EPG from MEO and store it in the database.(updating it)
 
-        # Process channels in batches of 30
-        batch_size = 30
-        all_updated_channels = []  # Initialize an empty list to store all channels
+    Args:
+        incremental: Only fetch details for programs that are new or changed since
+            the last sync, and flag stored programs that disappeared upstream.
+        start_date: Start of the synced window (UTC), defaults to today's midnight.
+        end_date: End of the synced window, defaults to DAYS_TO_FETCH days after the start.
+        channels: Channels (with details) to sync, defaults to fetching all of them.
+        scope: Identifies the slice being synced (e.g. a horizon and channel group),
+            so only a run of the same slice is resumed.
+        profile: Sample the event loop's stacks during this run (see utils.tracing).
+
+    Returns:
+        The sync stats, or None if no channels could be fetched. With SYNC_DISTRIBUTED
+        the batches are only queued and the stats are those of the run so far.
+
+    Raises:
+        GuideBatchesFailed: If the guide listing or program details of some channels
+            could not be fetched, after the rest was committed and published; the run
+            is left failed.
+    """
+    start_time = datetime.now(pytz.utc)
+    # Syncs of a channel group only refresh those channels once published
+    scoped = channels is not None
 
-        for i in range(0, len(channels), batch_size):
-            batch = channels[i : i + batch_size]
-            batch_updated_channels = await fetch_programs_async(
-                session, batch, start_date, end_date
-            )
-            # Add this batch's channels to our accumulated list
-            all_updated_channels.extend(batch_updated_channels)
+    if start_date is None:
+        start_date = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    if end_date is None:
+        end_date = start_date + timedelta(days=DAYS_TO_FETCH)
 
-        # Save all channels to the database
-        save_to_database(all_updated_channels)
+    # Picks up where an interrupted run of the same window stopped
+    run = await start_sync_run(start_date, end_date, scope)
+    try:
+        # Spans and a critical-path/idle-budget summary are written per run
+        async with trace_run(f"run-{run.id}", token_bucket.rate, profile), MeoClient() as client:
+            # Step 1: Fetch channels asynchronously
+            if channels is None:
+                channels = await fetch_channels_async(client)
+            if not channels:
+                logger.error("No channels fetched. Exiting.")
+                await finish_sync_run(run.id, "failed", error="No channels fetched")
+                return None
+
+            done = set(run.completed_channels)
+            pending = [channel for channel in channels if channel["meo_id"] not in done]
+            if done:
+                logger.info(
+                    f"Skipping {len(channels) - len(pending)} channels committed by an earlier attempt."
+                )
+            # Programs must land in their daily partition, not the default one
+            await ensure_partitions(start_date)
+
+            if SYNC_DISTRIBUTED and pending:
+                # Workers (python -m jobs.worker) run the batches and close the run
+                await enqueue_sync(run, pending, incremental)
+                return run.stats
+
+            # Guide, detail and persistence stages run concurrently over all batches,
+            # each batch being checkpointed once committed
+            failure = None
+            try:
+                stats = await run_sync_pipeline(
+                    client,
+                    pending,
+                    start_date,
+                    end_date,
+                    incremental,
+                    checkpoint=lambda meo_ids, stats: checkpoint_batch(run.id, meo_ids, stats),
+                    stats=run.stats,
+                )
+            except GuideBatchesFailed as e:
+                # The other batches are committed and checkpointed; the failed run
+                # is resumed with only these channels by the next sync of its window
+                logger.error(f"{e}, leaving the run to be resumed.")
+                stats, failure = e.stats, e
+            logger.info(f"Sync results: {stats}")
+    except BaseException as e:
+        await asyncio.shield(finish_sync_run(run.id, "failed", error=repr(e)))
+        raise
+    if failure is not None:
+        await finish_sync_run(run.id, "failed", stats, error=str(failure))
+    else:
+        await finish_sync_run(run.id, "completed", stats)
+
+    # Only a sync that changed something refreshes the read model and
+    # invalidates client caches (ETags)
+    if stats["removed"] or any(
+        stats[table]["inserted"] or stats[table]["updated"]
+        for table in ("channels", "programs")
+    ):
+        await publish_guide([channel["meo_id"] for channel in channels] if scoped else None)
 
     # Record end time
     end_time = datetime.now(pytz.utc)
@@ -47,94 +190,35 @@ async def get_meo_epg():
     # Calculate time delta
     time_delta = end_time - start_time
     logger.info(f"EPG update took {time_delta.total_seconds()} seconds.")
+    await program_cache.flush()
+    program_cache.log_stats("Program detail")
+    logger.info(f"Rate limiter stats: {rate_limit_stats()}")
+    if failure is not None:
+        # Committed changes are published above; callers retry the rest
+        raise failure
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one guide sync now.")
+    parser.add_argument("--days", type=int, default=DAYS_TO_FETCH)
+    parser.add_argument("--full", action="store_true", help="Refetch every program's details")
+    parser.add_argument(
+        "--profile", action="store_true", help="Write a sampling profile of the run"
+    )
+    args = parser.parse_args()
+
+    start_date = datetime.now(pytz.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    asyncio.run(
+        get_meo_epg(
+            incremental=not args.full,
+            start_date=start_date,
+            end_date=start_date + timedelta(days=args.days),
+            scope="manual",
+            profile=args.profile,
+        )
+    )
 
 
-def save_to_database(channels: List[dict]):
-    """
-    Save EPG channels and programs to the database, updating existing records or inserting new ones.
-
-    Args:
-        channels: List of dictionaries containing channel data and their associated programs.
-    """
-    # Get the actual database session from the generator
-    db = next(get_db())
-
-    try:
-        for channel in channels:
-            # Check if the channel already exists in the database by its unique meo_id
-            existing_channel = (
-                db.query(EPGChannelModel).filter_by(meo_id=channel["meo_id"]).first()
-            )
-
-            if existing_channel:
-                # Update existing channel fields
-                existing_channel.name = channel["name"]
-                existing_channel.description = channel["description"]
-                existing_channel.logo = channel["logo"]
-                existing_channel.theme = channel["theme"]
-                existing_channel.language = channel["language"]
-                existing_channel.region = channel["region"]
-                existing_channel.position = channel["position"]
-                existing_channel.isAdult = channel["isAdult"]
-                channel_model = existing_channel
-            else:
-                # Create a new channel record
-                channel_model = EPGChannelModel(
-                    meo_id=channel["meo_id"],
-                    name=channel["name"],
-                    description=channel["description"],
-                    logo=channel["logo"],
-                    theme=channel["theme"],
-                    language=channel["language"],
-                    region=channel["region"],
-                    position=channel["position"],
-                    isAdult=channel["isAdult"],
-                )
-                db.add(channel_model)
-                db.flush()  # Flush to generate the channel's id
-
-            # Process each program associated with the channel
-            for program in channel["programs"]:
-                # Check if the program exists by its unique meo_program_id
-                existing_program = (
-                    db.query(EPGProgramModel)
-                    .filter_by(meo_program_id=program["id"])
-                    .first()
-                )
-
-                if existing_program:
-                    # Update existing program fields
-                    existing_program.start_date_time = program["start_date_time"]
-                    existing_program.end_date_time = program["end_date_time"]
-                    existing_program.name = program["name"]
-                    existing_program.description = program["description"]
-                    existing_program.imgM = program["imgM"]
-                    existing_program.imgL = program["imgL"]
-                    existing_program.imgXL = program["imgXL"]
-                    existing_program.series_id = program["series_id"]
-                    existing_program.channel_id = (
-                        channel_model.id
-                    )  # Ensure correct channel linkage
-                else:
-                    # Create a new program record
-                    new_program = EPGProgramModel(
-                        meo_program_id=program["id"],
-                        channel_id=channel_model.id,
-                        start_date_time=program["start_date_time"],
-                        end_date_time=program["end_date_time"],
-                        name=program["name"],
-                        description=program["description"],
-                        imgM=program["imgM"],
-                        imgL=program["imgL"],
-                        imgXL=program["imgXL"],
-                        series_id=program["series_id"],
-                    )
-                    db.add(new_program)
-
-        # Commit all changes at the end
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise e
-    finally:
-        db.close()
+if __name__ == "__main__":
+    main()
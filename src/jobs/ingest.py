@@ -0,0 +1,298 @@
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import select, update
+from models.epg import EPGChannelModel, EPGProgramModel
+from schemas.records import text
+from utils.db import AsyncSessionLocal, async_engine
+from utils.logger import get_logger
+from utils.tracing import traced
+
+logger = get_logger(__name__)
+
+CHANNEL_COLUMNS = (
+    "meo_id",
+    "name",
+    "description",
+    "logo",
+    "theme",
+    "language",
+    "region",
+    "position",
+    "isAdult",
+)
+
+PROGRAM_COLUMNS = (
+    "meo_program_id",
+    "channel_meo_id",
+    "start_date_time",
+    "end_date_time",
+    "name",
+    "description",
+    "imgM",
+    "imgL",
+    "imgXL",
+    "series_id",
+)
+
+# Staging tables live only for the duration of the ingest transaction
+CREATE_STAGING_SQL = """
+CREATE TEMP TABLE staging_channels (
+    meo_id TEXT,
+    name TEXT,
+    description TEXT,
+    logo TEXT,
+    theme TEXT,
+    language TEXT,
+    region TEXT,
+    position INTEGER,
+    "isAdult" BOOLEAN
+) ON COMMIT DROP;
+CREATE TEMP TABLE staging_programs (
+    meo_program_id TEXT,
+    channel_meo_id TEXT,
+    start_date_time TIMESTAMPTZ,
+    end_date_time TIMESTAMPTZ,
+    name TEXT,
+    description TEXT,
+    "imgM" TEXT,
+    "imgL" TEXT,
+    "imgXL" TEXT,
+    series_id TEXT
+) ON COMMIT DROP;
+"""
+
+# `xmax = 0` is only true for freshly inserted rows, which lets a single
+# statement report inserts and updates apart. Rows whose values did not change
+# are filtered by the WHERE clause and therefore not returned at all.
+UPSERT_CHANNELS_SQL = """
+INSERT INTO channels (meo_id, name, description, logo, theme, language, region, position, "isAdult")
+SELECT DISTINCT ON (meo_id)
+    meo_id, name, description, logo, theme, language, region, position, "isAdult"
+FROM staging_channels
+WHERE meo_id IS NOT NULL
+ORDER BY meo_id
+ON CONFLICT (meo_id) DO UPDATE SET
+    name = EXCLUDED.name,
+    description = EXCLUDED.description,
+    logo = EXCLUDED.logo,
+    theme = EXCLUDED.theme,
+    language = EXCLUDED.language,
+    region = EXCLUDED.region,
+    position = EXCLUDED.position,
+    "isAdult" = EXCLUDED."isAdult"
+WHERE (channels.name, channels.description, channels.logo, channels.theme,
+       channels.language, channels.region, channels.position, channels."isAdult")
+    IS DISTINCT FROM
+      (EXCLUDED.name, EXCLUDED.description, EXCLUDED.logo, EXCLUDED.theme,
+       EXCLUDED.language, EXCLUDED.region, EXCLUDED.position, EXCLUDED."isAdult")
+RETURNING (xmax = 0) AS inserted
+"""
+
+# The start time is part of the key of the partitioned programs table, so a
+# program that was rescheduled is deleted here and inserted again by the upsert
+DELETE_MOVED_PROGRAMS_SQL = """
+DELETE FROM programs p
+USING staging_programs s
+WHERE p.meo_program_id = s.meo_program_id
+  AND p.start_date_time <> s.start_date_time
+"""
+
+UPSERT_PROGRAMS_SQL = """
+INSERT INTO programs (meo_program_id, channel_id, start_date_time, end_date_time,
+                      name, description, "imgM", "imgL", "imgXL", series_id)
+SELECT DISTINCT ON (s.meo_program_id)
+    s.meo_program_id,
+    c.id,
+    s.start_date_time,
+    s.end_date_time,
+    s.name, s.description, s."imgM", s."imgL", s."imgXL", s.series_id
+FROM staging_programs s
+JOIN channels c ON c.meo_id = s.channel_meo_id
+WHERE s.meo_program_id IS NOT NULL AND s.start_date_time IS NOT NULL
+ORDER BY s.meo_program_id
+ON CONFLICT (meo_program_id, start_date_time) DO UPDATE SET
+    channel_id = EXCLUDED.channel_id,
+    end_date_time = EXCLUDED.end_date_time,
+    name = EXCLUDED.name,
+    description = EXCLUDED.description,
+    "imgM" = EXCLUDED."imgM",
+    "imgL" = EXCLUDED."imgL",
+    "imgXL" = EXCLUDED."imgXL",
+    series_id = EXCLUDED.series_id,
+    removed_at = NULL
+WHERE programs.removed_at IS NOT NULL
+   OR (programs.channel_id, programs.end_date_time,
+       programs.name, programs.description, programs."imgM", programs."imgL",
+       programs."imgXL", programs.series_id)
+    IS DISTINCT FROM
+      (EXCLUDED.channel_id, EXCLUDED.end_date_time,
+       EXCLUDED.name, EXCLUDED.description, EXCLUDED."imgM", EXCLUDED."imgL",
+       EXCLUDED."imgXL", EXCLUDED.series_id)
+RETURNING (xmax = 0) AS inserted
+"""
+
+
+def _int(value) -> Optional[int]:
+    return None if value in (None, "") else int(value)
+
+
+def _channel_rows(channels: List[dict]) -> List[Tuple]:
+    return [
+        (
+            text(channel["meo_id"]),
+            text(channel["name"]),
+            text(channel["description"]),
+            text(channel["logo"]),
+            text(channel["theme"]),
+            text(channel["language"]),
+            text(channel["region"]),
+            _int(channel["position"]),
+            None if channel["isAdult"] is None else bool(channel["isAdult"]),
+        )
+        for channel in channels
+    ]
+
+
+def _program_rows(channels: List[dict]) -> List[Tuple]:
+    return [
+        program.row(text(channel["meo_id"]))
+        for channel in channels
+        for program in channel["programs"]
+    ]
+
+
+async def _copy(connection, table: str, columns: Tuple[str, ...], rows: List[Tuple]):
+    """Stream rows into a staging table with COPY (binary protocol)."""
+    await connection.copy_records_to_table(table, records=rows, columns=columns)
+
+
+async def _merge(connection, sql: str, staged: int) -> Dict[str, int]:
+    """Run an upsert statement and turn its RETURNING rows into counters."""
+    results = await connection.fetch(sql)
+    inserted = sum(1 for row in results if row["inserted"])
+    updated = len(results) - inserted
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": max(staged - len(results), 0),
+    }
+
+
+@traced("bulk_ingest")
+async def bulk_ingest(channels: List[dict]) -> Dict[str, Dict[str, int]]:
+    """
+    COPY channels and programs into staging tables and merge them in a single transaction.
+
+    Args:
+        channels: List of dictionaries containing channel data and their associated programs.
+
+    Returns:
+        Inserted/updated/unchanged counters for channels and programs.
+    """
+    started = time.perf_counter()
+    channel_rows = _channel_rows(channels)
+    program_rows = _program_rows(channels)
+
+    async with async_engine.connect() as conn:
+        # COPY is only exposed by the asyncpg connection itself
+        raw = await conn.get_raw_connection()
+        connection = raw.driver_connection
+        async with connection.transaction():
+            await connection.execute(CREATE_STAGING_SQL)
+            await _copy(connection, "staging_channels", CHANNEL_COLUMNS, channel_rows)
+            await _copy(connection, "staging_programs", PROGRAM_COLUMNS, program_rows)
+            channel_stats = await _merge(connection, UPSERT_CHANNELS_SQL, len(channel_rows))
+            moved = int(
+                (await connection.execute(DELETE_MOVED_PROGRAMS_SQL)).split()[-1]
+            )
+            program_stats = await _merge(connection, UPSERT_PROGRAMS_SQL, len(program_rows))
+            # Report rescheduled programs as updates rather than inserts
+            moved = min(moved, program_stats["inserted"])
+            program_stats["inserted"] -= moved
+            program_stats["updated"] += moved
+            stats = {"channels": channel_stats, "programs": program_stats}
+
+    logger.info(
+        f"Ingested channels {stats['channels']} and programs {stats['programs']} "
+        f"in {time.perf_counter() - started:.2f} seconds."
+    )
+    return stats
+
+
+@traced("load_known_programs")
+async def load_known_programs(
+    channel_meo_ids: Iterable[str], start_date: datetime, end_date: datetime
+) -> Dict[str, Tuple[Optional[datetime], Optional[datetime], Optional[str]]]:
+    """
+    Return the stored (start, end, name) of every live program of the given channels in a window.
+
+    Args:
+        channel_meo_ids: MEO ids of the channels to look up.
+        start_date: Start of the guide window.
+        end_date: End of the guide window.
+
+    Returns:
+        Mapping of meo_program_id to its stored (start_date_time, end_date_time, name).
+    """
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(
+                EPGProgramModel.meo_program_id,
+                EPGProgramModel.start_date_time,
+                EPGProgramModel.end_date_time,
+                EPGProgramModel.name,
+            )
+            .join(EPGChannelModel, EPGProgramModel.channel_id == EPGChannelModel.id)
+            .where(
+                EPGChannelModel.meo_id.in_(list(channel_meo_ids)),
+                EPGProgramModel.removed_at.is_(None),
+                EPGProgramModel.end_date_time > start_date,
+                EPGProgramModel.start_date_time < end_date,
+            )
+        )
+        return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
+
+@traced("mark_removed_programs")
+async def mark_removed_programs(
+    seen_program_ids: Dict[str, Set[str]], start_date: datetime, end_date: datetime
+) -> int:
+    """
+    Flag stored programs that no longer appear in the upstream guide window.
+
+    Args:
+        seen_program_ids: Program ids returned by the guide, keyed by channel meo_id.
+            Only channels present here are considered, so a failed guide request
+            never marks a channel's programs as removed.
+        start_date: Start of the guide window.
+        end_date: End of the guide window.
+
+    Returns:
+        Number of programs marked as removed.
+    """
+    if not seen_program_ids:
+        return 0
+
+    removed = 0
+    now = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as db, db.begin():
+        for meo_id, program_ids in seen_program_ids.items():
+            channel_ids = select(EPGChannelModel.id).where(EPGChannelModel.meo_id == meo_id)
+            result = await db.execute(
+                update(EPGProgramModel)
+                .where(
+                    EPGProgramModel.channel_id.in_(channel_ids.scalar_subquery()),
+                    EPGProgramModel.removed_at.is_(None),
+                    EPGProgramModel.start_date_time >= start_date,
+                    EPGProgramModel.start_date_time < end_date,
+                    EPGProgramModel.meo_program_id.notin_(list(program_ids)),
+                )
+                .values(removed_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            removed += result.rowcount
+
+    if removed:
+        logger.info(f"Marked {removed} programs as removed from the upstream guide.")
+    return removed
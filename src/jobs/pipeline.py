@@ -0,0 +1,392 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from jobs.ingest import bulk_ingest, load_known_programs, mark_removed_programs
+from jobs.programs import (
+    DetailQueue,
+    air_times,
+    iter_program_guide,
+    run_detail_workers,
+    select_program_ids,
+)
+from jobs.sync_runs import empty_stats
+from schemas.epg import EpgChannelSchema
+from schemas.records import ProgramRecord
+from utils.cache import program_cache
+from utils.constants import (
+    DETAIL_WORKERS,
+    GUIDE_BATCH_SIZE,
+    GUIDE_WORKERS,
+    PERSIST_CHUNK_PROGRAMS,
+    PERSIST_INTERVAL,
+    PIPELINE_QUEUE_SIZE,
+)
+from utils.logger import get_logger
+from utils.metrics import sync_rows, sync_stage_seconds
+from utils.meo_client import MeoClient, MeoRequestError
+
+logger = get_logger(__name__)
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+class ChannelProgress:
+    """A channel whose program details are being fetched.
+
+    Finished programs collect here until the persist stage takes them; the
+    channel sits in the persist queue at most once at a time.
+    """
+
+    __slots__ = ("channel", "remaining", "failed", "programs", "queued", "started")
+
+    def __init__(self, channel: EpgChannelSchema, remaining: int):
+        self.channel = channel
+        self.remaining = remaining
+        # Programs whose details could not be fetched
+        self.failed = 0
+        self.programs: List[ProgramRecord] = []
+        self.queued = False
+        self.started = time.perf_counter()
+
+    @property
+    def finished(self) -> bool:
+        return self.remaining == 0
+
+
+async def _guide_stage(
+    client: MeoClient,
+    batches: asyncio.Queue,
+    details: DetailQueue,
+    persist_queue: asyncio.Queue,
+    start_date: datetime,
+    end_date: datetime,
+    window: tuple,
+    incremental: bool,
+):
+    """Fetch guide listings batch by batch and queue each channel's programs by air time."""
+    while True:
+        batch = await batches.get()
+        if batch is _DONE:
+            return
+
+        known_programs = None
+        if incremental:
+            known_programs = await load_known_programs(
+                [channel["meo_id"] for channel in batch], *window
+            )
+
+        channels = {channel["meo_id"]: channel for channel in batch}
+        # Programs are queued while the guide response is still being decoded.
+        # Never block on the persist queue mid-response (the request would time
+        # out), channels with nothing to fetch wait until the response is done.
+        idle = []
+        with sync_stage_seconds.labels("guide").time():
+            try:
+                async for meo_id, listings in iter_program_guide(
+                    client, batch, start_date, end_date
+                ):
+                    channel = channels.pop(meo_id, None)
+                    if channel is None:
+                        continue
+                    program_ids, changed_ids = select_program_ids(listings, known_programs)
+                    starts = air_times(listings)
+                    channel["seen_program_ids"] = set(starts)
+                    progress = ChannelProgress(channel, len(program_ids))
+                    for pid in program_ids:
+                        details.put(starts[pid], pid, pid in changed_ids, progress)
+                    if not program_ids:
+                        idle.append(progress)
+            except MeoRequestError as e:
+                logger.error(f"Guide request failed for {len(channels)} channels: {e}")
+            else:
+                if channels:
+                    logger.warning(f"Guide response had no listing for {len(channels)} channels.")
+
+        for channel in channels.values():
+            # Still persist the channel itself, but neither flag its programs as
+            # removed nor checkpoint its batch, so the next attempt fetches it again
+            channel.pop("seen_program_ids", None)
+            idle.append(ChannelProgress(channel, 0))
+        for progress in idle:
+            progress.queued = True
+            await persist_queue.put(progress)
+
+
+async def _detail_stage(
+    client: MeoClient,
+    details: DetailQueue,
+    persist_queue: asyncio.Queue,
+):
+    """Fetch queued program details with a fixed pool of workers and hand results on as they finish."""
+
+    async def finished(progress: ChannelProgress, program: Optional[ProgramRecord]):
+        if program is not None:
+            progress.programs.append(program)
+        else:
+            progress.failed += 1
+        progress.remaining -= 1
+        if progress.finished:
+            sync_stage_seconds.labels("program_details").observe(
+                time.perf_counter() - progress.started
+            )
+        if not progress.queued and (progress.programs or progress.finished):
+            progress.queued = True
+            await persist_queue.put(progress)
+
+    await run_detail_workers(client, details, finished, DETAIL_WORKERS)
+
+
+class GuideBatchesFailed(Exception):
+    """Some channels got no guide listing or lost program details, so their batches were not checkpointed."""
+
+    def __init__(self, meo_ids: List[str], stats: dict):
+        super().__init__(
+            f"Guide listings or program details missing for batches of {len(meo_ids)} channels"
+        )
+        # Channels of the batches left unfinished, to be fetched again
+        self.meo_ids = meo_ids
+        # Counters of everything that was committed nonetheless
+        self.stats = stats
+
+
+class BatchTracker:
+    """Tracks which guide batches are fully committed and reports each one once.
+
+    Only channels that got a guide listing (and so carry `seen_program_ids`)
+    and the details of all its programs count towards their batch; a batch
+    with any other channel is never checkpointed and is reported by
+    `failed_channels` instead.
+    """
+
+    def __init__(
+        self,
+        batches: List[List[dict]],
+        checkpoint: Optional[Callable[[List[str], dict], Awaitable]] = None,
+    ):
+        self.checkpoint = checkpoint
+        self.members: Dict[int, List[str]] = {}
+        self.remaining: Dict[int, int] = {}
+        self.batch_of: Dict[str, int] = {}
+        self.failed: Set[int] = set()
+        for index, batch in enumerate(batches):
+            self.members[index] = [channel["meo_id"] for channel in batch]
+            self.remaining[index] = len(batch)
+            for channel in batch:
+                self.batch_of[channel["meo_id"]] = index
+
+    async def committed(
+        self, channels: List[dict], stats: dict, incomplete: Set[str] = frozenset()
+    ):
+        """Count committed channels and checkpoint the batches they completed.
+
+        Args:
+            channels: Channels whose programs are all written.
+            stats: Cumulative counters passed to the checkpoint.
+            incomplete: meo_ids of those channels that lost some program details.
+        """
+        finished = []
+        for channel in channels:
+            index = self.batch_of[channel["meo_id"]]
+            if "seen_program_ids" not in channel or channel["meo_id"] in incomplete:
+                self.failed.add(index)
+            self.remaining[index] -= 1
+            if self.remaining[index] == 0 and index not in self.failed:
+                finished.append(index)
+        if self.checkpoint is not None:
+            for index in finished:
+                await self.checkpoint(self.members[index], stats)
+
+    def failed_channels(self) -> List[str]:
+        return [meo_id for index in sorted(self.failed) for meo_id in self.members[index]]
+
+
+async def _persist_stage(
+    persist_queue: asyncio.Queue,
+    window: tuple,
+    incremental: bool,
+    stats: dict,
+    tracker: BatchTracker,
+):
+    """Write finished programs to the database in chunks while the fetch stages keep running.
+
+    Programs are written as they complete rather than once their channel is
+    done, so the near-term guide is stored first; a chunk is written once it
+    holds PERSIST_CHUNK_PROGRAMS programs or PERSIST_INTERVAL seconds after
+    it was started. Programs are only flagged as removed, and batches only
+    checkpointed, once every program of their channels is written.
+    """
+    # Channels already written by an earlier chunk of this run
+    written: Set[str] = set()
+    done = False
+    while not done:
+        parts: Dict[str, EpgChannelSchema] = {}
+        finished: List[EpgChannelSchema] = []
+        # Finished channels some of whose program details failed
+        incomplete: Set[str] = set()
+        programs = 0
+        item = await persist_queue.get()
+        deadline = time.monotonic() + PERSIST_INTERVAL
+        while True:
+            if item is _DONE:
+                done = True
+                break
+            channel = item.channel
+            part = parts.get(channel["meo_id"])
+            if part is None:
+                part = parts[channel["meo_id"]] = {**channel, "programs": []}
+            part["programs"].extend(item.programs)
+            programs += len(item.programs)
+            item.programs = []
+            item.queued = False
+            if item.finished:
+                finished.append(channel)
+                if item.failed:
+                    incomplete.add(channel["meo_id"])
+            if programs >= PERSIST_CHUNK_PROGRAMS:
+                break
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(persist_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+        if not parts:
+            continue
+
+        with sync_stage_seconds.labels("db_write").time():
+            ingested = await bulk_ingest(list(parts.values()))
+            removed = 0
+            if incremental:
+                removed = await mark_removed_programs(
+                    {
+                        channel["meo_id"]: channel["seen_program_ids"]
+                        for channel in finished
+                        if "seen_program_ids" in channel
+                    },
+                    *window,
+                )
+        # A channel written again along with more of its programs comes back unchanged
+        repeated = len(written.intersection(parts))
+        written.update(parts)
+        ingested["channels"]["unchanged"] = max(ingested["channels"]["unchanged"] - repeated, 0)
+        for table, counters in ingested.items():
+            for key, value in counters.items():
+                stats[table][key] += value
+                sync_rows.labels(table, key).inc(value)
+        stats["removed"] += removed
+        sync_rows.labels("programs", "removed").inc(removed)
+        if incomplete:
+            logger.warning(
+                f"Program details failed for {len(incomplete)} channels, not checkpointing their batches."
+            )
+        await tracker.committed(finished, stats, incomplete)
+        # Details fetched for this chunk reach the cache file in one transaction
+        await program_cache.flush()
+        # Committed programs are no longer needed, keep memory bounded to in-flight channels
+        for channel in finished:
+            channel["programs"] = []
+            channel.pop("seen_program_ids", None)
+
+
+async def _run_workers(count: int, factory):
+    """Run `count` copies of a stage until all of them finished."""
+    await asyncio.gather(*(factory() for _ in range(count)))
+
+
+async def run_sync_pipeline(
+    client: MeoClient,
+    channels: List[EpgChannelSchema],
+    start_date: datetime,
+    end_date: datetime,
+    incremental: bool,
+    checkpoint: Optional[Callable[[List[str], dict], Awaitable]] = None,
+    stats: Optional[dict] = None,
+) -> Dict[str, dict]:
+    """
+    Fetch and persist programs for all channels as three overlapping stages.
+
+    Guide listings queue their programs by air time, and a fixed pool of
+    DETAIL_WORKERS fetches details for the earliest queued programs across
+    all channels first; finished programs are written in chunks as they
+    complete. Detail requests for one batch overlap the guide request of the
+    next one, so throughput is only limited by the token bucket.
+
+    Args:
+        client: Client used for MEO requests.
+        channels: Channels (with details) to fetch programs for.
+        start_date: Start of the guide request window (UTC).
+        end_date: End of the guide request window (UTC).
+        incremental: Only fetch details for new or changed programs.
+        checkpoint: Awaited with the channel meo_ids of every guide batch once all
+            of its channels are committed, and the cumulative stats.
+        stats: Counters to continue from, e.g. those of a resumed run.
+
+    Returns:
+        Inserted/updated/unchanged counters per table and the number of programs marked removed.
+
+    Raises:
+        GuideBatchesFailed: Once everything else is committed, if the guide listing or
+            some program details of a channel could not be fetched; their batches are
+            not checkpointed.
+    """
+    # Stored program times are UTC as well, so the request window doubles as the query window
+    window = (start_date, end_date)
+    channel_batches = [
+        channels[i : i + GUIDE_BATCH_SIZE]
+        for i in range(0, len(channels), GUIDE_BATCH_SIZE)
+    ]
+    tracker = BatchTracker(channel_batches, checkpoint)
+    batches: asyncio.Queue = asyncio.Queue()
+    for batch in channel_batches:
+        batches.put_nowait(batch)
+    for _ in range(GUIDE_WORKERS):
+        batches.put_nowait(_DONE)
+
+    details = DetailQueue()
+    persist_queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stats = stats or empty_stats()
+
+    async def guide_stage():
+        await _run_workers(
+            GUIDE_WORKERS,
+            lambda: _guide_stage(
+                client,
+                batches,
+                details,
+                persist_queue,
+                start_date,
+                end_date,
+                window,
+                incremental,
+            ),
+        )
+        # Workers stop once every queued program has been taken
+        details.close(DETAIL_WORKERS)
+
+    async def detail_stage():
+        await _detail_stage(client, details, persist_queue)
+        await persist_queue.put(_DONE)
+
+    tasks = [
+        asyncio.ensure_future(guide_stage()),
+        asyncio.ensure_future(detail_stage()),
+        asyncio.ensure_future(
+            _persist_stage(persist_queue, window, incremental, stats, tracker)
+        ),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # A failing stage would otherwise leave the others blocked on their queues
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    failed = tracker.failed_channels()
+    if failed:
+        raise GuideBatchesFailed(failed, stats)
+    return stats
@@ -1,152 +1,249 @@
 import asyncio
-import aiohttp
-from datetime import datetime, timedelta
-from typing import List
-from schemas.epg import EpgChannelSchema, EpgProgramSchema
-from utils.constants import HEADERS, PROGRAM_DETAILS_URL, PROGRAMS_URL
-from utils.rate_limit import token_bucket
-from utils.logger import logger
-
-
-async def get_correct_dates(
-    date_str: str, start_time_str: str, end_time_str: str
-) -> tuple[datetime, datetime]:
+import itertools
+import math
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from schemas.epg import EpgChannelSchema
+from schemas.records import ProgramRecord, intern
+from utils.cache import program_cache
+from utils.constants import DETAIL_WORKERS
+from utils.logger import EventCounter, get_logger
+from utils.meo_client import MeoClient, MeoRequestError
+from utils.timestamps import listing_times, program_times
+from utils.tracing import span, traced
+
+logger = get_logger(__name__)
+# One progress line per interval instead of one line per program
+fetched_details = EventCounter(logger, "program details fetched from MEO")
+
+
+def program_record(details: dict) -> ProgramRecord:
+    """Build the ingest record of a program from its cached upstream details."""
+    start_datetime, end_datetime = program_times(
+        details["date"], details["startTime"], details["endTime"]
+    )
+    return ProgramRecord(
+        details["id"],
+        start_datetime,
+        end_datetime,
+        details["name"],
+        details["description"],
+        details["imgM"],
+        details["imgL"],
+        details["imgXL"],
+        details["series_id"],
+    )
+
+
+@traced("fetch_program_details")
+async def fetch_program_details(
+    client: MeoClient, program_id: str, refresh: bool = False
+) -> Optional[ProgramRecord]:
+    """Fetch detailed information for a single program, served from the program cache when possible.
+
+    Concurrent calls for the same program share one upstream request, and failed
+    fetches are never cached. `refresh` bypasses the lookup for programs known to have changed.
+    The cache keeps MEO's own date/time strings; they resolve through the memoized
+    `program_times`, so cache hits are not parsed again.
     """
-    Calculate the correct start and end date-time strings, adjusting for programs that span midnight.
+    details = await program_cache.get_or_fetch(
+        f"details:{program_id}",
+        lambda: request_program_details(client, program_id),
+        refresh=refresh,
+        cacheable=lambda details: details is not None,
+    )
+    return program_record(details) if details is not None else None
 
-    Args:
-        date_str: The date string from the API (e.g., "4-3-2025").
-        start_time_str: The start time (e.g., "22:43").
-        end_time_str: The end time (e.g., "00:43").
 
-    Returns:
-        Tuple of (start_date_time, end_date_time) datetime objects.
+async def request_program_details(client: MeoClient, program_id: str) -> Optional[dict]:
+    """Request detailed information for a single program from MEO.
+
+    Returns None if the request failed after retries or the program has no valid
+    times, so that a transient failure never overwrites a stored program with an
+    empty record.
+    """
+    logger.debug(f"Fetching details for program {program_id}...")
+    try:
+        program_data = await client.get_program_details(program_id)
+    except MeoRequestError as e:
+        logger.error(f"Failed to fetch program details: {e}")
+        return None
+    p = program_data.get("d") if isinstance(program_data, dict) else None
+    if not isinstance(p, dict):
+        logger.error(f"Invalid program details response for {program_id}.")
+        return None
+    details = {
+        "id": str(p.get("uniqueId", program_id)),
+        "date": intern(p.get("date") or ""),
+        "startTime": intern(p.get("startTime") or ""),
+        "endTime": intern(p.get("endTime") or ""),
+        "name": intern(p.get("progName", "")),
+        "description": p.get("description", ""),
+        "imgM": intern(p.get("progImageM", "")),
+        "imgL": intern(p.get("progImageL", "")),
+        "imgXL": intern(p.get("progImageXL", "")),
+        "series_id": intern(p.get("seriesID", "")),
+    }
+    try:
+        program_times(details["date"], details["startTime"], details["endTime"])
+    except ValueError:
+        logger.error(f"Invalid program details for {program_id}.")
+        return None
+    fetched_details.add()
+    return details
+
+
+def is_program_changed(
+    listing: dict,
+    known: Tuple[Optional[datetime], Optional[datetime], Optional[str]],
+    times: Optional[Tuple[datetime, datetime]] = None,
+) -> bool:
     """
-    # Parse the date
-    date_obj = datetime.strptime(date_str, "%d-%m-%Y")
-    # Parse start and end times into time objects
-    start_time = datetime.strptime(start_time_str, "%H:%M").time()
-    end_time = datetime.strptime(end_time_str, "%H:%M").time()
+    Compare a guide listing entry against the stored version of the same program.
 
-    # Construct the start datetime
-    start_datetime = datetime.combine(date_obj, start_time)
+    Only the fields the guide actually returned are compared, so a listing without
+    times or a title never forces a detail fetch on its own.
+
+    Args:
+        listing: Program entry from getProgramsFromChannels.
+        known: Stored (start_date_time, end_date_time, name) of the program.
+        times: The listing's UTC (start, end) if already normalized.
 
-    # Check if the end time is before the start time (indicating it's on the next day)
-    if end_time < start_time:
-        end_datetime = datetime.combine(date_obj + timedelta(days=1), end_time)
-    else:
-        end_datetime = datetime.combine(date_obj, end_time)
+    Returns:
+        True if the program must be fetched again.
+    """
+    known_start, known_end, known_name = known
+    times = times or listing_times(listing)
+    if times is not None and times != (known_start, known_end):
+        return True
 
-    return start_datetime, end_datetime
+    name = listing.get("title")
+    return bool(name) and name != known_name
 
 
-async def fetch_program_details(
-    session: aiohttp.ClientSession, program_id: str
-) -> EpgProgramSchema:
-    """Fetch detailed information for a single program."""
-    await token_bucket.acquire()  # Ensure request is rate-limited
-    logger.info(f"Fetching details for program {program_id}...")
-    data = {"service": "programdetail", "programID": program_id, "accountID": ""}
-    try:
-        async with session.post(
-            PROGRAM_DETAILS_URL, json=data, headers=HEADERS
-        ) as response:
-            if response.status != 200:
-                logger.error(f"Failed to fetch program details: {response.status}")
-                return {
-                    "id": program_id,
-                    "start_date_time": "",
-                    "end_date_time": "",
-                    "name": "",
-                    "description": "",
-                    "imgM": "",
-                    "imgL": "",
-                    "imgXL": "",
-                    "series_id": "",
-                }
-            program_data = await response.json()
-            p = program_data.get("d", {})
-            start_datetime, end_datetime = await get_correct_dates(
-                p.get("date", ""), p.get("startTime", ""), p.get("endTime", "")
-            )
-            return {
-                "id": str(p.get("uniqueId", program_id)),
-                "start_date_time": start_datetime.strftime("%d-%m-%Y %H:%M"),
-                "end_date_time": end_datetime.strftime("%d-%m-%Y %H:%M"),
-                "name": p.get("progName", ""),
-                "description": p.get("description", ""),
-                "imgM": p.get("progImageM", ""),
-                "imgL": p.get("progImageL", ""),
-                "imgXL": p.get("progImageXL", ""),
-                "series_id": p.get("seriesID", ""),
-            }
-    except aiohttp.ClientError as e:
-        logger.error(f"Request failed: {e}")
-        return {
-            "id": program_id,
-            "start_date_time": "",
-            "end_date_time": "",
-            "name": "",
-            "description": "",
-            "imgM": "",
-            "imgL": "",
-            "imgXL": "",
-            "series_id": "",
-        }
-
-
-async def fetch_programs_async(
-    session: aiohttp.ClientSession,
+async def iter_program_guide(
+    client: MeoClient,
     channels: List[EpgChannelSchema],
     start_date: datetime,
     end_date: datetime,
-) -> List[EpgChannelSchema]:
-    """Asynchronously fetch programs with full details for a batch of channels and return the channels with programs attached."""
-    if not channels:
-        return []
-
-    # Limit to a maximum of 30 channels per request
-    max_channels_per_request = 30
-    if len(channels) > max_channels_per_request:
-        logger.warning(
-            f"Number of channels exceeds the limit. Only the first {max_channels_per_request} channels will be processed."
-        )
-        channels = channels[:max_channels_per_request]
-
-    await token_bucket.acquire()  # Rate-limit the request
+) -> AsyncIterator[Tuple[str, List[dict]]]:
+    """
+    Stream the guide listing (getProgramsFromChannels) for up to 30 channels.
+
+    Each channel is yielded as soon as its part of the response has been
+    decoded, so work on it can start while the rest is still downloading.
+
+    Yields:
+        (channel meo_id, program listing entries) for every requested channel in the response.
+
+    Raises:
+        MeoRequestError: If the request still fails after retries or breaks off mid-stream.
+    """
     logger.info(f"Fetching programs for {len(channels)} channels...")
-    data = {
-        "service": "channelsguide",
-        "channels": [channel["meo_id"] for channel in channels],
-        "dateStart": start_date.isoformat() + "Z",
-        "dateEnd": end_date.isoformat() + "Z",
-        "accountID": "",
+    requested = {channel["meo_id"] for channel in channels}
+    # Not activated: between yields the consumer's own spans would nest under it
+    with span("fetch_program_guide", activate=False, channels=len(requested)):
+        async for ch in client.stream_programs(list(requested), start_date, end_date):
+            if isinstance(ch, dict) and ch.get("sigla") in requested:
+                yield ch["sigla"], [p for p in ch.get("programs") or [] if "uniqueId" in p]
+
+
+def select_program_ids(
+    listings: List[dict], known_programs: Optional[Dict[str, tuple]] = None
+) -> Tuple[List[str], Set[str]]:
+    """
+    Decide which programs of a channel listing need their details fetched.
+
+    Args:
+        listings: Program entries of one channel from the guide.
+        known_programs: Stored programs of the window (delta mode), or None to fetch everything.
+
+    Returns:
+        Tuple of (program ids to fetch, ids of those that changed upstream and
+        therefore must not be served from the cache).
+    """
+    program_ids = [str(p["uniqueId"]) for p in listings]
+    if known_programs is None:
+        return program_ids, set()
+
+    changed_ids = {
+        pid
+        for pid, p in zip(program_ids, listings)
+        if pid in known_programs and is_program_changed(p, known_programs[pid])
     }
-    async with session.post(PROGRAMS_URL, json=data, headers=HEADERS) as response:
-        response.raise_for_status()
-        programs_data = await response.json()
-        if (
-            not programs_data
-            or "d" not in programs_data
-            or "channels" not in programs_data["d"]
-        ):
-            logger.error("Failed to fetch programs or invalid response.")
-            return channels  # Return channels without programs
-
-        # Organize programs by channel
-        channel_programs = {channel["meo_id"]: [] for channel in channels}
-        for ch in programs_data["d"]["channels"]:
-            meo_id = ch["sigla"]
-            if meo_id in channel_programs:
-                program_ids = [
-                    p["uniqueId"] for p in ch.get("programs", []) if "uniqueId" in p
-                ]
-                tasks = [fetch_program_details(session, pid) for pid in program_ids]
-                programs = await asyncio.gather(*tasks)
-                channel_programs[meo_id] = programs
-
-        # Attach programs to their respective channels
-        for channel in channels:
-            channel["programs"] = channel_programs.get(channel["meo_id"], [])
-
-        return channels
+    return [
+        pid for pid in program_ids if pid not in known_programs or pid in changed_ids
+    ], changed_ids
+
+
+def air_times(listings: List[dict]) -> Dict[str, float]:
+    """Start of every listed program as a POSIX timestamp; programs without valid times sort last."""
+    starts = {}
+    for listing in listings:
+        times = listing_times(listing)
+        starts[str(listing["uniqueId"])] = times[0].timestamp() if times else math.inf
+    return starts
+
+
+class DetailQueue:
+    """Program detail fetches waiting for a worker, earliest air time first.
+
+    Entries are plain tuples, so a week of guide costs a few megabytes of queue
+    instead of one parked coroutine per program.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        # Tie-breaker, so owners are never compared
+        self._order = itertools.count()
+
+    def put(self, air_time: float, program_id: str, refresh: bool, owner: Any = None):
+        """
+        Queue one program.
+
+        Args:
+            air_time: Start of the program (POSIX timestamp), its priority.
+            program_id: MEO id of the program.
+            refresh: Bypass the program cache, for programs known to have changed.
+            owner: Passed back with the result, e.g. the channel the program belongs to.
+        """
+        self._queue.put_nowait((air_time, next(self._order), program_id, refresh, owner))
+
+    def close(self, workers: int):
+        """Stop `workers` workers once everything queued so far has been taken."""
+        for _ in range(workers):
+            self._queue.put_nowait((math.inf, next(self._order), None, False, None))
+
+    async def get(self) -> Tuple[Optional[str], bool, Any]:
+        _, _, program_id, refresh, owner = await self._queue.get()
+        return program_id, refresh, owner
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+async def run_detail_workers(
+    client: MeoClient,
+    queue: DetailQueue,
+    on_result: Callable[[Any, Optional[ProgramRecord]], Awaitable],
+    workers: int = DETAIL_WORKERS,
+):
+    """
+    Fetch queued program details with a fixed number of workers until the queue is closed.
+
+    Args:
+        client: Client used for MEO requests.
+        queue: Programs to fetch; close it with the same number of workers.
+        on_result: Awaited with the owner and the program (None if fetching it failed)
+            of every queued program, in completion order.
+        workers: Concurrent detail fetches.
+    """
+
+    async def worker():
+        while True:
+            program_id, refresh, owner = await queue.get()
+            if program_id is None:
+                return
+            await on_result(owner, await fetch_program_details(client, program_id, refresh))
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
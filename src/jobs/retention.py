@@ -0,0 +1,206 @@
+import re
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy import text
+from utils.constants import (
+    PROGRAM_PARTITIONS_AHEAD,
+    PROGRAM_RETENTION_DAYS,
+    RETENTION_DELETE_BATCH,
+    RETENTION_DETACH_ONLY,
+)
+from utils.db import async_engine
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PARTITION_NAME = re.compile(r"^programs_p(\d{8})$")
+
+LIST_PARTITIONS_SQL = """
+SELECT child.relname
+FROM pg_inherits
+JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE parent.relname = 'programs'
+"""
+
+# Deletes go through the unique key so one statement can span partitions, and
+# are bounded so no transaction holds locks or bloats WAL for long
+DELETE_BATCH_SQL = """
+DELETE FROM {table}
+WHERE (meo_program_id, start_date_time) IN (
+    SELECT meo_program_id, start_date_time FROM {table}
+    WHERE {condition}
+    LIMIT :batch
+)
+"""
+
+
+def partition_name(day: date) -> str:
+    return f"programs_p{day:%Y%m%d}"
+
+
+def _day(value: datetime) -> date:
+    """UTC day of a datetime (partitions are cut at UTC midnight)."""
+    if not isinstance(value, datetime):
+        return value
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def _bound(day: date) -> str:
+    """Partition bound literal for UTC midnight of `day`."""
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).isoformat()
+
+
+def create_partition_sql(day: date) -> str:
+    """DDL of the partition holding programs that start on `day` (UTC)."""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF programs "
+        f"FOR VALUES FROM ('{_bound(day)}') TO ('{_bound(day + timedelta(days=1))}')"
+    )
+
+
+async def _is_partitioned() -> bool:
+    async with async_engine.connect() as conn:
+        kind = await conn.scalar(
+            text("SELECT relkind FROM pg_class WHERE relname = 'programs'")
+        )
+    return kind == "p"
+
+
+async def _partition_days() -> List[date]:
+    async with async_engine.connect() as conn:
+        names = (await conn.execute(text(LIST_PARTITIONS_SQL))).scalars().all()
+    days = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            days.append(datetime.strptime(match.group(1), "%Y%m%d").date())
+    return sorted(days)
+
+
+async def ensure_partitions(start: datetime, days: int = PROGRAM_PARTITIONS_AHEAD) -> int:
+    """
+    Create the daily program partitions for `days` days starting at `start`.
+
+    Args:
+        start: First day that needs a partition.
+        days: Number of consecutive days to cover.
+
+    Returns:
+        Number of partitions that were created.
+    """
+    if not await _is_partitioned():
+        return 0
+
+    existing = set(await _partition_days())
+    created = 0
+    first = _day(start)
+    for offset in range(days):
+        day = first + timedelta(days=offset)
+        if day in existing:
+            continue
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(text(create_partition_sql(day)))
+            created += 1
+        except Exception as e:
+            # Usually rows for that day already sit in the default partition
+            logger.error(f"Could not create partition {partition_name(day)}: {e}")
+    if created:
+        logger.info(f"Created {created} program partitions from {first}.")
+    return created
+
+
+async def expire_partitions(
+    cutoff: datetime, detach_only: bool = RETENTION_DETACH_ONLY
+) -> List[str]:
+    """
+    Detach (and unless `detach_only`, drop) every daily partition that ends before `cutoff`.
+
+    Args:
+        cutoff: Programs starting before this day are expired.
+        detach_only: Keep detached partitions as standalone tables, e.g. for archiving.
+
+    Returns:
+        Names of the expired partitions.
+    """
+    expired = []
+    for day in await _partition_days():
+        if day + timedelta(days=1) > _day(cutoff):
+            break
+        name = partition_name(day)
+        async with async_engine.begin() as conn:
+            await conn.execute(text(f"ALTER TABLE programs DETACH PARTITION {name}"))
+            if not detach_only:
+                await conn.execute(text(f"DROP TABLE {name}"))
+        expired.append(name)
+    if expired:
+        action = "Detached" if detach_only else "Dropped"
+        logger.info(f"{action} {len(expired)} expired program partitions: {expired}")
+    return expired
+
+
+async def delete_in_batches(
+    table: str, condition: str, params: dict, batch: int = RETENTION_DELETE_BATCH
+) -> int:
+    """
+    Delete matching rows in transactions of at most `batch` rows.
+
+    Args:
+        table: Table (or partition) to delete from.
+        condition: SQL condition selecting the rows to delete.
+        params: Bind parameters used by `condition`.
+        batch: Maximum rows deleted per transaction.
+
+    Returns:
+        Number of deleted rows.
+    """
+    statement = text(DELETE_BATCH_SQL.format(table=table, condition=condition))
+    deleted = 0
+    while True:
+        async with async_engine.begin() as conn:
+            result = await conn.execute(statement, {**params, "batch": batch})
+        deleted += result.rowcount
+        if result.rowcount < batch:
+            return deleted
+
+
+async def run_retention(now: Optional[datetime] = None) -> dict:
+    """
+    Remove programs older than PROGRAM_RETENTION_DAYS and pre-create upcoming partitions.
+
+    Whole days are removed by dropping their partition. Only rows that live
+    outside the daily partitions (the default partition, or an unpartitioned
+    legacy table) and programs removed upstream long ago are deleted row by
+    row, in bounded batches.
+
+    Returns:
+        Counters for the expired partitions, deleted rows and created partitions.
+    """
+    started = time.perf_counter()
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=PROGRAM_RETENTION_DAYS)
+    params = {"cutoff": cutoff}
+    stats = {"partitions_expired": 0, "rows_deleted": 0, "partitions_created": 0}
+
+    if await _is_partitioned():
+        stats["partitions_expired"] = len(await expire_partitions(cutoff))
+        stats["rows_deleted"] += await delete_in_batches(
+            "programs_default", "end_date_time < :cutoff", params
+        )
+        stats["partitions_created"] = await ensure_partitions(now)
+    else:
+        stats["rows_deleted"] += await delete_in_batches(
+            "programs", "end_date_time < :cutoff", params
+        )
+    stats["rows_deleted"] += await delete_in_batches(
+        "programs", "removed_at < :cutoff", params
+    )
+
+    logger.info(
+        f"Program retention finished in {time.perf_counter() - started:.2f} seconds: {stats}"
+    )
+    return stats
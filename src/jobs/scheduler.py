@@ -0,0 +1,133 @@
+# Horizon-aware guide refresh: the near term often, the rest of the week rarely
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from jobs.channels import fetch_channels_async
+from jobs.epg import get_meo_epg
+from utils.constants import (
+    CHANNEL_LIST_MAX_AGE_HOURS,
+    REFRESH_CHANNEL_GROUPS,
+    REFRESH_HORIZONS,
+)
+from utils.logger import get_logger
+from utils.meo_client import MeoClient
+
+logger = get_logger(__name__)
+
+
+class Horizon(NamedTuple):
+    name: str
+    start_hours: int
+    end_hours: int
+    interval_minutes: int
+
+
+class HorizonScheduler:
+    def __init__(self, horizons: List[Horizon], groups: int):
+        """Initialize the scheduler.
+
+        Args:
+            horizons: Windows of the guide and how often each is refreshed.
+            groups: Number of channel groups each horizon's interval is split into.
+        """
+        self.horizons = {horizon.name: horizon for horizon in horizons}
+        self.groups = groups
+        self.next_group: Dict[str, int] = {horizon.name: 0 for horizon in horizons}
+        self.channels: Optional[List[dict]] = None
+        self.channels_fetched_at = 0.0
+        self.runs = 0
+        self.waits = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created lazily so it binds to the server's event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def get_channels(self) -> List[dict]:
+        """Return the channel list, refetching grid and channel details once they are stale."""
+        age = time.monotonic() - self.channels_fetched_at
+        if self.channels is None or age > CHANNEL_LIST_MAX_AGE_HOURS * 3600:
+            async with MeoClient() as client:
+                channels = await fetch_channels_async(client)
+            if channels:
+                self.channels = sorted(channels, key=lambda channel: channel["meo_id"])
+                self.channels_fetched_at = time.monotonic()
+            elif self.channels is None:
+                return []
+        return self.channels
+
+    def group(self, channels: List[dict], index: int) -> List[dict]:
+        """Every `groups`-th channel starting at `index`, as copies the sync may annotate."""
+        return [dict(channel) for channel in channels[index :: self.groups]]
+
+    def window(self, horizon: Horizon, now: datetime) -> Tuple[datetime, datetime]:
+        """UTC window of a horizon, aligned to the hour so a retried run resumes the same one."""
+        hour = now.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        return (
+            hour + timedelta(hours=horizon.start_hours),
+            hour + timedelta(hours=horizon.end_hours),
+        )
+
+    async def refresh(self, name: str):
+        """Sync the next channel group of a horizon; runs never overlap."""
+        horizon = self.horizons[name]
+        if self.lock.locked():
+            self.waits += 1
+            logger.info(f"Refresh of {name} waits for the running sync to finish.")
+        async with self.lock:
+            channels = await self.get_channels()
+            if not channels:
+                logger.error(f"No channels available, skipping the {name} refresh.")
+                return
+            index = self.next_group[name]
+            start_date, end_date = self.window(horizon, datetime.now(timezone.utc))
+            scope = f"{name}:{index + 1}/{self.groups}"
+            logger.info(f"Refreshing {scope} from {start_date} to {end_date}.")
+            try:
+                await get_meo_epg(
+                    start_date=start_date,
+                    end_date=end_date,
+                    channels=self.group(channels, index),
+                    scope=scope,
+                )
+            except Exception as e:
+                # The same group is retried on the next tick
+                logger.error(f"Refresh of {scope} failed: {e}")
+                return
+            self.next_group[name] = (index + 1) % self.groups
+            self.runs += 1
+
+    def schedule(self, scheduler: AsyncIOScheduler):
+        """Add one interval job per horizon, ticking once per channel group."""
+        now = datetime.now(timezone.utc)
+        for position, horizon in enumerate(self.horizons.values()):
+            scheduler.add_job(
+                self.refresh,
+                "interval",
+                args=[horizon.name],
+                id=f"refresh-{horizon.name}",
+                seconds=horizon.interval_minutes * 60 / self.groups,
+                # Fill every horizon right after startup, nearest first
+                next_run_time=now + timedelta(seconds=position),
+                max_instances=1,
+                coalesce=True,
+                misfire_grace_time=None,
+            )
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "waits": self.waits,
+            "next_group": dict(self.next_group),
+            "channels": len(self.channels or []),
+        }
+
+
+refresh_scheduler = HorizonScheduler(
+    [Horizon(*horizon) for horizon in REFRESH_HORIZONS], REFRESH_CHANNEL_GROUPS
+)
@@ -0,0 +1,113 @@
+# Bookkeeping for resumable syncs: one sync_runs row per run, checkpointed per batch
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy import String, cast, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from models.sync import SyncRunModel
+from utils.constants import SYNC_RESUME_MAX_AGE_HOURS
+from utils.db import AsyncSessionLocal
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def empty_stats() -> dict:
+    return {
+        "channels": {"inserted": 0, "updated": 0, "unchanged": 0},
+        "programs": {"inserted": 0, "updated": 0, "unchanged": 0},
+        "removed": 0,
+    }
+
+
+async def start_sync_run(
+    window_start: datetime, window_end: datetime, scope: str = "full"
+) -> SyncRunModel:
+    """
+    Resume the latest unfinished run of the same window and scope, or record a new one.
+
+    Args:
+        window_start: Start of the synced guide window.
+        window_end: End of the synced guide window.
+        scope: Slice of the guide being synced, e.g. "full" or "today:2/4".
+
+    Returns:
+        The run; `completed_channels` lists the channels that need no work.
+    """
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db, db.begin():
+        run = await db.scalar(
+            select(SyncRunModel)
+            .where(
+                SyncRunModel.window_start == window_start,
+                SyncRunModel.window_end == window_end,
+                SyncRunModel.scope == scope,
+                SyncRunModel.status != "completed",
+                SyncRunModel.started_at
+                > now - timedelta(hours=SYNC_RESUME_MAX_AGE_HOURS),
+            )
+            .order_by(SyncRunModel.id.desc())
+            .limit(1)
+            .with_for_update()
+        )
+        if run is not None:
+            run.status = "running"
+            run.attempts += 1
+            run.updated_at = now
+            run.error = None
+            logger.info(
+                f"Resuming sync run {run.id} (attempt {run.attempts}) after "
+                f"{run.completed_batches} batches and {len(run.completed_channels)} channels."
+            )
+        else:
+            run = SyncRunModel(
+                scope=scope,
+                window_start=window_start,
+                window_end=window_end,
+                completed_channels=[],
+                stats=empty_stats(),
+            )
+            db.add(run)
+            await db.flush()
+            logger.info(f"Started sync run {run.id} ({scope}).")
+    return run
+
+
+async def checkpoint_batch(run_id: int, channel_meo_ids: Iterable[str], stats: dict):
+    """
+    Record a fully committed batch so a restarted run can skip its channels.
+
+    Args:
+        run_id: Id of the running sync.
+        channel_meo_ids: MEO ids of the channels in the batch.
+        stats: Cumulative counters of the run so far.
+    """
+    async with AsyncSessionLocal() as db, db.begin():
+        await db.execute(
+            update(SyncRunModel)
+            .where(SyncRunModel.id == run_id)
+            .values(
+                completed_batches=SyncRunModel.completed_batches + 1,
+                completed_channels=func.array_cat(
+                    SyncRunModel.completed_channels,
+                    cast(list(channel_meo_ids), ARRAY(String)),
+                ),
+                stats=stats,
+                updated_at=datetime.utcnow(),
+            )
+        )
+
+
+async def finish_sync_run(
+    run_id: int, status: str, stats: Optional[dict] = None, error: Optional[str] = None
+):
+    """Mark a run as completed or failed."""
+    values = {"status": status, "error": error, "updated_at": datetime.utcnow()}
+    if status == "completed":
+        values["finished_at"] = values["updated_at"]
+    if stats is not None:
+        values["stats"] = stats
+    async with AsyncSessionLocal() as db, db.begin():
+        await db.execute(
+            update(SyncRunModel).where(SyncRunModel.id == run_id).values(**values)
+        )
+    logger.info(f"Sync run {run_id} {status}.")
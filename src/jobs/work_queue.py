@@ -0,0 +1,277 @@
+# Postgres job queue for distributed syncs: one sync_jobs row per guide batch
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import func, select, update
+from models.sync import SyncJobModel, SyncRunModel
+from utils.constants import GUIDE_BATCH_SIZE, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+from utils.db import AsyncSessionLocal
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Channel keys filled in by the sync itself, not stored with the job
+_TRANSIENT_KEYS = ("programs", "seen_program_ids")
+
+
+def _lease_expiry():
+    # Database time, so the lease means the same on every node
+    return func.now() + func.make_interval(0, 0, 0, 0, 0, 0, JOB_LEASE_SECONDS)
+
+
+def _add_stats(total: dict, stats: dict) -> dict:
+    """Sum two stats dicts as produced by empty_stats()."""
+    result = {"removed": total["removed"] + stats["removed"]}
+    for table in ("channels", "programs"):
+        result[table] = {
+            key: total[table][key] + stats[table][key] for key in total[table]
+        }
+    return result
+
+
+async def enqueue_sync(run: SyncRunModel, channels: List[dict], incremental: bool) -> int:
+    """
+    Queue one job per guide batch of a run's pending channels.
+
+    A resumed run whose jobs are still queued or running is left to the workers.
+
+    Args:
+        run: The run, as returned by start_sync_run.
+        channels: Channels not yet committed by the run.
+        incremental: Only fetch details for new or changed programs.
+
+    Returns:
+        Number of jobs queued.
+    """
+    async with AsyncSessionLocal() as db, db.begin():
+        outstanding = await db.scalar(
+            select(func.count(SyncJobModel.id)).where(
+                SyncJobModel.run_id == run.id,
+                SyncJobModel.status.in_(("queued", "running")),
+            )
+        )
+        if outstanding:
+            logger.info(f"Sync run {run.id} still has {outstanding} jobs in the queue.")
+            return 0
+        # Failed jobs of an earlier attempt are replaced by the new ones
+        await db.execute(
+            update(SyncJobModel)
+            .where(SyncJobModel.run_id == run.id, SyncJobModel.status == "failed")
+            .values(status="superseded")
+        )
+
+        for i in range(0, len(channels), GUIDE_BATCH_SIZE):
+            batch = [
+                {key: value for key, value in channel.items() if key not in _TRANSIENT_KEYS}
+                for channel in channels[i : i + GUIDE_BATCH_SIZE]
+            ]
+            db.add(
+                SyncJobModel(
+                    run_id=run.id,
+                    window_start=run.window_start,
+                    window_end=run.window_end,
+                    channels=batch,
+                    incremental=incremental,
+                )
+            )
+    queued = -(-len(channels) // GUIDE_BATCH_SIZE)
+    logger.info(f"Queued {queued} jobs for sync run {run.id}.")
+    return queued
+
+
+async def claim_job(worker_id: str) -> Optional[SyncJobModel]:
+    """Lease the oldest queued job; concurrent workers skip each other's rows."""
+    candidate = (
+        select(SyncJobModel.id)
+        .where(SyncJobModel.status == "queued")
+        .order_by(SyncJobModel.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    async with AsyncSessionLocal() as db, db.begin():
+        return await db.scalar(
+            update(SyncJobModel)
+            .where(SyncJobModel.id == candidate)
+            .values(
+                status="running",
+                attempts=SyncJobModel.attempts + 1,
+                lease_owner=worker_id,
+                lease_expires_at=_lease_expiry(),
+                heartbeat_at=func.now(),
+            )
+            .returning(SyncJobModel)
+        )
+
+
+async def heartbeat(job_id: int, worker_id: str) -> bool:
+    """Extend a job's lease; False if the lease was lost to another worker."""
+    async with AsyncSessionLocal() as db, db.begin():
+        renewed = await db.scalar(
+            update(SyncJobModel)
+            .where(
+                SyncJobModel.id == job_id,
+                SyncJobModel.lease_owner == worker_id,
+                SyncJobModel.status == "running",
+            )
+            .values(lease_expires_at=_lease_expiry(), heartbeat_at=func.now())
+            .returning(SyncJobModel.id)
+        )
+    return renewed is not None
+
+
+async def requeue_expired_leases() -> Tuple[int, bool]:
+    """Requeue running jobs whose worker stopped renewing the lease.
+
+    Jobs that already used up JOB_MAX_ATTEMPTS are failed instead.
+
+    Returns:
+        Number of jobs requeued or failed, and whether a run this closed changed
+        the stored guide, so readers need a new generation.
+    """
+    async with AsyncSessionLocal() as db, db.begin():
+        expired = (
+            await db.scalars(
+                select(SyncJobModel)
+                .where(
+                    SyncJobModel.status == "running",
+                    SyncJobModel.lease_expires_at < func.now(),
+                )
+                .with_for_update(skip_locked=True)
+            )
+        ).all()
+        for job in expired:
+            exhausted = job.attempts >= JOB_MAX_ATTEMPTS
+            logger.warning(
+                f"Lease of job {job.id} held by {job.lease_owner} expired "
+                f"({'failing' if exhausted else 'requeueing'} after {job.attempts} attempts)."
+            )
+            job.status = "failed" if exhausted else "queued"
+            job.error = f"Lease expired (held by {job.lease_owner})"
+            job.lease_owner = None
+            job.lease_expires_at = None
+    changed = False
+    for job in expired:
+        if job.status == "failed":
+            changed = await _finish_run_if_drained(job.run_id) or changed
+    return len(expired), changed
+
+
+async def complete_job(job: SyncJobModel, worker_id: str, stats: dict) -> bool:
+    """
+    Record a finished job and checkpoint its channels on the run.
+
+    Args:
+        job: The claimed job.
+        worker_id: The worker holding the lease.
+        stats: Counters of this job alone.
+
+    Returns:
+        True if this closed the run and the run changed the stored guide, so
+        readers need a new generation.
+    """
+    meo_ids = [channel["meo_id"] for channel in job.channels]
+    async with AsyncSessionLocal() as db, db.begin():
+        done = await db.scalar(
+            update(SyncJobModel)
+            .where(
+                SyncJobModel.id == job.id,
+                SyncJobModel.lease_owner == worker_id,
+                SyncJobModel.status == "running",
+            )
+            .values(
+                status="done",
+                finished_at=func.now(),
+                lease_owner=None,
+                lease_expires_at=None,
+                stats=stats,
+                error=None,
+            )
+            .returning(SyncJobModel.id)
+        )
+        if done is None:
+            # The lease was lost; whoever holds it now records the batch
+            logger.warning(f"Job {job.id} finished after its lease was lost.")
+            return False
+
+        # Completions of one run are serialized on the run row
+        run = await db.scalar(
+            select(SyncRunModel).where(SyncRunModel.id == job.run_id).with_for_update()
+        )
+        run.stats = _add_stats(run.stats, stats)
+        run.completed_batches += 1
+        run.completed_channels = [*run.completed_channels, *meo_ids]
+        run.updated_at = datetime.utcnow()
+    return await _finish_run_if_drained(job.run_id)
+
+
+async def fail_job(
+    job: SyncJobModel, worker_id: str, error: str, stats: Optional[dict] = None
+) -> bool:
+    """
+    Give a job back to the queue, or fail it once it used up its attempts.
+
+    Args:
+        job: The claimed job.
+        worker_id: The worker holding the lease.
+        error: What went wrong.
+        stats: Counters of whatever the attempt committed before failing.
+
+    Returns:
+        True if failing the job closed its run and the run changed the stored
+        guide, so readers need a new generation.
+    """
+    status = "failed" if job.attempts >= JOB_MAX_ATTEMPTS else "queued"
+    async with AsyncSessionLocal() as db, db.begin():
+        failed = await db.scalar(
+            update(SyncJobModel)
+            .where(SyncJobModel.id == job.id, SyncJobModel.lease_owner == worker_id)
+            .values(status=status, lease_owner=None, lease_expires_at=None, error=error)
+            .returning(SyncJobModel.id)
+        )
+        if failed is not None and stats is not None:
+            run = await db.scalar(
+                select(SyncRunModel).where(SyncRunModel.id == job.run_id).with_for_update()
+            )
+            run.stats = _add_stats(run.stats, stats)
+            run.updated_at = datetime.utcnow()
+    logger.error(f"Job {job.id} attempt {job.attempts} failed ({status}): {error}")
+    if status == "failed":
+        return await _finish_run_if_drained(job.run_id)
+    return False
+
+
+async def _finish_run_if_drained(run_id: int) -> bool:
+    """Close the run once none of its jobs is queued or running.
+
+    Returns:
+        True if this closed the run and its jobs changed the stored guide. Also
+        when some jobs failed: what the others committed must still be published.
+    """
+    async with AsyncSessionLocal() as db, db.begin():
+        run = await db.scalar(
+            select(SyncRunModel).where(SyncRunModel.id == run_id).with_for_update()
+        )
+        if run is None or run.status != "running":
+            return False
+        statuses = (
+            await db.scalars(
+                select(SyncJobModel.status).where(SyncJobModel.run_id == run_id)
+            )
+        ).all()
+        if any(status in ("queued", "running") for status in statuses):
+            return False
+        failed = statuses.count("failed")
+        run.status = "failed" if failed else "completed"
+        run.error = f"{failed} jobs failed" if failed else None
+        run.updated_at = datetime.utcnow()
+        if not failed:
+            run.finished_at = run.updated_at
+        stats = run.stats
+    logger.info(f"Sync run {run_id} {run.status}: {stats}")
+    return bool(
+        stats["removed"]
+        or any(
+            stats[table]["inserted"] or stats[table]["updated"]
+            for table in ("channels", "programs")
+        )
+    )
@@ -0,0 +1,181 @@
+# Sync worker: claims guide batches from the sync_jobs queue and runs them
+import argparse
+import asyncio
+import os
+import signal
+import socket
+from typing import Optional
+from jobs.pipeline import GuideBatchesFailed, run_sync_pipeline
+from jobs.work_queue import (
+    claim_job,
+    complete_job,
+    fail_job,
+    heartbeat,
+    requeue_expired_leases,
+)
+from models.sync import SyncJobModel
+from utils.constants import (
+    JOB_HEARTBEAT_SECONDS,
+    JOB_LEASE_SECONDS,
+    SHARED_BUDGET_BLOCK,
+    SHARED_REQUESTS_PER_SECOND,
+    WORKER_CONCURRENCY,
+    WORKER_POLL_SECONDS,
+)
+from utils.db import async_engine, initialize_database
+from utils.generation import bump_generation
+from utils.logger import get_logger
+from utils.meo_client import MeoClient
+from utils.rate_budget import SharedRateBudget
+from utils.rate_limit import rate_limit_stats, token_bucket, use_shared_budget
+from utils.tracing import trace_run
+
+logger = get_logger(__name__)
+
+
+class SyncWorker:
+    def __init__(self, worker_id: str, concurrency: int):
+        """Initialize the worker.
+
+        Args:
+            worker_id: Lease owner name, unique across nodes.
+            concurrency: Jobs processed at the same time.
+        """
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.stopping = asyncio.Event()
+        self.completed = 0
+        self.failed = 0
+
+    async def _keep_lease(self, job: SyncJobModel, task: asyncio.Task):
+        """Renew the lease while `task` runs and cancel it once the lease is lost."""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                renewed = await heartbeat(job.id, self.worker_id)
+            except Exception as e:
+                # A transient database error is survivable until the lease runs out
+                logger.warning(f"Heartbeat for job {job.id} failed: {e}")
+                continue
+            if not renewed:
+                logger.error(f"Lost the lease on job {job.id}, abandoning it.")
+                task.cancel()
+                return
+
+    async def _run_pipeline(self, client: MeoClient, job: SyncJobModel, channels: list) -> dict:
+        async with trace_run(f"job-{job.id}", token_bucket.rate):
+            return await run_sync_pipeline(
+                client, channels, job.window_start, job.window_end, job.incremental
+            )
+
+    async def run_job(self, client: MeoClient, job: SyncJobModel):
+        """Run one batch through the pipeline and record the outcome."""
+        channels = [{**channel, "programs": []} for channel in job.channels]
+        logger.info(
+            f"Job {job.id} (run {job.run_id}, attempt {job.attempts}): "
+            f"{len(channels)} channels from {job.window_start} to {job.window_end}."
+        )
+        work = asyncio.ensure_future(self._run_pipeline(client, job, channels))
+        lease = asyncio.ensure_future(self._keep_lease(job, work))
+        try:
+            stats = await work
+        except asyncio.CancelledError:
+            if not lease.done():
+                # The worker itself is being cancelled: hand the job back
+                await asyncio.shield(fail_job(job, self.worker_id, "Worker cancelled"))
+                raise
+            # The lease was lost and the job may already run elsewhere
+            self.failed += 1
+            return
+        except GuideBatchesFailed as e:
+            # Retry the job; what it committed still counts towards the run
+            self.failed += 1
+            if await fail_job(job, self.worker_id, str(e), e.stats):
+                await asyncio.to_thread(bump_generation)
+            return
+        except Exception as e:
+            self.failed += 1
+            if await fail_job(job, self.worker_id, repr(e)):
+                await asyncio.to_thread(bump_generation)
+            return
+        finally:
+            lease.cancel()
+
+        self.completed += 1
+        if await complete_job(job, self.worker_id, stats):
+            await asyncio.to_thread(bump_generation)
+
+    async def _slot(self, client: MeoClient):
+        """Claim and run jobs one at a time until the worker stops."""
+        while not self.stopping.is_set():
+            try:
+                job = await claim_job(self.worker_id)
+            except Exception as e:
+                logger.error(f"Claiming a job failed: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), WORKER_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_job(client, job)
+
+    async def _reaper(self):
+        """Requeue jobs of workers that died; any worker may do it."""
+        while not self.stopping.is_set():
+            try:
+                _, changed = await requeue_expired_leases()
+                if changed:
+                    await asyncio.to_thread(bump_generation)
+            except Exception as e:
+                logger.error(f"Requeueing expired leases failed: {e}")
+            try:
+                await asyncio.wait_for(self.stopping.wait(), JOB_LEASE_SECONDS / 2)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        """Process jobs until SIGINT/SIGTERM, then let the running ones finish."""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        logger.info(
+            f"Sync worker {self.worker_id} started with {self.concurrency} slots."
+        )
+        try:
+            async with MeoClient() as client:
+                await asyncio.gather(
+                    self._reaper(),
+                    *(self._slot(client) for _ in range(self.concurrency)),
+                )
+        finally:
+            logger.info(
+                f"Sync worker {self.worker_id} stopped: {self.completed} jobs completed, "
+                f"{self.failed} failed. Rate limiter stats: {rate_limit_stats()}"
+            )
+            await async_engine.dispose()
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Run guide sync jobs from the queue.")
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=WORKER_CONCURRENCY,
+        help="Jobs processed at the same time",
+    )
+    parser.add_argument(
+        "--id", dest="worker_id", default=f"{socket.gethostname()}:{os.getpid()}",
+        help="Worker name used as lease owner (defaults to host:pid)",
+    )
+    args = parser.parse_args(argv)
+
+    initialize_database()
+    use_shared_budget(
+        SharedRateBudget("meo", SHARED_REQUESTS_PER_SECOND, SHARED_BUDGET_BLOCK)
+    )
+    asyncio.run(SyncWorker(args.worker_id, args.concurrency).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import asyncio
+import sys
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional
+from xml.sax.saxutils import escape, quoteattr
+from sqlalchemy import select
+from models.epg import EPGChannelModel, EPGProgramModel
+from utils.constants import XMLTV_CHUNK_SIZE, XMLTV_FETCH_SIZE
+from utils.db import AsyncSessionLocal
+from utils.timestamps import to_utc
+
+XMLTV_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<!DOCTYPE tv SYSTEM "xmltv.dtd">\n'
+    '<tv generator-info-name="ptepg">\n'
+)
+XMLTV_FOOTER = "</tv>\n"
+
+
+def xmltv_time(value: datetime) -> str:
+    """Format a datetime as an XMLTV timestamp ("20250304224300 +0000")."""
+    return value.astimezone(timezone.utc).strftime("%Y%m%d%H%M%S %z")
+
+
+def _channel_xml(meo_id: str, name: str, logo: Optional[str]) -> str:
+    icon = f"    <icon src={quoteattr(logo)} />\n" if logo else ""
+    return (
+        f"  <channel id={quoteattr(meo_id)}>\n"
+        f"    <display-name>{escape(name or meo_id)}</display-name>\n"
+        f"{icon}"
+        f"  </channel>\n"
+    )
+
+
+def _programme_xml(row) -> str:
+    meo_id, start, end, name, description, image, series_id = row
+    parts = [
+        f"  <programme start={quoteattr(xmltv_time(start))} "
+        f"stop={quoteattr(xmltv_time(end))} channel={quoteattr(meo_id)}>\n",
+        f"    <title>{escape(name or '')}</title>\n",
+    ]
+    if description:
+        parts.append(f"    <desc>{escape(description)}</desc>\n")
+    if image:
+        parts.append(f"    <icon src={quoteattr(image)} />\n")
+    if series_id:
+        parts.append(
+            f'    <episode-num system="meo-series">{escape(series_id)}</episode-num>\n'
+        )
+    parts.append("  </programme>\n")
+    return "".join(parts)
+
+
+async def _iter_xml(
+    channels: Optional[List[str]], start: datetime, end: datetime
+) -> AsyncIterator[str]:
+    """Yield XMLTV fragments, reading programs through a server-side cursor."""
+    async with AsyncSessionLocal() as db:
+        yield XMLTV_HEADER
+
+        channel_query = select(
+            EPGChannelModel.meo_id, EPGChannelModel.name, EPGChannelModel.logo
+        ).order_by(EPGChannelModel.position, EPGChannelModel.id)
+        if channels:
+            channel_query = channel_query.where(EPGChannelModel.meo_id.in_(channels))
+        for meo_id, name, logo in await db.execute(channel_query):
+            yield _channel_xml(meo_id, name, logo)
+
+        program_query = (
+            select(
+                EPGChannelModel.meo_id,
+                EPGProgramModel.start_date_time,
+                EPGProgramModel.end_date_time,
+                EPGProgramModel.name,
+                EPGProgramModel.description,
+                EPGProgramModel.imgL,
+                EPGProgramModel.series_id,
+            )
+            .join(EPGChannelModel, EPGProgramModel.channel_id == EPGChannelModel.id)
+            .where(
+                EPGProgramModel.end_date_time > start,
+                EPGProgramModel.start_date_time < end,
+                EPGProgramModel.removed_at.is_(None),
+            )
+            .order_by(EPGProgramModel.channel_id, EPGProgramModel.start_date_time)
+            .execution_options(stream_results=True, yield_per=XMLTV_FETCH_SIZE)
+        )
+        if channels:
+            program_query = program_query.where(EPGChannelModel.meo_id.in_(channels))
+        async for row in await db.stream(program_query):
+            yield _programme_xml(row)
+
+        yield XMLTV_FOOTER
+
+
+async def iter_xmltv(
+    channels: Optional[List[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    Stream the stored guide as XMLTV in constant memory.
+
+    Args:
+        channels: MEO ids of the channels to export, or None for all channels.
+        start: Start of the exported window, defaults to now.
+        end: End of the exported window, defaults to everything after `start`.
+        compress: Gzip the output on the fly.
+
+    Returns:
+        Iterator of encoded chunks of roughly XMLTV_CHUNK_SIZE bytes.
+    """
+    start = to_utc(start)
+    end = to_utc(end) if end is not None else start + timedelta(days=365)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    buffer: List[str] = []
+    size = 0
+    async for fragment in _iter_xml(channels, start, end):
+        buffer.append(fragment)
+        size += len(fragment)
+        if size >= XMLTV_CHUNK_SIZE:
+            data = "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+
+    data = "".join(buffer).encode("utf-8")
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+async def _write(output, channels, start, end, compress):
+    async for chunk in iter_xmltv(channels, start, end, compress):
+        output.write(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the stored guide as XMLTV.")
+    parser.add_argument("-o", "--output", help="Output file (defaults to stdout)")
+    parser.add_argument(
+        "-c", "--channels", help="Comma-separated MEO channel ids (defaults to all)"
+    )
+    parser.add_argument(
+        "--from", dest="start", type=datetime.fromisoformat, help="Window start (ISO 8601)"
+    )
+    parser.add_argument(
+        "--to", dest="end", type=datetime.fromisoformat, help="Window end (ISO 8601)"
+    )
+    parser.add_argument("--gzip", action="store_true", help="Gzip the output")
+    args = parser.parse_args()
+
+    channels = args.channels.split(",") if args.channels else None
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        asyncio.run(_write(output, channels, args.start, args.end, args.gzip))
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
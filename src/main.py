@@ -4,10 +4,24 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from dotenv import load_dotenv
 from api.private.auth import router as auth_router
+from api.public.api import router as epg_router
+from api.public.metrics import LatencyMiddleware, router as metrics_router
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from jobs.epg import get_meo_epg
-from utils.logger import logger
-from utils.db import initialize_database
+from jobs.retention import run_retention
+from jobs.scheduler import refresh_scheduler
+from utils.api_keys import api_keys
+from utils.constants import (
+    API_KEY_USAGE_FLUSH_SECONDS,
+    GENERATION_POLL_SECONDS,
+    RETENTION_HOUR,
+    SYNC_DISTRIBUTED,
+)
+from utils.logger import get_logger
+from utils.db import async_engine, initialize_database
+from utils.generation import load_generation
+from utils.guide_index import follow_generation, rebuild_guide_index
+
+logger = get_logger(__name__)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,6 +29,10 @@ load_dotenv()
 # Call this before using any database operations
 initialize_database()
 
+# Serve the public API from memory until the next sync rebuilds the index
+rebuild_guide_index()
+load_generation()
+
 # Determine if we're in development mode
 is_dev = os.getenv("ENVIRONMENT") == "dev"
 if is_dev:
@@ -48,6 +66,8 @@ for app in [public_app, private_app]:
         allow_headers=["*"],
     )
 
+public_app.add_middleware(LatencyMiddleware)
+
 private_app.add_middleware(
     SessionMiddleware,
     secret_key=os.getenv(
@@ -58,6 +78,7 @@ private_app.add_middleware(
 # Mount routers to respective apps
 # Include auth_router without prefix to avoid double '/auth/' in paths
 private_app.include_router(auth_router)  # Fixed: Removed prefix="/auth"
+public_app.include_router(epg_router)
 
 # client_app.include_router(client_router, prefix="/api/v1", tags=["Client"])
 # dashboard_app.include_router(users_router, prefix="/manage", tags=["Users"])
@@ -72,23 +93,38 @@ root_app = FastAPI()
 # Mount the client and dashboard apps under their respective prefixes
 # root_app.mount("/api/private", private_app)
 root_app.mount("/api", public_app)
+root_app.include_router(metrics_router)
 
 root_app.state.scheduler = AsyncIOScheduler()
 
-import asyncio
 
-asyncio.run(get_meo_epg())
+@root_app.on_event("startup")
+async def startup_event():
+    # Near-term guide often, later days rarely; the first runs fill the database
+    refresh_scheduler.schedule(root_app.state.scheduler)
+    root_app.state.scheduler.add_job(
+        run_retention, "cron", hour=RETENTION_HOUR, minute=0, timezone="UTC"
+    )
+    root_app.state.scheduler.add_job(
+        api_keys.flush_usage, "interval", seconds=API_KEY_USAGE_FLUSH_SECONDS
+    )
+    if SYNC_DISTRIBUTED:
+        # Syncs are only queued here; pick up the guide changes the workers commit
+        root_app.state.scheduler.add_job(
+            follow_generation, "interval", seconds=GENERATION_POLL_SECONDS
+        )
+    root_app.state.scheduler.start()
 
 
-# @root_app.on_event("startup")
-# async def startup_event():
-#     root_app.state.scheduler.add_job(get_meo_epg, "cron", hour=0, minute=0)
-#     root_app.state.scheduler.start()
+@root_app.on_event("shutdown")
+async def shutdown_event():
+    root_app.state.scheduler.shutdown()
 
 
-# @root_app.on_event("shutdown")
-# async def shutdown_event():
-#     root_app.state.scheduler.shutdown()
+@root_app.on_event("shutdown")
+async def dispose_database():
+    await api_keys.flush_usage()
+    await async_engine.dispose()
 
 
 # Run the app (for development purposes)
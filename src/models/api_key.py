@@ -0,0 +1,27 @@
+from datetime import datetime
+from sqlalchemy import BigInteger, CheckConstraint, Column, DateTime, Float, Integer, String
+from utils.db import Base
+
+
+class ApiKeyModel(Base):
+    """An issued public API key; only a hash of the key is stored."""
+
+    __tablename__ = "api_keys"
+    __table_args__ = (
+        CheckConstraint("rate_per_second > 0", name="ck_api_keys_rate_positive"),
+        CheckConstraint("burst >= 1", name="ck_api_keys_burst_positive"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    # First characters of the key, shown in listings to tell keys apart
+    prefix = Column(String, nullable=False)
+    key_hash = Column(String, unique=True, nullable=False)  # sha256 hex digest
+    name = Column(String, nullable=False)
+    owner_email = Column(String, nullable=True, index=True)
+    rate_per_second = Column(Float, nullable=False)
+    burst = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+    # Flushed from memory in batches, so a few seconds behind
+    last_used_at = Column(DateTime, nullable=True)
+    request_count = Column(BigInteger, default=0, nullable=False)
@@ -1,4 +1,16 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime
+from sqlalchemy import (
+    DDL,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+    event,
+    text,
+)
 from sqlalchemy.orm import relationship
 from utils.db import Base  # Import Base from db.py instead of creating a new one
 
@@ -20,17 +32,65 @@ class EPGChannelModel(Base):
 
 
 class EPGProgramModel(Base):
+    """Programs, range-partitioned by day on start_date_time (see jobs.retention).
+
+    Keys of a partitioned table must contain the partition column, hence the
+    composite primary key and the (meo_program_id, start_date_time) unique key.
+    """
+
     __tablename__ = "programs"
 
-    id = Column(Integer, primary_key=True, index=True)
-    meo_program_id = Column(String, unique=True, index=True)
-    start_date_time = Column(DateTime)
-    end_date_time = Column(DateTime)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    meo_program_id = Column(String, nullable=False)
+    # Aware UTC instants
+    start_date_time = Column(DateTime(timezone=True), primary_key=True)
+    end_date_time = Column(DateTime(timezone=True))
     name = Column(String)
     description = Column(String)
     imgM = Column(String)
     imgL = Column(String)
     imgXL = Column(String)
     series_id = Column(String)
+    # Set when a program disappears from the upstream guide window
+    removed_at = Column(DateTime(timezone=True), nullable=True)
     channel_id = Column(Integer, ForeignKey("channels.id"))
     channel = relationship("EPGChannelModel", back_populates="programs")
+
+    __table_args__ = (
+        # Upsert target and lookups by MEO program id
+        UniqueConstraint(
+            "meo_program_id", "start_date_time", name="uq_programs_program_start"
+        ),
+        # Removal sweep: a channel's programs starting in the sync window
+        Index(
+            "ix_programs_channel_start",
+            "channel_id",
+            "start_date_time",
+            postgresql_include=["meo_program_id"],
+            postgresql_where=text("removed_at IS NULL"),
+        ),
+        # Window and "now and next" queries: programs of a channel that have not
+        # ended yet. The INCLUDE columns make the incremental sync lookup index-only
+        Index(
+            "ix_programs_channel_end",
+            "channel_id",
+            "end_date_time",
+            postgresql_include=["start_date_time", "meo_program_id", "name"],
+            postgresql_where=text("removed_at IS NULL"),
+        ),
+        # Guide index and XMLTV scans over all channels
+        Index(
+            "ix_programs_end",
+            "end_date_time",
+            postgresql_where=text("removed_at IS NULL"),
+        ),
+        {"postgresql_partition_by": "RANGE (start_date_time)"},
+    )
+
+
+# Catches rows outside every daily partition; kept small by the retention job
+event.listen(
+    EPGProgramModel.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS programs_default PARTITION OF programs DEFAULT"),
+)
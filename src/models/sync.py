@@ -0,0 +1,78 @@
+from datetime import datetime
+from sqlalchemy import JSON, Boolean, Column, DateTime, ForeignKey, Index, Integer, String, func, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from utils.db import Base
+
+
+class EPGGenerationModel(Base):
+    """One row per sync that changed the stored guide; the id is the generation number."""
+
+    __tablename__ = "epg_generations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    completed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class SyncRunModel(Base):
+    """One row per EPG sync; checkpointed after every committed channel batch."""
+
+    __tablename__ = "sync_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, default="running", nullable=False)  # running, completed, failed
+    # Slice of the guide the run covers, e.g. "full" or "today:2/4" (horizon:group/groups)
+    scope = Column(String, default="full", nullable=False)
+    window_start = Column(DateTime(timezone=True), nullable=False)
+    window_end = Column(DateTime(timezone=True), nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=1, nullable=False)
+    completed_batches = Column(Integer, default=0, nullable=False)
+    # MEO ids of every channel whose batch is fully committed
+    completed_channels = Column(ARRAY(String), default=list, nullable=False)
+    stats = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+
+
+class SyncJobModel(Base):
+    """One channel batch of a sync run, claimed by sync workers from this queue table."""
+
+    __tablename__ = "sync_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("sync_runs.id"), nullable=False, index=True)
+    # queued, running, done, failed, superseded (failed, then requeued by a resumed run)
+    status = Column(String, default="queued", nullable=False)
+    window_start = Column(DateTime(timezone=True), nullable=False)
+    window_end = Column(DateTime(timezone=True), nullable=False)
+    # Channel dicts (without programs) as returned by fetch_channels_async
+    channels = Column(JSON, nullable=False)
+    incremental = Column(Boolean, default=True, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    stats = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Claiming scans queued jobs in id order, the reaper scans expired leases
+        Index("ix_sync_jobs_queued", "id", postgresql_where=text("status = 'queued'")),
+        Index(
+            "ix_sync_jobs_lease",
+            "lease_expires_at",
+            postgresql_where=text("status = 'running'"),
+        ),
+    )
+
+
+class RateBudgetModel(Base):
+    """Request budget shared by all sync workers (GCRA: the theoretical arrival time)."""
+
+    __tablename__ = "rate_budgets"
+
+    name = Column(String, primary_key=True)
+    tat = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
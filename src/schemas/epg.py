@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -25,3 +26,43 @@ class EpgChannelSchema(BaseModel):
     position: int
     isAdult: bool
     programs: list[EpgProgramSchema]
+
+
+class EpgNowNextSchema(BaseModel):
+    channel: EpgChannelSchema
+    now: Optional[EpgProgramSchema]
+    next: Optional[EpgProgramSchema]
+
+
+def channel_schema(channel) -> EpgChannelSchema:
+    """Build the API shape of an EPGChannelModel row."""
+    return EpgChannelSchema(
+        id=str(channel.id),
+        meo_id=channel.meo_id,
+        name=channel.name or "",
+        description=channel.description or "",
+        logo=channel.logo or "",
+        theme=channel.theme or "",
+        language=channel.language or "",
+        region=channel.region or "",
+        position=channel.position if channel.position is not None else -1,
+        isAdult=bool(channel.isAdult),
+        programs=[],
+    )
+
+
+def program_schema(program) -> EpgProgramSchema:
+    """Build the API shape of an EPGProgramModel row."""
+    return EpgProgramSchema(
+        id=program.meo_program_id,
+        start_date_time=(
+            program.start_date_time.isoformat() if program.start_date_time else ""
+        ),
+        end_date_time=program.end_date_time.isoformat() if program.end_date_time else "",
+        name=program.name or "",
+        description=program.description or "",
+        imgM=program.imgM or "",
+        imgL=program.imgL or "",
+        imgXL=program.imgXL or "",
+        series_id=program.series_id or "",
+    )
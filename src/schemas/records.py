@@ -0,0 +1,77 @@
+# Compact in-flight representation of programs on the sync/ingest path
+import sys
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+def intern(value: Optional[str]) -> Optional[str]:
+    """Share one copy of a repeated string (titles, series ids, image URLs)."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def text(value) -> Optional[str]:
+    """COPY into TEXT columns needs actual strings (MEO sometimes returns numbers)."""
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+class ProgramRecord:
+    """A program as fetched from MEO and written by the ingest.
+
+    Slotted instead of a dict: no per-instance __dict__, and the repeated
+    strings are interned, so a week of guide data shares one copy of each
+    series id, title and image URL.
+    """
+
+    __slots__ = (
+        "id",
+        "start_date_time",
+        "end_date_time",
+        "name",
+        "description",
+        "imgM",
+        "imgL",
+        "imgXL",
+        "series_id",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        start_date_time: datetime,
+        end_date_time: datetime,
+        name: str,
+        description: str,
+        imgM: str,
+        imgL: str,
+        imgXL: str,
+        series_id: str,
+    ):
+        self.id = text(id)
+        self.start_date_time = start_date_time
+        self.end_date_time = end_date_time
+        self.name = intern(text(name))
+        self.description = text(description)
+        self.imgM = intern(text(imgM))
+        self.imgL = intern(text(imgL))
+        self.imgXL = intern(text(imgXL))
+        self.series_id = intern(text(series_id))
+
+    def row(self, channel_meo_id: str) -> Tuple:
+        """Values in ingest.PROGRAM_COLUMNS order."""
+        return (
+            self.id,
+            channel_meo_id,
+            self.start_date_time,
+            self.end_date_time,
+            self.name,
+            self.description,
+            self.imgM,
+            self.imgL,
+            self.imgXL,
+            self.series_id,
+        )
+
+    def __repr__(self) -> str:
+        return f"ProgramRecord({self.id!r}, {self.start_date_time!r}, {self.name!r})"
@@ -0,0 +1,304 @@
+# Public API keys: stored hashed, verified from an in-memory cache, rate limited per key
+import argparse
+import asyncio
+import hashlib
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+from models.api_key import ApiKeyModel
+from utils.constants import (
+    API_KEY_CACHE_SIZE,
+    API_KEY_CACHE_TTL,
+    API_KEY_DEFAULT_BURST,
+    API_KEY_DEFAULT_RATE,
+    API_KEY_NEGATIVE_TTL,
+)
+from utils.db import AsyncSessionLocal, SessionLocal, async_engine
+from utils.logger import get_logger
+from utils.metrics import registry
+from utils.rate_limit import TokenBucket
+
+logger = get_logger(__name__)
+
+KEY_PREFIX = "ptepg_"
+# Characters of the key stored in clear, to tell keys apart in listings
+SHOWN_CHARS = len(KEY_PREFIX) + 6
+
+api_key_lookups = registry.counter(
+    "ptepg_api_key_lookups_total",
+    "Public API key verifications by source (cache or database) and result.",
+    ["source", "result"],
+)
+api_rate_limited = registry.counter(
+    "ptepg_api_rate_limited_total",
+    "Public API requests rejected because their key exceeded its quota.",
+)
+
+
+def generate_key() -> str:
+    return KEY_PREFIX + secrets.token_urlsafe(32)
+
+
+def hash_key(key: str) -> str:
+    # Keys carry 256 random bits, so a fast unsalted hash cannot be brute-forced
+    # and lets a key be looked up by its hash
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ApiKey:
+    """A verified key as seen by the API: its quota bucket and usage not yet flushed."""
+
+    __slots__ = ("id", "name", "bucket")
+
+    def __init__(self, id: int, name: str, bucket: TokenBucket):
+        self.id = id
+        self.name = name
+        self.bucket = bucket
+
+
+class ApiKeyCache:
+    """LRU of key hash -> ApiKey, or None for unknown and revoked keys, with per-entry expiry."""
+
+    def __init__(
+        self,
+        size: int = API_KEY_CACHE_SIZE,
+        ttl: float = API_KEY_CACHE_TTL,
+        negative_ttl: float = API_KEY_NEGATIVE_TTL,
+    ):
+        """Initialize the cache.
+
+        Args:
+            size: Entries kept; the least recently used one is evicted first.
+            ttl: Seconds a valid key is trusted without asking the database.
+            negative_ttl: Seconds an invalid key is rejected without asking the database.
+        """
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, Tuple[float, Optional[ApiKey]]]" = OrderedDict()
+
+    def get(self, key_hash: str) -> Tuple[bool, Optional[ApiKey]]:
+        """Return (found, key); found is False for missing and expired entries."""
+        entry = self._entries.get(key_hash)
+        if entry is None:
+            return False, None
+        expires, api_key = entry
+        if expires < time.monotonic():
+            del self._entries[key_hash]
+            return False, None
+        self._entries.move_to_end(key_hash)
+        return True, api_key
+
+    def put(self, key_hash: str, api_key: Optional[ApiKey]):
+        ttl = self.ttl if api_key is not None else self.negative_ttl
+        self._entries[key_hash] = (time.monotonic() + ttl, api_key)
+        self._entries.move_to_end(key_hash)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key_hash: str):
+        self._entries.pop(key_hash, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ApiKeyStore:
+    """Verifies keys and counts their use for one API process.
+
+    Only cache misses reach the database; concurrent misses for the same key
+    share one query. Usage is counted in memory and written by `flush_usage`.
+    """
+
+    def __init__(self, cache: Optional[ApiKeyCache] = None):
+        self.cache = cache or ApiKeyCache()
+        # Outlive cache entries, so a key's quota is not reset when its entry expires
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._usage: Dict[int, int] = {}
+
+    def _api_key(self, row: ApiKeyModel) -> ApiKey:
+        bucket = self._buckets.get(row.id)
+        if bucket is None:
+            bucket = self._buckets[row.id] = TokenBucket(
+                rate=row.rate_per_second,
+                per=1.0,
+                name=f"api_key:{row.id}",
+                capacity=row.burst,
+            )
+        else:
+            # Quota changed in the database since the bucket was created
+            bucket.rate = bucket.min_rate = bucket.max_rate = row.rate_per_second
+            bucket.capacity = row.burst
+        return ApiKey(row.id, row.name, bucket)
+
+    async def _load(self, key_hash: str) -> Optional[ApiKey]:
+        async with AsyncSessionLocal() as db:
+            row = await db.scalar(
+                select(ApiKeyModel).where(
+                    ApiKeyModel.key_hash == key_hash, ApiKeyModel.revoked_at.is_(None)
+                )
+            )
+        if row is not None and not (row.rate_per_second > 0 and row.burst >= 1):
+            # Only possible for rows written around create_api_key; never divide by a zero rate
+            logger.error(f"API key {row.id} has an invalid quota, rejecting it.")
+            row = None
+        api_key = self._api_key(row) if row is not None else None
+        self.cache.put(key_hash, api_key)
+        return api_key
+
+    async def verify(self, key: str) -> Optional[ApiKey]:
+        """Return the key's ApiKey, or None if it is unknown or revoked."""
+        key_hash = hash_key(key)
+        found, api_key = self.cache.get(key_hash)
+        if found:
+            api_key_lookups.labels("cache", "valid" if api_key else "invalid").inc()
+            return api_key
+
+        pending = self._pending.get(key_hash)
+        if pending is None:
+            pending = self._pending[key_hash] = asyncio.ensure_future(self._load(key_hash))
+            pending.add_done_callback(lambda _: self._pending.pop(key_hash, None))
+        api_key = await asyncio.shield(pending)
+        api_key_lookups.labels("database", "valid" if api_key else "invalid").inc()
+        return api_key
+
+    def record_use(self, api_key: ApiKey):
+        self._usage[api_key.id] = self._usage.get(api_key.id, 0) + 1
+
+    async def flush_usage(self):
+        """Add the requests counted since the last flush to each key's row, in one statement."""
+        if not self._usage:
+            return
+        usage, self._usage = self._usage, {}
+        table = ApiKeyModel.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("key_id"))
+            .values(
+                request_count=table.c.request_count + bindparam("requests"),
+                last_used_at=datetime.utcnow(),
+            )
+        )
+        # Sorted, so concurrent flushes from several API processes lock rows in the same order
+        rows = [{"key_id": key_id, "requests": usage[key_id]} for key_id in sorted(usage)]
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(statement, rows)
+        except Exception as e:
+            logger.error(f"Flushing API key usage failed, keeping it for the next flush: {e}")
+            for key_id, requests in usage.items():
+                self._usage[key_id] = self._usage.get(key_id, 0) + requests
+        else:
+            logger.debug(f"Flushed usage of {len(rows)} API keys.")
+
+
+api_keys = ApiKeyStore()
+
+
+def create_api_key(
+    db: Session,
+    name: str,
+    owner_email: Optional[str] = None,
+    rate_per_second: float = API_KEY_DEFAULT_RATE,
+    burst: int = API_KEY_DEFAULT_BURST,
+) -> Tuple[str, ApiKeyModel]:
+    """
+    Issue a new key.
+
+    Args:
+        db: Session the key row is added to and committed with.
+        name: What the key is used for.
+        owner_email: Email of the user the key belongs to.
+        rate_per_second: Sustained requests per second allowed.
+        burst: Requests allowed at once after the key has been idle.
+
+    Returns:
+        The key, which is not stored and cannot be shown again, and its row.
+
+    Raises:
+        ValueError: If the rate is not positive or the burst is below one request.
+    """
+    if not rate_per_second > 0:
+        raise ValueError(f"The rate must be positive, got {rate_per_second}")
+    if burst < 1:
+        raise ValueError(f"The burst must be at least 1, got {burst}")
+    key = generate_key()
+    row = ApiKeyModel(
+        prefix=key[:SHOWN_CHARS],
+        key_hash=hash_key(key),
+        name=name,
+        owner_email=owner_email,
+        rate_per_second=rate_per_second,
+        burst=burst,
+    )
+    db.add(row)
+    db.commit()
+    return key, row
+
+
+def revoke_api_key(db: Session, key_id: int) -> bool:
+    """Revoke a key; API processes stop accepting it within API_KEY_CACHE_TTL seconds."""
+    row = db.get(ApiKeyModel, key_id)
+    if row is None or row.revoked_at is not None:
+        return False
+    row.revoked_at = datetime.utcnow()
+    db.commit()
+    return True
+
+
+def list_api_keys(db: Session) -> List[ApiKeyModel]:
+    return list(db.scalars(select(ApiKeyModel).order_by(ApiKeyModel.id)))
+
+
+def _positive(kind):
+    def parse(value: str):
+        number = kind(value)
+        if not number > 0:
+            raise argparse.ArgumentTypeError(f"must be positive, got {value}")
+        return number
+
+    parse.__name__ = kind.__name__
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage public API keys.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="Issue a key and print it once")
+    create.add_argument("--name", required=True, help="What the key is used for")
+    create.add_argument("--owner", help="Email of the key's owner")
+    create.add_argument("--rate", type=_positive(float), default=API_KEY_DEFAULT_RATE, help="Requests per second")
+    create.add_argument("--burst", type=_positive(int), default=API_KEY_DEFAULT_BURST, help="Burst size")
+    revoke = commands.add_parser("revoke", help="Revoke a key by id")
+    revoke.add_argument("id", type=int)
+    commands.add_parser("list", help="List keys and their usage")
+    args = parser.parse_args()
+
+    from utils.db import initialize_database
+
+    initialize_database()
+    with SessionLocal() as db:
+        if args.command == "create":
+            key, row = create_api_key(db, args.name, args.owner, args.rate, args.burst)
+            print(f"Key {row.id} ({row.name}): {key}")
+        elif args.command == "revoke":
+            if not revoke_api_key(db, args.id):
+                parser.exit(1, f"No active key with id {args.id}.\n")
+            print(f"Key {args.id} revoked.")
+        else:
+            for row in list_api_keys(db):
+                state = "revoked" if row.revoked_at else "active"
+                print(
+                    f"{row.id}\t{row.prefix}…\t{row.name}\t{row.owner_email or '-'}\t"
+                    f"{row.rate_per_second:g}/s burst {row.burst}\t{state}\t"
+                    f"{row.request_count} requests, last used {row.last_used_at or 'never'}"
+                )
+
+
+if __name__ == "__main__":
+    main()
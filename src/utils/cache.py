@@ -0,0 +1,219 @@
+# Two-tier cache (in-memory LRU + SQLite file) with in-flight request coalescing
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from utils.constants import (
+    PROGRAM_CACHE_MAX_ENTRIES,
+    PROGRAM_CACHE_PATH,
+    PROGRAM_CACHE_TTL,
+)
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class TTLCache:
+    """Memory LRU in front of an optional SQLite file.
+
+    The SQLite tier never runs on the event loop: lookups go to its own
+    thread, and writes are buffered until `flush` stores them in one
+    transaction on that thread.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, path: Optional[str] = None):
+        """Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of entries kept in memory before evicting the least recently used.
+            ttl: Default time-to-live of an entry in seconds.
+            path: SQLite file used as persistent tier, or None to keep the cache in memory only.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        # One thread owns the SQLite connection, so it is never shared between threads
+        self._disk: Optional[ThreadPoolExecutor] = None
+        if path:
+            self._disk = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-disk")
+        # Entries set since the last flush: key -> (expires_at, value)
+        self._unflushed: Dict[str, Tuple[float, Any]] = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open the persistent tier lazily, dropping expired rows on first use."""
+        if self._db is None and self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+        return self._db
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        """Store an entry in the memory tier, evicting the least recently used one if full."""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _memory_get(self, key: str, now: float) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+            del self._entries[key]
+        return None
+
+    def _disk_read(self, key: str, now: float) -> Optional[Tuple[float, Any]]:
+        """Look a key up in the SQLite tier; runs on the disk thread."""
+        row = self._connect().execute(
+            "SELECT expires_at, value FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[0] <= now:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _disk_write(self, entries: List[Tuple[str, float, Any]]):
+        """Store entries in the SQLite tier in one transaction; runs on the disk thread."""
+        db = self._connect()
+        db.executemany(
+            "INSERT OR REPLACE INTO cache (key, expires_at, value) VALUES (?, ?, ?)",
+            [(key, expires_at, json.dumps(value)) for key, expires_at, value in entries],
+        )
+        db.commit()
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Return a cached value, or None if it is missing or expired."""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            return value
+
+        # Evicted from memory before it was flushed
+        entry = self._unflushed.get(key)
+        if entry is None and self._disk is not None:
+            entry = await asyncio.get_running_loop().run_in_executor(
+                self._disk, self._disk_read, key, now
+            )
+        if entry is not None and entry[0] > now:
+            self._remember(key, *entry)
+            self.disk_hits += 1
+            return entry[1]
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a value in memory; it reaches the SQLite tier with the next `flush`."""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._remember(key, expires_at, value)
+        if self._disk is not None:
+            self._unflushed[key] = (expires_at, value)
+
+    async def flush(self) -> int:
+        """Write the entries set since the last flush to the SQLite tier off the event loop.
+
+        Returns:
+            The number of entries written.
+        """
+        if not self._unflushed:
+            return 0
+        entries, self._unflushed = self._unflushed, {}
+        rows = [(key, expires_at, value) for key, (expires_at, value) in entries.items()]
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._disk, self._disk_write, rows)
+        except Exception as e:
+            # Only costs upstream requests later, never fail the caller for it
+            logger.error(f"Writing {len(rows)} entries to the cache file failed: {e}")
+            return 0
+        return len(rows)
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        refresh: bool = False,
+        cacheable: Callable[[Any], bool] = lambda value: True,
+    ) -> Any:
+        """Return the cached value for `key`, fetching it at most once concurrently.
+
+        Args:
+            key: Cache key.
+            fetch: Coroutine factory producing the value on a miss.
+            ttl: Time-to-live for the fetched value, defaults to the cache TTL.
+            refresh: Skip the lookup and always fetch a fresh value.
+            cacheable: Predicate deciding whether a fetched value may be stored (e.g. not failures).
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        if not refresh:
+            value = self._memory_get(key, time.time())
+            if value is not None:
+                return value
+
+        # Registered before the disk lookup, so concurrent callers share it as well
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = None if refresh else await self.get(key)
+            if value is None:
+                value = await fetch()
+                if cacheable(value):
+                    self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except BaseException as error:
+            future.set_exception(error)
+            # Nobody else may be waiting, don't let the loop warn about it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters; every hit is an upstream request saved."""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "unflushed": len(self._unflushed),
+            "saved_requests": self.memory_hits + self.disk_hits + self.coalesced,
+        }
+
+    def log_stats(self, name: str):
+        logger.info(f"{name} cache stats: {self.stats()}")
+
+
+# Cache of getProgramDetails responses keyed by MEO program id
+program_cache = TTLCache(
+    max_entries=PROGRAM_CACHE_MAX_ENTRIES, ttl=PROGRAM_CACHE_TTL, path=PROGRAM_CACHE_PATH
+)
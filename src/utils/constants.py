@@ -1,3 +1,5 @@
+import os
+
 # Configuration constants
 GRID_URL = "https://authservice.apps.meo.pt/Services/GridTv/GridTvMng.svc/getGridAnon"
 CHANNEL_DETAILS_URL = "https://meogouser.apps.meo.pt/Services/GridTv/GridTv.svc/GetChannelInfo?callLetter="  #! dont forget to add the channel id at the end
@@ -12,5 +14,128 @@ HEADERS = {
     "Accept": "*/*",
 }
 
+# MEO publishes the guide in Portuguese local time
+GUIDE_TIMEZONE = "Europe/Lisbon"
+
 REQUESTS_PER_SECOND = 3
+# Bounds for the adaptive rate limiter (backs off on 429/5xx, probes back up when healthy).
+# REQUESTS_PER_SECOND is MEO's limit: only raise the ceiling above it knowingly
+MIN_REQUESTS_PER_SECOND = 0.5
+MAX_REQUESTS_PER_SECOND = float(os.getenv("MAX_REQUESTS_PER_SECOND", REQUESTS_PER_SECOND))
+# Per-endpoint request rates, on top of the shared REQUESTS_PER_SECOND budget
+ENDPOINT_RATE_LIMITS = {
+    "grid": REQUESTS_PER_SECOND,
+    "channel_info": REQUESTS_PER_SECOND,
+    "guide": REQUESTS_PER_SECOND,
+    "detail": REQUESTS_PER_SECOND,
+}
 DAYS_TO_FETCH = 1
+# MEO HTTP client
+MEO_MAX_CONNECTIONS = 20  # Pooled keep-alive connections in total
+MEO_MAX_CONNECTIONS_PER_HOST = 10
+MEO_DNS_CACHE_TTL = 300  # seconds
+MEO_KEEPALIVE_TIMEOUT = 30  # seconds
+MEO_REQUEST_TIMEOUT = 30  # seconds, per attempt
+MEO_CONNECT_TIMEOUT = 10  # seconds
+MEO_MAX_RETRIES = 4
+MEO_RETRY_BASE_DELAY = 0.5  # seconds, doubled on every retry (with jitter)
+MEO_RETRY_MAX_DELAY = 30  # seconds
+CIRCUIT_FAILURE_THRESHOLD = 10  # Consecutive failures before an endpoint is shed
+CIRCUIT_RESET_TIMEOUT = 30  # seconds before a trial request is let through
+
+# Sync pipeline tuning
+GUIDE_BATCH_SIZE = 30  # MEO accepts at most 30 channels per guide request
+GUIDE_WORKERS = 2  # Concurrent guide requests
+GUIDE_STREAM_CHUNK_SIZE = 64 * 1024  # bytes of the guide response decoded per step
+# Program details fetched concurrently, earliest air time first across all channels
+DETAIL_WORKERS = int(os.getenv("DETAIL_WORKERS", "16"))
+PIPELINE_QUEUE_SIZE = 64  # Bound on channels waiting to be written
+PERSIST_CHUNK_PROGRAMS = 5000  # Programs written to the database per transaction
+PERSIST_INTERVAL = 5.0  # Seconds finished programs wait for more before being written
+# Only fetch program details for programs that are new or changed since the last sync
+INCREMENTAL_SYNC = True
+
+# Program detail cache (in-memory LRU backed by a local SQLite file)
+PROGRAM_CACHE_PATH = os.getenv("PROGRAM_CACHE_PATH", ".cache/program_details.sqlite")
+PROGRAM_CACHE_TTL = int(os.getenv("PROGRAM_CACHE_TTL", 7 * 24 * 3600))  # seconds
+PROGRAM_CACHE_MAX_ENTRIES = 50_000
+
+# Public API
+MAX_QUERY_WINDOW_DAYS = 8  # Longest [from, to) window accepted by the program endpoints
+GUIDE_INDEX_HISTORY_HOURS = 24  # Already finished programs kept in the in-memory guide index
+XMLTV_CHUNK_SIZE = 64 * 1024  # bytes of XML per streamed chunk
+XMLTV_FETCH_SIZE = 2000  # rows fetched per round trip from the server-side cursor
+API_CACHE_MAX_AGE = 60  # seconds clients and proxies may reuse a response without revalidating
+API_CACHE_STALE_WHILE_REVALIDATE = 300  # seconds a stale response may be served while revalidating
+RESPONSE_CACHE_MAX_ENTRIES = 5000  # Serialized public API responses kept in memory
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Async database pool (per process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = 30  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = 1800  # Seconds before a connection is replaced
+DB_STATEMENT_CACHE_SIZE = 500  # Prepared statements cached per asyncpg connection
+
+# Program retention (the programs table is partitioned by day of start_date_time)
+PROGRAM_RETENTION_DAYS = int(os.getenv("PROGRAM_RETENTION_DAYS", "14"))
+PROGRAM_PARTITIONS_AHEAD = DAYS_TO_FETCH + 7  # Daily partitions created in advance
+# Detach expired partitions (e.g. to archive them) instead of dropping them
+RETENTION_DETACH_ONLY = os.getenv("RETENTION_DETACH_ONLY", "false").lower() == "true"
+RETENTION_DELETE_BATCH = 5000  # Rows deleted per transaction outside dropped partitions
+RETENTION_HOUR = 4  # Hour (UTC) of the daily retention run
+# A failed or interrupted sync of the same window is resumed if it started this recently
+SYNC_RESUME_MAX_AGE_HOURS = 12
+
+# Horizon-aware refresh: (name, window start hours from now, window end hours, refresh interval minutes).
+# Each horizon's channels are split into groups refreshed one after another across the interval
+REFRESH_HORIZONS = (
+    ("near", 0, 4, 15),
+    ("today", 0, 24, 60),
+    ("week", 24, 7 * 24, 24 * 60),
+)
+REFRESH_CHANNEL_GROUPS = 4
+# Guide changes of channel-group refreshes are published (index refresh and generation bump)
+# at most this often, so cached responses are not invalidated on every near-horizon tick
+GUIDE_PUBLISH_MIN_SECONDS = 300
+CHANNEL_LIST_MAX_AGE_HOURS = 24  # Grid and channel details are refetched this often
+
+# Distributed sync: batches are queued in Postgres and claimed by `python -m jobs.worker`
+SYNC_DISTRIBUTED = os.getenv("SYNC_DISTRIBUTED", "false").lower() == "true"
+JOB_LEASE_SECONDS = 120  # A job whose lease is not renewed within this time is requeued
+JOB_HEARTBEAT_SECONDS = 30
+JOB_MAX_ATTEMPTS = 5
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))  # Jobs processed at once per worker
+WORKER_POLL_SECONDS = 2.0  # Idle wait before polling the queue again
+# Requests per second towards MEO across all workers, reserved in blocks per worker
+SHARED_REQUESTS_PER_SECOND = float(os.getenv("SHARED_REQUESTS_PER_SECOND", REQUESTS_PER_SECOND))
+SHARED_BUDGET_BLOCK = 3
+GENERATION_POLL_SECONDS = 30  # How often API processes pick up guide changes made by workers
+
+# Per-run tracing (utils/tracing.py): spans and a summary per sync, under TRACE_DIR
+TRACING_ENABLED = os.getenv("SYNC_TRACING", "true").lower() == "true"
+TRACE_DIR = os.getenv("TRACE_DIR", ".cache/traces")
+TRACE_KEEP = 50  # Runs whose traces are kept
+TRACE_MAX_SPANS = 250_000  # Spans kept per run; later ones only count in the totals
+PROFILE_INTERVAL = 0.005  # Seconds between stack samples of the sampling profiler
+# Coarse stages the idle request budget is attributed to
+TRACE_STAGES = ("fetch_channels", "fetch_program_guide", "bulk_ingest")
+
+# Logging (utils/logger.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Per-logger overrides, e.g. "ptepg.jobs.programs=DEBUG,sqlalchemy.engine=INFO"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text or json
+LOG_AGGREGATE_SECONDS = 10  # Interval of aggregated per-item progress lines
+# SQL statement echo, only ever honoured in development
+SQL_ECHO = (
+    os.getenv("SQL_ECHO", "false").lower() == "true" and os.getenv("ENVIRONMENT") == "dev"
+)
+
+# Public API keys (utils/api_keys.py)
+API_KEY_CACHE_SIZE = 10_000  # Verified keys (and recently rejected ones) kept in memory
+API_KEY_CACHE_TTL = 60  # Seconds a verified key is trusted; bounds how long a revoked key keeps working
+API_KEY_NEGATIVE_TTL = 10  # Seconds an unknown key is rejected without asking the database
+API_KEY_DEFAULT_RATE = float(os.getenv("API_KEY_DEFAULT_RATE", "10"))  # Requests per second per key
+API_KEY_DEFAULT_BURST = int(os.getenv("API_KEY_DEFAULT_BURST", "50"))
+API_KEY_USAGE_FLUSH_SECONDS = 30  # Usage counters are written to the database this often
@@ -1,9 +1,24 @@
 import os
 import logging
-from sqlalchemy import create_engine
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from utils.logger import logger
+from utils.constants import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+    GUIDE_TIMEZONE,
+    PROGRAM_RETENTION_DAYS,
+    SQL_ECHO,
+)
+from utils.logger import get_logger
+from utils.metrics import registry
+
+logger = get_logger(__name__)
 
 # Get database connection parameters from environment or use defaults
 DB_USER = os.getenv("DB_USER", "user")
@@ -14,16 +29,53 @@ DB_NAME = os.getenv("DB_NAME", "db")
 
 # Construct database URL
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = (
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
 
 # Log connection parameters (with masked password)
 logger.info(
     f"Connecting to PostgreSQL database at {DB_HOST}:{DB_PORT} as user {DB_USER}"
 )
 
-# Create engine with echo=True to see SQL commands
-engine = create_engine(DATABASE_URL, echo=True)
+# SQL_ECHO only takes effect in development; use LOG_LEVELS=sqlalchemy.engine=INFO
+# to inspect statements elsewhere
+engine = create_engine(DATABASE_URL, echo=SQL_ECHO)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine used by the sync job and the API, so database I/O never blocks
+# the event loop; the sync engine above is kept for schema setup
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    connect_args={"statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+def _pool_connections() -> dict:
+    values = {}
+    for name, pool in (("async", async_engine.pool), ("sync", engine.pool)):
+        values[(name, "checked_out")] = pool.checkedout()
+        values[(name, "idle")] = pool.checkedin()
+        # Negative until the pool is full
+        values[(name, "overflow")] = max(pool.overflow(), 0)
+    return values
+
+
+registry.gauge(
+    "ptepg_db_pool_connections",
+    "Database pool connections by engine and state.",
+    ["engine", "state"],
+    collect=_pool_connections,
+)
+
 # Create a single Base to be imported by models
 Base = declarative_base()
 
@@ -36,6 +88,115 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Columns kept when an unpartitioned programs table is migrated
+LEGACY_PROGRAM_COLUMNS = (
+    "meo_program_id",
+    "start_date_time",
+    "end_date_time",
+    "name",
+    "description",
+    "imgM",
+    "imgL",
+    "imgXL",
+    "series_id",
+    "removed_at",
+    "channel_id",
+)
+LEGACY_TIME_COLUMNS = ("start_date_time", "end_date_time", "removed_at")
+
+
+def migrate_programs_table(conn) -> bool:
+    """
+    Move programs from an unpartitioned table into the partitioned layout.
+
+    Tables created before programs were partitioned by day keep their old
+    layout under create_all, and the ingest upsert on (meo_program_id,
+    start_date_time) fails against them. The old table is renamed, the
+    partitioned one created with a daily partition per day still within
+    PROGRAM_RETENTION_DAYS, and those programs copied over; naive times,
+    stored as Lisbon wall clock, become UTC.
+
+    Args:
+        conn: Connection inside the transaction the migration runs in.
+
+    Returns:
+        True if a table was migrated.
+    """
+    from jobs.retention import create_partition_sql
+    from models.epg import EPGProgramModel
+
+    # API processes and workers may start at the same time
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('ptepg.migrate_programs'))"))
+    kind = conn.scalar(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass('programs')")
+    )
+    if kind != "r":
+        return False
+
+    logger.warning("The programs table is not partitioned, migrating it...")
+    conn.execute(text("ALTER TABLE programs RENAME TO programs_legacy"))
+    # Free the index, constraint and sequence names for the new table
+    indexes = conn.scalars(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = 'programs_legacy'")
+    ).all()
+    for index in indexes:
+        conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index}_legacy"'))
+    sequence = conn.scalar(text("SELECT pg_get_serial_sequence('programs_legacy', 'id')"))
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO programs_legacy_id_seq"))
+
+    types = dict(
+        conn.execute(
+            text(
+                "SELECT column_name, data_type FROM information_schema.columns "
+                "WHERE table_name = 'programs_legacy'"
+            )
+        ).all()
+    )
+    columns = [column for column in LEGACY_PROGRAM_COLUMNS if column in types]
+    values = [
+        f"\"{column}\" AT TIME ZONE '{GUIDE_TIMEZONE}'"
+        if column in LEGACY_TIME_COLUMNS and types[column] == "timestamp without time zone"
+        else f'"{column}"'
+        for column in columns
+    ]
+    start = values[columns.index("start_date_time")]
+    end = values[columns.index("end_date_time")]
+
+    EPGProgramModel.__table__.create(bind=conn)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=PROGRAM_RETENTION_DAYS)
+    first, last = conn.execute(
+        text(
+            f"SELECT min({start}), max({start}) FROM programs_legacy "
+            f"WHERE {end} >= :cutoff"
+        ),
+        {"cutoff": cutoff},
+    ).one()
+    if first is not None:
+        day = first.astimezone(timezone.utc).date()
+        while day <= last.astimezone(timezone.utc).date():
+            conn.execute(text(create_partition_sql(day)))
+            day += timedelta(days=1)
+
+    names = ", ".join(f'"{column}"' for column in columns)
+    copied = conn.execute(
+        text(
+            f"INSERT INTO programs ({names}) SELECT {', '.join(values)} FROM programs_legacy "
+            f"WHERE meo_program_id IS NOT NULL AND {start} IS NOT NULL AND {end} >= :cutoff "
+            f"ON CONFLICT (meo_program_id, start_date_time) DO NOTHING"
+        ),
+        {"cutoff": cutoff},
+    ).rowcount
+    conn.execute(text("DROP TABLE programs_legacy"))
+    logger.warning(f"Migrated {copied} programs into the partitioned programs table.")
+    return True
+
+
 def initialize_database():
     """Import all models and create tables"""
     try:
@@ -46,7 +207,18 @@ def initialize_database():
 
         # This import is needed to register models with Base.metadata
         logger.info("Registering models...")
+        from models.api_key import ApiKeyModel
         from models.epg import EPGChannelModel, EPGProgramModel
+        from models.sync import (
+            EPGGenerationModel,
+            RateBudgetModel,
+            SyncJobModel,
+            SyncRunModel,
+        )
+
+        # create_all leaves an existing table's layout alone
+        with engine.begin() as conn:
+            migrate_programs_table(conn)
 
         # Now create all tables
         logger.info("Creating tables if they don't exist...")
@@ -0,0 +1,67 @@
+# Guide generation: bumped whenever a sync changes the stored guide
+from datetime import datetime, timezone
+from typing import NamedTuple
+from sqlalchemy import select
+from models.sync import EPGGenerationModel
+from utils.db import get_db
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class Generation(NamedTuple):
+    number: int
+    # Whole seconds, as HTTP dates cannot carry more precision
+    timestamp: datetime
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+# Until a generation is loaded, treat the process start as the last modification
+_current = Generation(0, _now())
+
+
+def current_generation() -> Generation:
+    """Return the in-memory generation; never touches the database."""
+    return _current
+
+
+def _from_row(row: EPGGenerationModel) -> Generation:
+    return Generation(
+        row.id, row.completed_at.replace(tzinfo=timezone.utc, microsecond=0)
+    )
+
+
+def load_generation() -> Generation:
+    """Refresh the in-memory generation from the latest row in the database."""
+    global _current
+    db = next(get_db())
+    try:
+        row = db.scalar(
+            select(EPGGenerationModel).order_by(EPGGenerationModel.id.desc()).limit(1)
+        )
+    finally:
+        db.close()
+    if row is not None and row.id != _current.number:
+        _current = _from_row(row)
+    return _current
+
+
+def bump_generation() -> Generation:
+    """Record a new generation after a sync committed changes to the guide."""
+    global _current
+    db = next(get_db())
+    try:
+        row = EPGGenerationModel(completed_at=_now().replace(tzinfo=None))
+        db.add(row)
+        db.commit()
+        _current = _from_row(row)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    logger.info(f"Guide generation is now {_current.number}.")
+    return _current
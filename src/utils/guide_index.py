@@ -0,0 +1,287 @@
+# In-process read model of the stored guide, rebuilt after every sync
+import sys
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import select
+from models.epg import EPGChannelModel, EPGProgramModel
+from schemas.epg import (
+    EpgChannelSchema,
+    EpgProgramSchema,
+    channel_schema,
+    program_schema,
+)
+from utils.constants import GUIDE_INDEX_HISTORY_HOURS
+from utils.db import get_db
+from utils.generation import current_generation, load_generation
+from utils.logger import get_logger
+from utils.timestamps import to_utc
+
+logger = get_logger(__name__)
+
+
+class ChannelSchedule:
+    """Programs of one channel sorted by start time, searchable by bisection.
+
+    `max_ends[i]` is the latest end time among programs 0..i. It never
+    decreases, so bisecting it finds the first program that may still be airing
+    at a given time even if upstream data contains overlapping programs.
+    """
+
+    __slots__ = ("channel", "starts", "ends", "max_ends", "programs")
+
+    def __init__(self, channel: EpgChannelSchema, rows: List[tuple]):
+        self.channel = channel
+        self.starts: List[datetime] = [row[0] for row in rows]
+        self.ends: List[datetime] = [row[1] for row in rows]
+        self.programs: List[EpgProgramSchema] = [row[2] for row in rows]
+        self.max_ends: List[datetime] = []
+        latest = None
+        for end in self.ends:
+            latest = end if latest is None or end > latest else latest
+            self.max_ends.append(latest)
+
+    def window(self, start: datetime, end: datetime) -> List[EpgProgramSchema]:
+        """Programs airing in [start, end)."""
+        stop = bisect_left(self.starts, end)
+        return [
+            self.programs[i]
+            for i in range(bisect_right(self.max_ends, start), stop)
+            if self.ends[i] > start
+        ]
+
+    def now_next(self, at: datetime) -> tuple:
+        """Return (program airing at `at`, following program), either may be None."""
+        current = following = None
+        for i in range(bisect_right(self.max_ends, at), len(self.starts)):
+            if self.ends[i] <= at:
+                continue
+            if self.starts[i] <= at and current is None:
+                current = self.programs[i]
+            elif self.starts[i] > at:
+                following = self.programs[i]
+                break
+        return current, following
+
+
+class GuideIndex:
+    def __init__(
+        self,
+        schedules: List[ChannelSchedule],
+        covers_from: datetime,
+        build_seconds: float,
+        by_program_id: Optional[Dict[str, EpgProgramSchema]] = None,
+        size_bytes: Optional[int] = None,
+    ):
+        """Initialize the index.
+
+        Args:
+            schedules: Per-channel schedules, in channel list order.
+            covers_from: Programs that ended before this time are not indexed.
+            build_seconds: Time it took to load and build the index.
+            by_program_id: Programs of all schedules by id, if already known.
+            size_bytes: Memory held by the schedules, if already known.
+        """
+        self.schedules = schedules
+        self.by_meo_id: Dict[str, ChannelSchedule] = {
+            schedule.channel.meo_id: schedule for schedule in schedules
+        }
+        if by_program_id is None:
+            by_program_id = {
+                program.id: program
+                for schedule in schedules
+                for program in schedule.programs
+            }
+        self.by_program_id = by_program_id
+        self.covers_from = covers_from
+        self.build_seconds = build_seconds
+        self.built_at = datetime.utcnow()
+        self.size_bytes = _deep_sizeof(self.schedules) if size_bytes is None else size_bytes
+
+    def replace(self, schedules: List[ChannelSchedule], build_seconds: float) -> "GuideIndex":
+        """A copy of the index with some channels' schedules swapped for new ones.
+
+        Only the replaced channels are walked, so the cost does not grow with
+        the size of the guide.
+        """
+        replaced = {schedule.channel.meo_id: schedule for schedule in schedules}
+        old = [self.by_meo_id[meo_id] for meo_id in replaced]
+        by_program_id = dict(self.by_program_id)
+        for schedule in old:
+            for program in schedule.programs:
+                by_program_id.pop(program.id, None)
+        for schedule in schedules:
+            for program in schedule.programs:
+                by_program_id[program.id] = program
+        return GuideIndex(
+            [replaced.get(schedule.channel.meo_id, schedule) for schedule in self.schedules],
+            self.covers_from,
+            build_seconds,
+            by_program_id,
+            self.size_bytes - _deep_sizeof(old) + _deep_sizeof(schedules),
+        )
+
+    def channels(self) -> List[EpgChannelSchema]:
+        return [schedule.channel for schedule in self.schedules]
+
+    def window(
+        self, meo_id: str, start: datetime, end: datetime
+    ) -> Optional[List[EpgProgramSchema]]:
+        """Programs of a channel in [start, end), or None if the channel or window isn't indexed."""
+        schedule = self.by_meo_id.get(meo_id)
+        if schedule is None or start < self.covers_from:
+            return None
+        return schedule.window(start, end)
+
+    def now_next(self, at: datetime) -> Optional[List[dict]]:
+        """Now and next on every channel, or None if `at` is before the indexed range."""
+        if at < self.covers_from:
+            return None
+        results = []
+        for schedule in self.schedules:
+            current, following = schedule.now_next(at)
+            results.append(
+                {"channel": schedule.channel, "now": current, "next": following}
+            )
+        return results
+
+    def program(self, program_id: str) -> Optional[EpgProgramSchema]:
+        return self.by_program_id.get(program_id)
+
+    def stats(self) -> dict:
+        return {
+            "channels": len(self.schedules),
+            "programs": len(self.by_program_id),
+            "size_bytes": self.size_bytes,
+            "build_seconds": self.build_seconds,
+            "built_at": self.built_at.isoformat(),
+        }
+
+
+def _deep_sizeof(root) -> int:
+    """Approximate memory held by the index (containers, slotted objects and pydantic models)."""
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            stack.extend(obj)
+        elif isinstance(obj, ChannelSchedule):
+            stack.extend(getattr(obj, slot) for slot in ChannelSchedule.__slots__)
+        elif hasattr(obj, "__dict__"):
+            stack.append(obj.__dict__)
+    return total
+
+
+def _load_schedules(
+    covers_from: datetime, meo_ids: Optional[List[str]] = None
+) -> List[ChannelSchedule]:
+    """Load the schedules of all channels, or of the given ones, in channel list order."""
+    db = next(get_db())
+    try:
+        query = select(EPGChannelModel).order_by(EPGChannelModel.position, EPGChannelModel.id)
+        if meo_ids is not None:
+            query = query.where(EPGChannelModel.meo_id.in_(meo_ids))
+        channels = db.scalars(query).all()
+        rows: Dict[int, List[tuple]] = {channel.id: [] for channel in channels}
+        query = select(EPGProgramModel).where(
+            EPGProgramModel.end_date_time > covers_from,
+            EPGProgramModel.removed_at.is_(None),
+        )
+        if meo_ids is not None:
+            query = query.where(EPGProgramModel.channel_id.in_(list(rows)))
+        programs = db.execute(
+            query.order_by(EPGProgramModel.channel_id, EPGProgramModel.start_date_time)
+            .execution_options(yield_per=5000)
+        ).scalars()
+        for program in programs:
+            if program.channel_id in rows and program.start_date_time is not None:
+                rows[program.channel_id].append(
+                    (program.start_date_time, program.end_date_time, program_schema(program))
+                )
+        return [
+            ChannelSchedule(channel_schema(channel), rows[channel.id])
+            for channel in channels
+        ]
+    finally:
+        db.close()
+
+
+def build_guide_index(now: Optional[datetime] = None) -> GuideIndex:
+    """Load channels and recent/future programs from the database into a new index."""
+    started = time.perf_counter()
+    covers_from = to_utc(now) - timedelta(hours=GUIDE_INDEX_HISTORY_HOURS)
+    schedules = _load_schedules(covers_from)
+    return GuideIndex(schedules, covers_from, time.perf_counter() - started)
+
+
+# The current index; replaced as a whole so readers always see a consistent snapshot
+_guide_index: Optional[GuideIndex] = None
+# Held while a new index is derived, so a concurrent rebuild is never overwritten
+_swap_lock = threading.RLock()
+
+
+def get_guide_index() -> Optional[GuideIndex]:
+    return _guide_index
+
+
+def rebuild_guide_index() -> Optional[GuideIndex]:
+    """Build a fresh index and swap it in atomically, keeping the old one on failure."""
+    global _guide_index
+    with _swap_lock:
+        try:
+            index = build_guide_index()
+        except Exception as e:
+            logger.error(f"Guide index rebuild failed: {e}")
+            return _guide_index
+        _guide_index = index
+    logger.info(f"Guide index rebuilt: {index.stats()}")
+    return index
+
+
+def refresh_guide_channels(meo_ids: Iterable[str]) -> Optional[GuideIndex]:
+    """
+    Reload the schedules of some channels and swap in an index with them, keeping the others.
+
+    The whole index is rebuilt instead if there is none yet, a channel is not
+    indexed (or changed position), or the index still holds programs from over
+    twice GUIDE_INDEX_HISTORY_HOURS ago, which bounds its memory.
+    """
+    global _guide_index
+    meo_ids = list(meo_ids)
+    stale = to_utc(None) - timedelta(hours=2 * GUIDE_INDEX_HISTORY_HOURS)
+    with _swap_lock:
+        index = _guide_index
+        if index is None or index.covers_from < stale:
+            return rebuild_guide_index()
+        started = time.perf_counter()
+        try:
+            schedules = _load_schedules(index.covers_from, meo_ids)
+        except Exception as e:
+            logger.error(f"Guide index refresh of {len(meo_ids)} channels failed: {e}")
+            return index
+        for schedule in schedules:
+            indexed = index.by_meo_id.get(schedule.channel.meo_id)
+            if indexed is None or indexed.channel.position != schedule.channel.position:
+                return rebuild_guide_index()
+        _guide_index = index.replace(schedules, time.perf_counter() - started)
+    logger.info(f"Guide index refreshed for {len(schedules)} channels: {_guide_index.stats()}")
+    return _guide_index
+
+
+def follow_generation() -> Optional[GuideIndex]:
+    """Rebuild the index once another process (a sync worker) recorded a new generation."""
+    number = current_generation().number
+    if load_generation().number != number:
+        return rebuild_guide_index()
+    return _guide_index
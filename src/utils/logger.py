@@ -1,4 +1,15 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict
+from utils.constants import LOG_AGGREGATE_SECONDS, LOG_FORMAT, LOG_LEVEL, LOG_LEVELS
 
 
 class ColoredFormatter(logging.Formatter):
@@ -12,29 +23,125 @@ class ColoredFormatter(logging.Formatter):
     }
     RESET = "\033[0m"  # Reset color to default
 
+    def formatMessage(self, record):
+        # Color a copy of the attributes; the record itself may be shared with other handlers
+        color = self.LEVEL_COLORS.get(record.levelname)
+        values = dict(record.__dict__)
+        if color:
+            values["levelname"] = f"{color}{record.levelname}{self.RESET}"
+        return self._style._fmt % values
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
     def format(self, record):
-        # Get the original log level name
-        levelname = record.levelname
-        # Apply color to the log level if it exists in LEVEL_COLORS
-        if levelname in self.LEVEL_COLORS:
-            colored_levelname = f"{self.LEVEL_COLORS[levelname]}{levelname}{self.RESET}"
-            record.levelname = colored_levelname
-        # Let the parent class handle the rest of the formatting
-        return super().format(record)
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RawQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records unformatted, so the listener's handler formats them, exceptions included.
+
+    The stock `prepare` formats on the calling thread and drops `exc_info`.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        # Arguments may change once the caller moves on, merge them now
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _parse_levels(value: str) -> Dict[str, str]:
+    """Parse "ptepg.jobs.programs=WARNING,sqlalchemy.engine=INFO"."""
+    levels = {}
+    for item in value.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
 
 
 # Create and configure the logger
 logger = logging.getLogger("ptepg")
-logger.setLevel(logging.DEBUG)  # Capture all log levels
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
 
-# Create a console handler
+# Records are only enqueued on the calling thread (the event loop); formatting
+# and the blocking write to stderr happen on the listener thread
 handler = logging.StreamHandler()
-handler.setLevel(logging.DEBUG)
+if LOG_FORMAT == "json":
+    handler.setFormatter(JsonFormatter())
+elif sys.stderr.isatty():
+    # Set the format to match "INFO:     Waiting for application shutdown."
+    # Use 5 spaces after the colon to align with the example
+    handler.setFormatter(ColoredFormatter("%(levelname)s:     %(message)s"))
+else:
+    handler.setFormatter(logging.Formatter("%(levelname)s:     %(message)s"))
+
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+queue_handler = RawQueueHandler(log_queue)
+listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+logger.addHandler(queue_handler)
+
+# Per-module levels; loggers outside "ptepg" (e.g. sqlalchemy.engine) get the queue handler too
+for name, level in _parse_levels(LOG_LEVELS).items():
+    configured = logging.getLogger(name)
+    configured.setLevel(level)
+    if name != "ptepg" and not name.startswith("ptepg."):
+        configured.addHandler(queue_handler)
+        configured.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger of a module (pass `__name__`), so its level can be set on its own."""
+    return logger.getChild(name)
+
+
+class EventCounter:
+    """Aggregates a repetitive per-item event into one INFO line per interval.
+
+    Use instead of logging every channel or program fetched; the individual
+    events can still be logged at DEBUG.
+    """
+
+    def __init__(self, log: logging.Logger, event: str, interval: float = LOG_AGGREGATE_SECONDS):
+        """Initialize the counter.
 
-# Set the format to match "INFO:     Waiting for application shutdown."
-# Use 5 spaces after the colon to align with the example
-formatter = ColoredFormatter("%(levelname)s:     %(message)s")
-handler.setFormatter(formatter)
+        Args:
+            log: Logger to report to.
+            event: Past-tense description, e.g. "program details fetched".
+            interval: Minimum seconds between two reports.
+        """
+        self.log = log
+        self.event = event
+        self.interval = interval
+        self.count = 0
+        self.total = 0
+        self.since = time.monotonic()
+        self._lock = threading.Lock()
 
-# Attach the handler to the logger
-logger.addHandler(handler)
+    def add(self, count: int = 1):
+        with self._lock:
+            self.count += count
+            self.total += count
+            now = time.monotonic()
+            if now - self.since < self.interval:
+                return
+            count, elapsed = self.count, now - self.since
+            self.count, self.since = 0, now
+        self.log.info(
+            f"{count} {self.event} in the last {elapsed:.0f}s ({self.total} in total)."
+        )
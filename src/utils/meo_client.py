@@ -0,0 +1,381 @@
+# Shared HTTP client for the MEO endpoints
+import asyncio
+import json
+import random
+import time
+from contextlib import asynccontextmanager
+import aiohttp
+import ijson
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+from utils.constants import (
+    CHANNEL_DETAILS_URL,
+    GUIDE_STREAM_CHUNK_SIZE,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    GRID_URL,
+    HEADERS,
+    MEO_CONNECT_TIMEOUT,
+    MEO_DNS_CACHE_TTL,
+    MEO_KEEPALIVE_TIMEOUT,
+    MEO_MAX_CONNECTIONS,
+    MEO_MAX_CONNECTIONS_PER_HOST,
+    MEO_MAX_RETRIES,
+    MEO_REQUEST_TIMEOUT,
+    MEO_RETRY_BASE_DELAY,
+    MEO_RETRY_MAX_DELAY,
+    PROGRAM_DETAILS_URL,
+    PROGRAMS_URL,
+)
+from utils.logger import get_logger
+from utils.metrics import meo_request_failures, meo_request_seconds, meo_requests
+from utils.rate_limit import acquire_token, record_response
+from utils.tracing import record_span
+
+logger = get_logger(__name__)
+
+MEO_URLS = {
+    "grid": GRID_URL,
+    "channel_info": CHANNEL_DETAILS_URL,
+    "guide": PROGRAMS_URL,
+    "detail": PROGRAM_DETAILS_URL,
+}
+
+
+class MeoRequestError(Exception):
+    """A MEO request failed for good (after retries, or with a non-retryable status)."""
+
+
+class CircuitOpenError(MeoRequestError):
+    """The endpoint's circuit breaker is open and the request was shed."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        """Initialize the circuit breaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit.
+            reset_timeout: Seconds the circuit stays open before a trial request is let through.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Return whether a request may be sent right now."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(
+                    f"Circuit opened after {self.failures} consecutive failures."
+                )
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+
+def _retry_after(response: aiohttp.ClientResponse) -> Optional[float]:
+    """Parse a numeric Retry-After header."""
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+def _decode_json(body: bytes) -> Any:
+    """Decode a JSON body like aiohttp's `response.json(content_type=None)`."""
+    stripped = body.strip()
+    return json.loads(stripped) if stripped else None
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(MEO_RETRY_MAX_DELAY, MEO_RETRY_BASE_DELAY * 2**attempt))
+
+
+def _guide_request(
+    call_letters: List[str], start_date: datetime, end_date: datetime
+) -> dict:
+    return {
+        "service": "channelsguide",
+        "channels": call_letters,
+        "dateStart": start_date.isoformat() + "Z",
+        "dateEnd": end_date.isoformat() + "Z",
+        "accountID": "",
+    }
+
+
+class _ChunkedReader:
+    """File-like view of a response body for ijson, reading at most one chunk per call."""
+
+    def __init__(self, content: aiohttp.StreamReader):
+        self.content = content
+
+    async def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > GUIDE_STREAM_CHUNK_SIZE:
+            size = GUIDE_STREAM_CHUNK_SIZE
+        return await self.content.read(size)
+
+
+class _Attempt:
+    """One try of a MEO request, recording its outcome on the circuit breaker and in the metrics."""
+
+    def __init__(self, endpoint: str, breaker: CircuitBreaker):
+        self.endpoint = endpoint
+        self.breaker = breaker
+        # Why the attempt failed, if it may be retried
+        self.error: Optional[str] = None
+        # Delay before the next attempt requested by the server (Retry-After)
+        self.delay: Optional[float] = None
+        # When the body was fully read, if it was read at once
+        self.received: Optional[float] = None
+        # Items were handed out, so a failure can no longer be retried
+        self.yielded = False
+
+    @asynccontextmanager
+    async def send(
+        self,
+        session: aiohttp.ClientSession,
+        method: str,
+        url: str,
+        streamed: bool = False,
+        **kwargs,
+    ) -> AsyncIterator[Optional[aiohttp.ClientResponse]]:
+        """
+        Send the request once it is allowed by the rate limiter.
+
+        Yields the response if it succeeded, or None for a retryable status.
+        Timeouts and connection errors, also while the caller reads the body,
+        are recorded as the attempt's error; the breaker only records a success
+        if the caller leaves without setting `error`.
+
+        Raises:
+            MeoRequestError: For a non-retryable status, or if the body breaks
+                off after items were yielded.
+        """
+        endpoint = self.endpoint
+        await acquire_token(endpoint)
+        status = "error"
+        # Covers the whole body, for streams including time the consumer spends between items
+        started = time.perf_counter()
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                status = str(response.status)
+                retry_after = _retry_after(response)
+                record_response(endpoint, response.status, retry_after)
+                if response.status == 429 or response.status >= 500:
+                    self.error = f"HTTP {response.status}"
+                    self.delay = retry_after
+                    yield None
+                elif response.status >= 400:
+                    # The request itself is wrong, MEO is not degraded
+                    self.breaker.record_success()
+                    meo_request_failures.labels(endpoint).inc()
+                    raise MeoRequestError(f"{endpoint} returned HTTP {response.status}")
+                else:
+                    yield response
+        except (aiohttp.ClientError, asyncio.TimeoutError, ijson.JSONError) as e:
+            self.error = repr(e)
+            if self.yielded:
+                self.breaker.record_failure()
+                meo_request_failures.labels(endpoint).inc()
+                raise MeoRequestError(
+                    f"{endpoint} response broke off mid-stream: {self.error}"
+                ) from e
+        finally:
+            ended = time.perf_counter()
+            meo_request_seconds.labels(endpoint).observe(ended - started)
+            meo_requests.labels(endpoint, status).inc()
+            # Decoding of streams is interleaved with the download
+            extra = {"streamed": True} if streamed else {}
+            record_span(
+                "meo_request",
+                started,
+                self.received or ended,
+                endpoint=endpoint,
+                status=status,
+                **extra,
+            )
+        if self.error is None:
+            self.breaker.record_success()
+
+
+class MeoClient:
+    def __init__(self, urls: Optional[Dict[str, str]] = None):
+        """Initialize the client.
+
+        Args:
+            urls: Endpoint URLs keyed by endpoint name, defaults to the MEO production URLs.
+        """
+        self.urls = {**MEO_URLS, **(urls or {})}
+        self.breakers = {
+            endpoint: CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+            for endpoint in self.urls
+        }
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "MeoClient":
+        connector = aiohttp.TCPConnector(
+            limit=MEO_MAX_CONNECTIONS,
+            limit_per_host=MEO_MAX_CONNECTIONS_PER_HOST,
+            ttl_dns_cache=MEO_DNS_CACHE_TTL,
+            keepalive_timeout=MEO_KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=MEO_REQUEST_TIMEOUT, connect=MEO_CONNECT_TIMEOUT
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector, timeout=timeout, headers=HEADERS
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    async def _attempts(self, endpoint: str) -> AsyncIterator["_Attempt"]:
+        """
+        Yield one attempt per try of a request, backing off between them.
+
+        The caller sends each attempt and leaves the loop once one succeeds;
+        reaching the next iteration counts the previous attempt as failed.
+
+        Raises:
+            CircuitOpenError: If the endpoint's circuit breaker is open.
+            MeoRequestError: Once all retries have failed.
+        """
+        breaker = self.breakers[endpoint]
+        last_error = None
+        for attempt in range(MEO_MAX_RETRIES + 1):
+            if not breaker.allow():
+                meo_request_failures.labels(endpoint).inc()
+                raise CircuitOpenError(f"Circuit for {endpoint} is open")
+
+            current = _Attempt(endpoint, breaker)
+            yield current
+
+            last_error = current.error
+            breaker.record_failure()
+            if attempt < MEO_MAX_RETRIES:
+                delay = current.delay if current.delay is not None else _backoff(attempt)
+                logger.warning(
+                    f"{endpoint} request failed ({last_error}), retrying in {delay:.1f}s..."
+                )
+                await asyncio.sleep(delay)
+
+        meo_request_failures.labels(endpoint).inc()
+        raise MeoRequestError(
+            f"{endpoint} request failed after {MEO_MAX_RETRIES + 1} attempts: {last_error}"
+        )
+
+    async def request_json(
+        self, endpoint: str, method: str, url: str, **kwargs
+    ) -> Any:
+        """
+        Send a rate-limited request and return the decoded JSON body.
+
+        429, 5xx, bodies that are not JSON, timeouts and connection errors are
+        retried with jittered exponential backoff (or the server's Retry-After);
+        other 4xx fail immediately.
+
+        Raises:
+            CircuitOpenError: If the endpoint's circuit breaker is open.
+            MeoRequestError: If the request still fails after all retries.
+        """
+        async for attempt in self._attempts(endpoint):
+            async with attempt.send(self.session, method, url, **kwargs) as response:
+                if response is None:
+                    continue
+                body = await response.read()
+                attempt.received = time.perf_counter()
+                try:
+                    data = _decode_json(body)
+                except ValueError as e:
+                    # E.g. an HTML error page served with status 200
+                    attempt.error = f"invalid JSON body: {e!r}"
+                    continue
+                record_span("json_decode", attempt.received, time.perf_counter())
+                return data
+
+    async def stream_json_items(
+        self, endpoint: str, method: str, url: str, prefix: str, **kwargs
+    ) -> AsyncIterator[Any]:
+        """
+        Send a rate-limited request and yield the JSON values at `prefix` while the body arrives.
+
+        Decoding is incremental (ijson), so each item can be processed before the
+        response is complete and only one item is held in memory at a time.
+        Failures are retried like in `request_json` as long as no item has been
+        yielded yet; a body that breaks off later raises, since replaying it would
+        hand out items twice.
+
+        Args:
+            prefix: ijson path of the items, e.g. "d.channels.item".
+
+        Raises:
+            CircuitOpenError: If the endpoint's circuit breaker is open.
+            MeoRequestError: If the request fails after all retries or mid-stream.
+        """
+        async for attempt in self._attempts(endpoint):
+            async with attempt.send(
+                self.session, method, url, streamed=True, **kwargs
+            ) as response:
+                if response is None:
+                    continue
+                async for item in ijson.items_async(
+                    _ChunkedReader(response.content), prefix, use_float=True
+                ):
+                    attempt.yielded = True
+                    yield item
+                return
+
+    async def get_grid(self) -> Any:
+        """Fetch the channel grid (getGridAnon)."""
+        return await self.request_json("grid", "POST", self.urls["grid"])
+
+    async def get_channel_info(self, call_letter: str) -> Any:
+        """Fetch channel details (GetChannelInfo) for a channel call letter."""
+        return await self.request_json(
+            "channel_info", "GET", self.urls["channel_info"] + call_letter
+        )
+
+    def stream_programs(
+        self, call_letters: List[str], start_date: datetime, end_date: datetime
+    ) -> AsyncIterator[dict]:
+        """Yield each channel of the guide listing (getProgramsFromChannels) as soon as it is decoded."""
+        return self.stream_json_items(
+            "guide",
+            "POST",
+            self.urls["guide"],
+            "d.channels.item",
+            json=_guide_request(call_letters, start_date, end_date),
+        )
+
+    async def get_program_details(self, program_id: str) -> Any:
+        """Fetch program details (getProgramDetails) for a single program."""
+        data = {"service": "programdetail", "programID": program_id, "accountID": ""}
+        return await self.request_json("detail", "POST", self.urls["detail"], json=data)
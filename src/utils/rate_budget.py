@@ -0,0 +1,96 @@
+# Request budget towards MEO shared by every sync worker, kept in Postgres
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+from sqlalchemy import text
+from utils.db import async_engine
+
+# GCRA: the row holds the theoretical arrival time (tat) of the next free slot.
+# Reserving n slots pushes it n/rate seconds ahead of max(tat, now); the first
+# reserved slot starts `delay` seconds from now.
+RESERVE_SQL = text(
+    """
+    UPDATE rate_budgets
+    SET tat = GREATEST(tat, clock_timestamp()) + make_interval(secs => CAST(:cost AS double precision))
+    WHERE name = :name
+    RETURNING EXTRACT(EPOCH FROM (tat - clock_timestamp())) - CAST(:cost AS double precision) AS delay
+    """
+)
+CREATE_SQL = text(
+    """
+    INSERT INTO rate_budgets (name, tat) VALUES (:name, clock_timestamp())
+    ON CONFLICT (name) DO NOTHING
+    """
+)
+
+
+class SharedRateBudget:
+    def __init__(self, name: str, rate: float, block: int):
+        """Initialize the budget.
+
+        Args:
+            name: Row of rate_budgets shared by the processes using this budget.
+            rate: Requests per second allowed across all processes.
+            block: Slots reserved per round trip to the database.
+        """
+        self.name = name
+        self.rate = rate
+        self.block = max(block, 1)
+        self._slots: Deque[float] = deque()
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.reservations = 0
+        self.acquired = 0
+        self.expired = 0
+        self.total_wait = 0.0
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+    async def _reserve(self) -> float:
+        """Reserve a block of slots and return the seconds until the first one."""
+        cost = self.block / self.rate
+        params = {"name": self.name, "cost": cost}
+        async with async_engine.begin() as connection:
+            delay = (await connection.execute(RESERVE_SQL, params)).scalar()
+            if delay is None:
+                await connection.execute(CREATE_SQL, {"name": self.name})
+                delay = (await connection.execute(RESERVE_SQL, params)).scalar()
+        self.reservations += 1
+        return max(float(delay), 0.0)
+
+    async def acquire(self):
+        """Wait for this process's next slot of the shared budget."""
+        started = time.monotonic()
+        async with self._get_lock():
+            # Slots nobody used in time are given up rather than spent in a burst
+            while self._slots and self._slots[0] < started - 1 / self.rate:
+                self._slots.popleft()
+                self.expired += 1
+            if not self._slots:
+                delay = await self._reserve()
+                first = time.monotonic() + delay
+                self._slots.extend(first + i / self.rate for i in range(self.block))
+            slot = self._slots.popleft()
+
+        # Slots are already spaced out, so waiters sleep concurrently
+        delay = slot - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.acquired += 1
+        self.total_wait += time.monotonic() - started
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "rate": self.rate,
+            "acquired": self.acquired,
+            "reservations": self.reservations,
+            "expired": self.expired,
+            "avg_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+        }
+
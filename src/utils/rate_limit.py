@@ -1,38 +1,249 @@
 # Token Bucket for rate limiting
 import asyncio
-from datetime import datetime
-from utils.constants import REQUESTS_PER_SECOND
+import time
+from typing import Dict, Optional
+from utils.constants import (
+    ENDPOINT_RATE_LIMITS,
+    MAX_REQUESTS_PER_SECOND,
+    MIN_REQUESTS_PER_SECOND,
+    REQUESTS_PER_SECOND,
+)
+from utils.metrics import rate_limit_wait_seconds, registry
+from utils.tracing import record_token, span
+
+# Multiplicative decrease applied when upstream signals overload
+BACKOFF_FACTOR = 0.5
+# Consecutive healthy responses before the rate is probed upwards
+PROBE_AFTER = 20
 
 
 class TokenBucket:
-    def __init__(self, rate: int, per: float):
+    def __init__(
+        self,
+        rate: float,
+        per: float,
+        min_rate: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        name: str = "global",
+        capacity: Optional[float] = None,
+    ):
         """Initialize the token bucket.
 
         Args:
             rate: Number of requests allowed per time period.
             per: Time period in seconds (e.g., 1.0 for per second, 60.0 for per minute).
+            min_rate: Lowest rate the bucket backs off to, defaults to `rate`.
+            max_rate: Highest rate the bucket probes up to, defaults to `rate`.
+            name: Name used in stats.
+            capacity: Largest burst, defaults to one period's worth of requests.
         """
+        self.name = name
         self.rate = rate
         self.per = per
-        self.capacity = rate
-        self.tokens = rate
-        self.last_refill = datetime.now()
+        self.min_rate = min_rate if min_rate is not None else rate
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._healthy_streak = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.backoffs = 0
+        self.probes = 0
+        # Created on the first blocking acquire, so buckets only used with
+        # try_acquire (one per API key) add no metric series
+        self.wait_histogram = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        """Return the waiter lock, recreating it if the bucket is used from a new event loop.
+
+        asyncio.Lock hands itself over in FIFO order, so waiters are served fairly
+        and only the head of the queue is ever sleeping.
+        """
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
 
     async def acquire(self):
-        """Acquire a token, waiting if none are available."""
-        while self.tokens < 1:
-            await asyncio.sleep(0.1)  # Brief sleep to avoid busy-waiting
-            self.refill()
-        self.tokens -= 1
-
-    def refill(self):
-        """Refill tokens based on elapsed time."""
-        now = datetime.now()
-        time_passed = (now - self.last_refill).total_seconds()
+        """Acquire a token, sleeping exactly as long as needed for one to be available."""
+        started = time.monotonic()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            async with self._get_lock():
+                while True:
+                    now = self.refill()
+                    delay = self.blocked_until - now
+                    if delay <= 0 and self.tokens >= 1:
+                        break
+                    # The rate may change while sleeping, so re-check after waking up
+                    delay = max(delay, (1 - self.tokens) * self.per / self.rate)
+                    await asyncio.sleep(delay)
+                self.tokens -= 1
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        if self.wait_histogram is None:
+            self.wait_histogram = rate_limit_wait_seconds.labels(self.name)
+        self.wait_histogram.observe(waited)
+
+    def try_acquire(self) -> float:
+        """Take a token without waiting.
+
+        Returns:
+            0 if a token was taken, otherwise the seconds until one is available.
+        """
+        now = self.refill()
+        delay = self.blocked_until - now
+        if delay <= 0 and self.tokens >= 1:
+            self.tokens -= 1
+            self.acquired += 1
+            return 0.0
+        return max(delay, (1 - self.tokens) * self.per / self.rate)
+
+    def refill(self) -> float:
+        """Refill tokens based on elapsed time and return the current monotonic time."""
+        now = time.monotonic()
+        time_passed = now - self.last_refill
         tokens_to_add = time_passed * (self.rate / self.per)
         self.tokens = min(self.capacity, self.tokens + tokens_to_add)
         self.last_refill = now
+        return now
+
+    def record_response(self, status: int, retry_after: Optional[float] = None):
+        """Adapt the rate to an upstream response (AIMD).
+
+        429 and 5xx responses halve the rate down to `min_rate` and drop any
+        accumulated burst; a run of healthy responses raises it again by a
+        small step up to `max_rate`.
+
+        Args:
+            status: HTTP status of the response.
+            retry_after: Seconds to pause all requests for, from a Retry-After header.
+        """
+        now = self.refill()
+        if status == 429 or status >= 500:
+            self._healthy_streak = 0
+            self.rate = max(self.min_rate, self.rate * BACKOFF_FACTOR)
+            self.tokens = min(self.tokens, 0)
+            self.backoffs += 1
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+        elif status < 400:
+            self._healthy_streak += 1
+            if self._healthy_streak >= PROBE_AFTER and self.rate < self.max_rate:
+                self._healthy_streak = 0
+                step = max(self.max_rate * 0.1, 0.1)
+                self.rate = min(self.max_rate, self.rate + step)
+                self.probes += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Return wait-time and queue-depth statistics."""
+        return {
+            "rate": self.rate / self.per,
+            "tokens": self.tokens,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "acquired": self.acquired,
+            "total_wait": self.total_wait,
+            "avg_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+            "max_wait": self.max_wait,
+            "backoffs": self.backoffs,
+            "probes": self.probes,
+        }
+
+
+def _bucket(name: str, rate: float, max_rate: float) -> TokenBucket:
+    return TokenBucket(
+        rate=rate,
+        per=1.0,
+        min_rate=min(MIN_REQUESTS_PER_SECOND, rate),
+        max_rate=max_rate,
+        name=name,
+    )
+
+
+# Overall budget towards MEO, shared by every endpoint; never probes above
+# the configured rate unless MAX_REQUESTS_PER_SECOND is raised explicitly
+GLOBAL_MAX_RATE = max(REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND)
+token_bucket = _bucket("global", REQUESTS_PER_SECOND, GLOBAL_MAX_RATE)
+
+# Per-endpoint buckets (grid, channel_info, guide, detail), adapting between
+# MIN_REQUESTS_PER_SECOND and their configured rate, below the global budget
+endpoint_buckets: Dict[str, TokenBucket] = {
+    endpoint: _bucket(endpoint, min(rate, GLOBAL_MAX_RATE), min(rate, GLOBAL_MAX_RATE))
+    for endpoint, rate in ENDPOINT_RATE_LIMITS.items()
+}
+
+# Queue depth and current (adapted) rate are read from the buckets on scrape
+registry.gauge(
+    "ptepg_rate_limit_waiting",
+    "Requests currently waiting for a token, per bucket.",
+    ["bucket"],
+    collect=lambda: {
+        (bucket.name,): bucket.waiting for bucket in [token_bucket, *endpoint_buckets.values()]
+    },
+)
+registry.gauge(
+    "ptepg_rate_limit_rate",
+    "Current requests per second allowed by each bucket (after AIMD adaptation).",
+    ["bucket"],
+    collect=lambda: {
+        (bucket.name,): bucket.rate / bucket.per
+        for bucket in [token_bucket, *endpoint_buckets.values()]
+    },
+)
+
+# Budget shared with other processes (see utils.rate_budget), set by sync workers
+shared_budget = None
+
+
+def use_shared_budget(budget):
+    """Also wait for `budget` (with an async `acquire()` and `stats()`) before every request."""
+    global shared_budget
+    shared_budget = budget
+
+
+async def acquire_token(endpoint: Optional[str] = None):
+    """Wait for the endpoint's own bucket (if any), the global budget and the shared one."""
+    with span("rate_limit", activate=False, endpoint=endpoint):
+        bucket = endpoint_buckets.get(endpoint)
+        if bucket is not None:
+            await bucket.acquire()
+        await token_bucket.acquire()
+        record_token()
+        if shared_budget is not None:
+            await shared_budget.acquire()
+
+
+def record_response(
+    endpoint: Optional[str], status: int, retry_after: Optional[float] = None
+):
+    """Feed an upstream response into the endpoint bucket and the global budget."""
+    bucket = endpoint_buckets.get(endpoint)
+    if bucket is not None:
+        bucket.record_response(status, retry_after)
+    token_bucket.record_response(status, retry_after)
 
 
-# Initialize with a default rate limit (e.g., 10 requests per second)
-token_bucket = TokenBucket(rate=REQUESTS_PER_SECOND, per=1.0)
+def rate_limit_stats() -> Dict[str, Dict[str, float]]:
+    """Return stats for the global bucket and every endpoint bucket."""
+    stats = {
+        bucket.name: bucket.stats()
+        for bucket in [token_bucket, *endpoint_buckets.values()]
+    }
+    if shared_budget is not None:
+        stats["shared"] = shared_budget.stats()
+    return stats
@@ -0,0 +1,110 @@
+# Normalization of MEO guide-local date/time strings to aware UTC datetimes
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import pytz
+from utils.constants import GUIDE_TIMEZONE
+
+guide_timezone = pytz.timezone(GUIDE_TIMEZONE)
+
+
+@lru_cache(maxsize=1024)
+def parse_date(value: str) -> date:
+    """Parse a MEO date ("4-3-2025", day-month-year)."""
+    day, month, year = value.split("-")
+    return date(int(year), int(month), int(day))
+
+
+@lru_cache(maxsize=2048)
+def parse_time(value: str) -> time:
+    """Parse a MEO wall-clock time ("22:43", seconds are ignored)."""
+    hour, minute = value.split(":")[:2]
+    return time(int(hour), int(minute))
+
+
+def _instants(local: datetime) -> List[datetime]:
+    """Every UTC instant at which the guide's wall clock shows `local`.
+
+    Empty inside a spring-forward gap, two instants inside a fall-back fold.
+    """
+    instants = set()
+    for is_dst in (True, False):
+        instant = guide_timezone.localize(local, is_dst=is_dst).astimezone(timezone.utc)
+        # pytz also localizes nonexistent times, keep only the ones that round-trip
+        if instant.astimezone(guide_timezone).replace(tzinfo=None) == local:
+            instants.add(instant)
+    return sorted(instants)
+
+
+@lru_cache(maxsize=8192)
+def local_to_utc(local: datetime) -> datetime:
+    """Convert a naive guide-local datetime to UTC.
+
+    Ambiguous times resolve to their first occurrence; times skipped by the
+    spring-forward jump are read with the standard offset, i.e. moved forward.
+    """
+    instants = _instants(local)
+    if instants:
+        return instants[0]
+    return guide_timezone.localize(local, is_dst=False).astimezone(timezone.utc)
+
+
+@lru_cache(maxsize=16384)
+def program_times(
+    date_str: str, start_time_str: str, end_time_str: str
+) -> Tuple[datetime, datetime]:
+    """
+    Resolve a MEO program's date, start and end time to aware UTC datetimes.
+
+    The end is the first instant after the start at which the wall clock shows
+    the end time, which covers programs spanning midnight as well as a DST change.
+
+    Args:
+        date_str: The date string from the API (e.g., "4-3-2025").
+        start_time_str: The start time (e.g., "22:43").
+        end_time_str: The end time (e.g., "00:43").
+
+    Returns:
+        Tuple of (start_date_time, end_date_time) in UTC.
+
+    Raises:
+        ValueError: If any of the strings is malformed.
+    """
+    day = parse_date(date_str)
+    start_time = parse_time(start_time_str)
+    end_time = parse_time(end_time_str)
+
+    start = local_to_utc(datetime.combine(day, start_time))
+    if end_time == start_time:
+        return start, start
+    # An end time before the start time on the wall clock usually means the
+    # next day, unless a fall-back fold repeats that hour on the same day
+    end_days = [day] if end_time > start_time else [day, day + timedelta(days=1)]
+    for end_day in end_days:
+        for instant in _instants(datetime.combine(end_day, end_time)):
+            if instant > start:
+                return start, instant
+    # The end falls into a spring-forward gap
+    return start, max(start, local_to_utc(datetime.combine(end_days[-1], end_time)))
+
+
+def listing_times(listing: dict) -> Optional[Tuple[datetime, datetime]]:
+    """UTC (start, end) of a guide listing entry, or None if it has no valid times."""
+    date_str = listing.get("date")
+    start_time_str = listing.get("timeIni")
+    end_time_str = listing.get("timeEnd")
+    if not (date_str and start_time_str and end_time_str):
+        return None
+    try:
+        return program_times(date_str, start_time_str, end_time_str)
+    except ValueError:
+        return None
+
+
+def to_utc(value: Optional[datetime]) -> datetime:
+    """Convert a query datetime to aware UTC; naive values are read as guide-local time."""
+    if value is None:
+        return datetime.now(timezone.utc)
+    if value.tzinfo is None:
+        return local_to_utc(value)
+    return value.astimezone(timezone.utc)
@@ -0,0 +1,357 @@
+# Per-run span tracing and sampling profiler, written to local files (no collector needed)
+import asyncio
+import functools
+import gzip
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from utils.constants import (
+    PROFILE_INTERVAL,
+    TRACE_DIR,
+    TRACE_KEEP,
+    TRACE_MAX_SPANS,
+    TRACE_STAGES,
+    TRACING_ENABLED,
+)
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# The trace of the running sync and the span new spans are children of
+_trace: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_parent: ContextVar[int] = ContextVar("span_parent", default=0)
+
+_NULL_SPAN = nullcontext()
+
+
+class Trace:
+    def __init__(self, name: str, max_spans: int = TRACE_MAX_SPANS):
+        """Initialize the trace.
+
+        Args:
+            name: Identifies the traced run in file names and reports.
+            max_spans: Spans kept for the report; later ones only count in the totals.
+        """
+        self.name = name
+        self.max_spans = max_spans
+        self.started_at = datetime.now(timezone.utc)
+        self.origin = time.perf_counter()
+        # (id, parent id, name, start, end, attributes), times relative to `origin`
+        self.spans: List[tuple] = []
+        self.totals: Dict[str, List[float]] = {}
+        self.dropped = 0
+        # Times at which a request got a token from the global bucket
+        self.tokens: List[float] = []
+        self.rate: Optional[float] = None
+        self._ids = itertools.count(1)
+
+    def record(self, span: tuple):
+        total = self.totals.get(span[2])
+        if total is None:
+            total = self.totals[span[2]] = [0, 0.0]
+        total[0] += 1
+        total[1] += span[4] - span[3]
+        if len(self.spans) < self.max_spans:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def token(self):
+        self.tokens.append(time.perf_counter() - self.origin)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "attrs", "activate", "id", "parent", "start", "reset")
+
+    def __init__(self, trace: Trace, name: str, activate: bool, attrs: Optional[dict]):
+        self.trace = trace
+        self.name = name
+        self.activate = activate
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.id = next(self.trace._ids)
+        self.parent = _parent.get()
+        if self.activate:
+            self.reset = _parent.set(self.id)
+        self.start = time.perf_counter() - self.trace.origin
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        end = time.perf_counter() - self.trace.origin
+        if self.activate:
+            _parent.reset(self.reset)
+        attrs = self.attrs
+        if exc_type is not None:
+            attrs = {**(attrs or {}), "error": exc_type.__name__}
+        self.trace.record((self.id, self.parent, self.name, self.start, end, attrs))
+
+
+def span(name: str, activate: bool = True, **attrs):
+    """
+    Time a block as a span of the current trace; a no-op outside traced runs.
+
+    Args:
+        name: Span name, e.g. "fetch_program_details".
+        activate: Make spans opened inside the block its children. Pass False in
+            async generators, whose body runs in the consumer's context between yields.
+        attrs: Extra attributes stored with the span.
+    """
+    trace = _trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name, activate, attrs or None)
+
+
+def traced(name: str):
+    """Decorator running each call of an async function in a span."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_span(name: str, started: float, ended: float, **attrs):
+    """Add a span measured elsewhere (time.perf_counter() values) to the current trace."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.record(
+            (
+                next(trace._ids),
+                _parent.get(),
+                name,
+                started - trace.origin,
+                ended - trace.origin,
+                attrs or None,
+            )
+        )
+
+
+def record_token():
+    """Note that a request was granted a token from the global budget."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.token()
+
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack at a fixed interval into folded stacks.
+
+    The output (one "frame;frame;frame count" line per stack) can be fed to
+    flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str):
+        with open(path, "w") as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f"{stack} {count}\n")
+
+
+def _critical_path(spans: List[tuple]) -> Dict[str, float]:
+    """Time on the critical path of the root span, by span name.
+
+    Walking back from the end of a span, the child that finished last before
+    the current point is what the span was waiting on; time not covered by such
+    a child is the span's own.
+    """
+    children: Dict[int, List[tuple]] = {}
+    for item in spans:
+        children.setdefault(item[1], []).append(item)
+    roots = children.get(0)
+    if not roots:
+        return {}
+
+    path: Dict[str, float] = {}
+    stack = [max(roots, key=lambda item: item[4] - item[3])]
+    while stack:
+        span_id, _, name, start, end, _ = stack.pop()
+        point = end
+        for child in sorted(children.get(span_id, ()), key=lambda item: item[4], reverse=True):
+            if child[4] > point or child[4] <= start:
+                continue
+            path[name] = path.get(name, 0.0) + point - child[4]
+            stack.append(child)
+            point = max(child[3], start)
+        path[name] = path.get(name, 0.0) + max(point - start, 0.0)
+    return {name: round(seconds, 4) for name, seconds in sorted(path.items(), key=lambda x: -x[1])}
+
+
+def _idle_budget(trace: Trace, duration: float) -> dict:
+    """Where the global request budget went unused, given the rate at the start of the run."""
+    if not trace.rate:
+        return {}
+    spacing = 1 / trace.rate
+    stages = [item for item in trace.spans if item[2] in TRACE_STAGES]
+    edges = [0.0, *trace.tokens, duration]
+    gaps: List[Tuple[float, float]] = []
+    for previous, following in zip(edges, edges[1:]):
+        idle = following - previous - spacing
+        if idle > 0:
+            gaps.append((previous + spacing, idle))
+
+    by_activity: Dict[str, float] = {}
+    for start, idle in gaps:
+        end = start + idle
+        running = sorted({item[2] for item in stages if item[3] < end and item[4] > start})
+        key = "+".join(running) or "nothing"
+        by_activity[key] = by_activity.get(key, 0.0) + idle
+    idle_total = sum(idle for _, idle in gaps)
+    return {
+        "rate": trace.rate,
+        "tokens": len(trace.tokens),
+        "capacity": round(duration * trace.rate, 1),
+        "idle_seconds": round(idle_total, 3),
+        "idle_ratio": round(idle_total / duration, 4) if duration else 0.0,
+        # What the pipeline was doing while requests could have been sent
+        "idle_by_activity": {
+            key: round(value, 3)
+            for key, value in sorted(by_activity.items(), key=lambda x: -x[1])
+        },
+        "longest_gaps": [
+            {"at": round(start, 3), "seconds": round(idle, 3)}
+            for start, idle in sorted(gaps, key=lambda gap: -gap[1])[:10]
+        ],
+    }
+
+
+def summarize(trace: Trace) -> dict:
+    duration = time.perf_counter() - trace.origin
+    return {
+        "trace": trace.name,
+        "started_at": trace.started_at.isoformat(),
+        "duration": round(duration, 3),
+        "spans": sum(int(count) for count, _ in trace.totals.values()),
+        "dropped_spans": trace.dropped,
+        # Summed over concurrent spans, so these can exceed the duration
+        "totals": {
+            name: {"count": int(count), "seconds": round(seconds, 3)}
+            for name, (count, seconds) in sorted(trace.totals.items(), key=lambda x: -x[1][1])
+        },
+        "critical_path": _critical_path(trace.spans),
+        "rate_budget": _idle_budget(trace, duration),
+    }
+
+
+def _write(trace: Trace, summary: dict, profiler: Optional[SamplingProfiler]) -> str:
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    base = os.path.join(
+        TRACE_DIR, f"{trace.name}-{trace.started_at.strftime('%Y%m%dT%H%M%S')}"
+    )
+    with gzip.open(f"{base}.spans.jsonl.gz", "wt") as output:
+        for span_id, parent, name, start, end, attrs in trace.spans:
+            record = {"id": span_id, "parent": parent, "name": name, "start": round(start, 6), "end": round(end, 6)}
+            if attrs:
+                record["attrs"] = attrs
+            output.write(json.dumps(record) + "\n")
+    with open(f"{base}.summary.json", "w") as output:
+        json.dump(summary, output, indent=2)
+    if profiler is not None:
+        profiler.write(f"{base}.folded")
+
+    # Keep the newest TRACE_KEEP runs
+    runs = sorted(
+        {name.split(".")[0] for name in os.listdir(TRACE_DIR)},
+        key=lambda name: os.path.getmtime(
+            os.path.join(TRACE_DIR, f"{name}.summary.json")
+        )
+        if os.path.exists(os.path.join(TRACE_DIR, f"{name}.summary.json"))
+        else 0,
+    )
+    for stale in runs[:-TRACE_KEEP]:
+        for suffix in (".spans.jsonl.gz", ".summary.json", ".folded"):
+            path = os.path.join(TRACE_DIR, stale + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+    return base
+
+
+def _finish(trace: Trace, profiler: Optional[SamplingProfiler]) -> Tuple[dict, str]:
+    """Summarize a finished trace and write it; runs off the event loop."""
+    summary = summarize(trace)
+    return summary, _write(trace, summary, profiler)
+
+
+@asynccontextmanager
+async def trace_run(
+    name: str, rate: Optional[float] = None, profile: bool = False
+) -> AsyncIterator[Optional[Trace]]:
+    """
+    Trace everything awaited inside the block and write the spans and a summary afterwards.
+
+    Args:
+        name: Run name used for the files, e.g. "run-42".
+        rate: Requests per second of the global budget, to report where it sat idle.
+        profile: Also sample the event loop's stacks for this run.
+
+    Yields:
+        The trace, or None when tracing is disabled.
+    """
+    if not (TRACING_ENABLED or profile):
+        yield None
+        return
+
+    trace = Trace(name)
+    trace.rate = rate
+    profiler = SamplingProfiler(threading.get_ident()) if profile else None
+    if profiler is not None:
+        profiler.start()
+    token = _trace.set(trace)
+    try:
+        with span("sync"):
+            yield trace
+    finally:
+        _trace.reset(token)
+        if profiler is not None:
+            profiler.stop()
+        try:
+            # Up to TRACE_MAX_SPANS spans to analyze and write; keep the event loop
+            # (and the API) responsive
+            summary, base = await asyncio.shield(asyncio.to_thread(_finish, trace, profiler))
+        except Exception as e:
+            logger.error(f"Writing the trace of {name} failed: {e}")
+        else:
+            logger.info(
+                f"Trace of {name} written to {base}.*: critical path "
+                f"{summary['critical_path']}, idle request budget "
+                f"{summary['rate_budget'].get('idle_ratio', 'n/a')}."
+            )
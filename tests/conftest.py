@@ -0,0 +1,5 @@
+# Modules are imported the way the app runs them, from src
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
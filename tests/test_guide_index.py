@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+from schemas.epg import EpgChannelSchema, EpgProgramSchema
+from utils.guide_index import ChannelSchedule, GuideIndex
+
+T0 = datetime(2026, 10, 17, 20, 0, tzinfo=timezone.utc)
+
+
+def at(minutes: int) -> datetime:
+    return T0 + timedelta(minutes=minutes)
+
+
+def channel(meo_id: str, position: int = 0) -> EpgChannelSchema:
+    return EpgChannelSchema.model_construct(meo_id=meo_id, position=position)
+
+
+def schedule(meo_id: str, programs) -> ChannelSchedule:
+    """`programs` are (id, start minute, end minute) sorted by start."""
+    return ChannelSchedule(
+        channel(meo_id),
+        [(at(start), at(end), EpgProgramSchema.model_construct(id=pid)) for pid, start, end in programs],
+    )
+
+
+def ids(programs) -> list:
+    return [program.id if program is not None else None for program in programs]
+
+
+def test_window_returns_programs_overlapping_it():
+    rtp = schedule("RTP1", [("a", 0, 30), ("b", 30, 60), ("c", 60, 90)])
+    assert ids(rtp.window(at(0), at(30))) == ["a"]
+    assert ids(rtp.window(at(29), at(31))) == ["a", "b"]
+    assert ids(rtp.window(at(90), at(120))) == []
+    assert ids(rtp.window(at(-60), at(0))) == []
+
+
+def test_window_finds_long_program_overlapping_later_ones():
+    # "long" starts first and outlasts "short", so ends are not sorted
+    rtp = schedule("RTP1", [("long", 0, 120), ("short", 10, 20), ("next", 20, 40)])
+    assert ids(rtp.window(at(50), at(60))) == ["long"]
+    assert ids(rtp.window(at(15), at(25))) == ["long", "short", "next"]
+
+
+def test_now_next():
+    rtp = schedule("RTP1", [("a", 0, 30), ("b", 30, 60), ("c", 60, 90)])
+    assert ids(rtp.now_next(at(30))) == ["b", "c"]
+    assert ids(rtp.now_next(at(-5))) == [None, "a"]
+    assert ids(rtp.now_next(at(75))) == ["c", None]
+    assert ids(rtp.now_next(at(90))) == [None, None]
+
+
+def test_now_next_with_a_gap():
+    rtp = schedule("RTP1", [("a", 0, 30), ("b", 45, 60)])
+    assert ids(rtp.now_next(at(35))) == [None, "b"]
+
+
+def test_index_refuses_windows_before_its_coverage():
+    index = GuideIndex([schedule("RTP1", [("a", 0, 30)])], at(-60), 0)
+    assert index.window("RTP1", at(-90), at(0)) is None
+    assert index.now_next(at(-61)) is None
+    assert index.window("SIC", at(0), at(30)) is None
+    assert ids(index.window("RTP1", at(0), at(30))) == ["a"]
+
+
+def test_index_looks_programs_up_by_id():
+    index = GuideIndex(
+        [schedule("RTP1", [("a", 0, 30)]), schedule("SIC", [("b", 0, 60)])], at(-60), 0
+    )
+    assert index.program("b").id == "b"
+    assert index.program("missing") is None
+    assert [entry["channel"].meo_id for entry in index.now_next(at(10))] == ["RTP1", "SIC"]
+
+
+def test_replace_swaps_only_the_given_channels():
+    index = GuideIndex(
+        [schedule("RTP1", [("a", 0, 30)]), schedule("SIC", [("b", 0, 60)])], at(-60), 0
+    )
+    replaced = index.replace([schedule("SIC", [("c", 0, 30), ("d", 30, 60)])], 0)
+
+    assert [s.channel.meo_id for s in replaced.schedules] == ["RTP1", "SIC"]
+    assert replaced.program("b") is None
+    assert replaced.program("d").id == "d"
+    assert replaced.program("a").id == "a"
+    assert ids(replaced.window("SIC", at(0), at(60))) == ["c", "d"]
+    # The original index is left untouched for readers still holding it
+    assert index.program("b").id == "b"
+    assert ids(index.window("SIC", at(0), at(60))) == ["b"]
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Optional
+import pytest
+from fastapi import Depends, FastAPI, Query
+from fastapi.testclient import TestClient
+import api.public.http_cache as http_cache
+from api.public.http_cache import conditional_get
+from utils import generation
+from utils.generation import Generation
+
+LAST_SYNC = datetime(2026, 10, 17, 9, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(generation, "_current", Generation(7, LAST_SYNC))
+    app = FastAPI()
+
+    @app.get("/channels")
+    def channels(headers=Depends(conditional_get)):
+        return {"etag": headers["ETag"]}
+
+    @app.get("/now")
+    def now(at: Optional[datetime] = Query(None), headers=Depends(conditional_get)):
+        return {"etag": headers["ETag"]}
+
+    return TestClient(app)
+
+
+def test_response_carries_validators(client):
+    response = client.get("/channels")
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('"7-')
+    assert response.headers["Last-Modified"] == format_datetime(LAST_SYNC, usegmt=True)
+    assert "max-age" in response.headers["Cache-Control"]
+
+
+def test_matching_etag_is_not_modified(client):
+    etag = client.get("/channels").headers["ETag"]
+    response = client.get("/channels", headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+
+def test_etag_depends_on_the_query(client):
+    etag = client.get("/channels").headers["ETag"]
+    assert client.get("/channels?b=2&a=1").headers["ETag"] != etag
+    # Parameter order does not matter
+    assert client.get("/channels?a=1&b=2").headers["ETag"] == client.get(
+        "/channels?b=2&a=1"
+    ).headers["ETag"]
+
+
+def test_new_generation_invalidates_the_etag(client, monkeypatch):
+    etag = client.get("/channels").headers["ETag"]
+    monkeypatch.setattr(
+        generation, "_current", Generation(8, LAST_SYNC + timedelta(minutes=5))
+    )
+    response = client.get("/channels", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('"8-')
+
+
+def test_if_modified_since(client):
+    since = format_datetime(LAST_SYNC, usegmt=True)
+    assert client.get("/channels", headers={"If-Modified-Since": since}).status_code == 304
+    earlier = format_datetime(LAST_SYNC - timedelta(seconds=1), usegmt=True)
+    assert client.get("/channels", headers={"If-Modified-Since": earlier}).status_code == 200
+    assert client.get("/channels", headers={"If-Modified-Since": "garbage"}).status_code == 200
+
+
+def test_if_none_match_takes_precedence(client):
+    since = format_datetime(LAST_SYNC, usegmt=True)
+    response = client.get(
+        "/channels", headers={"If-None-Match": '"stale"', "If-Modified-Since": since}
+    )
+    assert response.status_code == 200
+
+
+def test_now_is_keyed_on_the_current_minute(client, monkeypatch):
+    minutes = iter([datetime(2026, 10, 17, 10, 0, 30), datetime(2026, 10, 17, 10, 1, 5)])
+
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return next(minutes).replace(tzinfo=tz)
+
+    monkeypatch.setattr(http_cache, "datetime", Clock)
+    first = client.get("/now")
+    second = client.get("/now", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert second.headers["ETag"] != first.headers["ETag"]
+    assert second.headers["Last-Modified"] == "Sat, 17 Oct 2026 10:01:00 GMT"
+
+    # An explicit time is not bucketed
+    at = client.get("/now?at=2026-10-17T12:00:00Z")
+    assert at.headers["Last-Modified"] == format_datetime(LAST_SYNC, usegmt=True)
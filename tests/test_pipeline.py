@@ -0,0 +1,55 @@
+import asyncio
+from jobs.pipeline import BatchTracker
+
+
+def channels(*meo_ids, listed=True):
+    return [
+        {"meo_id": meo_id, **({"seen_program_ids": set()} if listed else {})}
+        for meo_id in meo_ids
+    ]
+
+
+def tracker(batches):
+    checkpoints = []
+
+    async def checkpoint(meo_ids, stats):
+        checkpoints.append((meo_ids, stats["n"]))
+
+    return BatchTracker(batches, checkpoint), checkpoints
+
+
+def test_batch_is_checkpointed_once_all_its_channels_are_committed():
+    a, b = channels("A1", "A2"), channels("B1")
+    batches, checkpoints = tracker([a, b])
+
+    asyncio.run(batches.committed(a[:1], {"n": 1}))
+    assert checkpoints == []
+    asyncio.run(batches.committed(a[1:] + b, {"n": 2}))
+    assert checkpoints == [(["A1", "A2"], 2), (["B1"], 2)]
+    assert batches.failed_channels() == []
+
+
+def test_channel_without_guide_listing_fails_its_batch():
+    listed, missing = channels("A1"), channels("A2", listed=False)
+    other = channels("B1")
+    batches, checkpoints = tracker([listed + missing, other])
+
+    asyncio.run(batches.committed(listed + missing + other, {"n": 1}))
+    assert checkpoints == [(["B1"], 1)]
+    assert batches.failed_channels() == ["A1", "A2"]
+
+
+def test_channel_with_failed_details_fails_its_batch():
+    a, b = channels("A1", "A2"), channels("B1")
+    batches, checkpoints = tracker([a, b])
+
+    asyncio.run(batches.committed(a + b, {"n": 1}, incomplete={"B1"}))
+    assert checkpoints == [(["A1", "A2"], 1)]
+    assert batches.failed_channels() == ["B1"]
+
+
+def test_without_checkpoint_callback_only_failures_are_tracked():
+    a = channels("A1", listed=False)
+    batches = BatchTracker([a])
+    asyncio.run(batches.committed(a, {}))
+    assert batches.failed_channels() == ["A1"]
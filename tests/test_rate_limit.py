@@ -0,0 +1,78 @@
+import asyncio
+import time
+import pytest
+from utils.rate_limit import BACKOFF_FACTOR, PROBE_AFTER, TokenBucket
+
+
+def test_try_acquire_takes_the_burst_then_reports_the_wait():
+    bucket = TokenBucket(rate=2, per=1.0, capacity=2)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == pytest.approx(0.5, abs=0.05)
+    assert bucket.acquired == 2
+
+
+def test_try_acquire_waits_for_retry_after():
+    bucket = TokenBucket(rate=10, per=1.0)
+    bucket.record_response(429, retry_after=30)
+    assert bucket.try_acquire() == pytest.approx(30, abs=0.5)
+
+
+def test_overload_halves_the_rate_down_to_min_rate():
+    bucket = TokenBucket(rate=8, per=1.0, min_rate=1, max_rate=8)
+    expected = 8
+    for status in (429, 503, 500, 429):
+        bucket.record_response(status)
+        expected = max(1, expected * BACKOFF_FACTOR)
+        assert bucket.rate == expected
+    assert bucket.rate == 1
+    assert bucket.backoffs == 4
+    # Any accumulated burst is dropped
+    assert bucket.tokens <= 0
+
+
+def test_healthy_streak_probes_up_to_max_rate():
+    bucket = TokenBucket(rate=8, per=1.0, min_rate=1, max_rate=8)
+    bucket.record_response(429)
+    assert bucket.rate == 4
+    for _ in range(PROBE_AFTER - 1):
+        bucket.record_response(200)
+    assert bucket.rate == 4
+    bucket.record_response(200)
+    assert bucket.rate == pytest.approx(4.8)
+    for _ in range(PROBE_AFTER * 10):
+        bucket.record_response(200)
+    assert bucket.rate == 8
+
+
+def test_client_errors_do_not_adapt_the_rate():
+    bucket = TokenBucket(rate=8, per=1.0, min_rate=1, max_rate=16)
+    for _ in range(PROBE_AFTER):
+        bucket.record_response(404)
+    assert bucket.rate == 8
+    assert bucket.backoffs == bucket.probes == 0
+
+
+def test_error_resets_the_healthy_streak():
+    bucket = TokenBucket(rate=4, per=1.0, min_rate=1, max_rate=8)
+    for _ in range(PROBE_AFTER - 1):
+        bucket.record_response(200)
+    bucket.record_response(500)
+    bucket.record_response(200)
+    assert bucket.rate == 2
+    assert bucket.probes == 0
+
+
+def test_acquire_paces_requests_at_the_rate():
+    async def run():
+        bucket = TokenBucket(rate=50, per=1.0, capacity=1, name="test")
+        started = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(6)))
+        return time.monotonic() - started, bucket
+
+    elapsed, bucket = asyncio.run(run())
+    # The first token is there already, the other five arrive every 20 ms
+    assert elapsed >= 0.09
+    assert bucket.acquired == 6
+    # Served one at a time, the others queue on the lock
+    assert bucket.max_waiting == 5
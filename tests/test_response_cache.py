@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from api.public.response_cache import ResponseCache
+from utils import generation
+from utils.generation import Generation
+
+
+def set_generation(monkeypatch, number: int):
+    monkeypatch.setattr(
+        generation, "_current", Generation(number, datetime.now(timezone.utc))
+    )
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    set_generation(monkeypatch, 1)
+    return ResponseCache(max_entries=10, max_bytes=1000)
+
+
+def builder(body: bytes = b"body", delay: float = 0):
+    calls = []
+
+    async def build():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return body
+
+    return build, calls
+
+
+def test_hit_after_miss(cache):
+    build, calls = builder()
+    assert asyncio.run(cache.get_or_build("/a", build)) == b"body"
+    assert asyncio.run(cache.get_or_build("/a", build)) == b"body"
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_concurrent_misses_build_once(cache):
+    build, calls = builder(delay=0.01)
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_build("/a", build) for _ in range(5)))
+
+    assert asyncio.run(run()) == [b"body"] * 5
+    assert len(calls) == 1
+    assert cache.coalesced == 4
+
+
+def test_failed_build_is_shared_and_not_cached(cache):
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def run():
+        return await asyncio.gather(
+            *(cache.get_or_build("/a", fail) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache.stats()["entries"] == 0
+
+
+def test_new_generation_drops_every_entry(cache, monkeypatch):
+    build, calls = builder()
+    asyncio.run(cache.get_or_build("/a", build))
+    asyncio.run(cache.get_or_build("/b", build))
+    set_generation(monkeypatch, 2)
+    asyncio.run(cache.get_or_build("/a", build))
+    assert len(calls) == 3
+    assert cache.invalidations == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_body_built_across_a_generation_change_is_not_stored(cache, monkeypatch):
+    async def build():
+        set_generation(monkeypatch, 2)
+        return b"old"
+
+    assert asyncio.run(cache.get_or_build("/a", build)) == b"old"
+    assert cache.stats()["entries"] == 0
+
+
+def test_evicts_least_recently_used_within_limits(monkeypatch):
+    set_generation(monkeypatch, 1)
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    for key in ("/a", "/b"):
+        asyncio.run(cache.get_or_build(key, builder(b"1234")[0]))
+    # Touch /a so /b is the least recently used
+    asyncio.run(cache.get_or_build("/a", builder()[0]))
+    asyncio.run(cache.get_or_build("/c", builder(b"1234")[0]))
+    assert list(cache._entries) == ["/a", "/c"]
+    # Bodies over max_bytes are served but never stored
+    asyncio.run(cache.get_or_build("/big", builder(b"x" * 11)[0]))
+    assert "/big" not in cache._entries
+    assert cache.size <= 10
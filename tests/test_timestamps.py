@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+import pytest
+from utils.timestamps import local_to_utc, program_times
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_summer_time_program():
+    assert program_times("17-10-2026", "20:00", "21:00") == (
+        utc(2026, 10, 17, 19, 0),
+        utc(2026, 10, 17, 20, 0),
+    )
+
+
+def test_winter_time_program():
+    assert program_times("4-3-2025", "22:43", "23:10") == (
+        utc(2025, 3, 4, 22, 43),
+        utc(2025, 3, 4, 23, 10),
+    )
+
+
+def test_program_spanning_midnight_ends_next_day():
+    assert program_times("17-10-2026", "23:30", "00:30") == (
+        utc(2026, 10, 17, 22, 30),
+        utc(2026, 10, 17, 23, 30),
+    )
+
+
+def test_spring_forward_shortens_the_wall_clock_hour():
+    # 29 March 2026: 01:00 WET jumps to 02:00 WEST
+    start, end = program_times("29-3-2026", "00:30", "02:30")
+    assert start == utc(2026, 3, 29, 0, 30)
+    assert end == utc(2026, 3, 29, 1, 30)
+
+
+def test_end_inside_spring_forward_gap_moves_forward():
+    start, end = program_times("29-3-2026", "00:30", "01:30")
+    assert start == utc(2026, 3, 29, 0, 30)
+    assert end == utc(2026, 3, 29, 1, 30)
+
+
+def test_fall_back_ends_at_first_occurrence():
+    # 25 October 2026: 02:00 WEST falls back to 01:00 WET, 01:xx happens twice
+    start, end = program_times("25-10-2026", "00:30", "01:30")
+    assert start == utc(2026, 10, 24, 23, 30)
+    assert end == utc(2026, 10, 25, 0, 30)
+
+
+def test_fall_back_fold_end_before_start_on_the_wall_clock():
+    # Starts in the first 01:45 and ends in the repeated 01:15, the same day
+    start, end = program_times("25-10-2026", "01:45", "01:15")
+    assert start == utc(2026, 10, 25, 0, 45)
+    assert end == utc(2026, 10, 25, 1, 15)
+
+
+def test_ambiguous_local_time_resolves_to_first_occurrence():
+    assert local_to_utc(datetime(2026, 10, 25, 1, 30)) == utc(2026, 10, 25, 0, 30)
+
+
+def test_zero_length_program():
+    start, end = program_times("17-10-2026", "20:00", "20:00")
+    assert start == end
+
+
+@pytest.mark.parametrize(
+    "date_str, start, end",
+    [("2026-10-17", "20:00", "21:00"), ("17-10-2026", "20h", "21:00"), ("", "20:00", "21:00")],
+)
+def test_malformed_values_raise(date_str, start, end):
+    with pytest.raises(ValueError):
+        program_times(date_str, start, end)